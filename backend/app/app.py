@@ -1,14 +1,24 @@
+import asyncio
+import contextlib
 import logging
 from fastapi import FastAPI, APIRouter, Depends, HTTPException, Header, status, Body, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import uuid
 import json
 from typing import List
+import os
+import threading
 
 from object_relation_db.database import DataBase
+from object_relation_db.dialog_writer import DialogHistoryWriter
+from object_relation_db.export import FORMATS as EXPORT_FORMATS, export_dialog_history
+from object_relation_db.rollups import RollupRefresher
+from rag.document_pipeline import DocumentPipeline
+from core.kb_generation import KnowledgeBaseGeneration
 from fastapi.middleware.cors import CORSMiddleware
 
 class ConversationSummary(BaseModel):
@@ -61,7 +71,9 @@ class Document(BaseModel):
     size: int
     uploaded_at: datetime
     status: str = "processed"
-    content_type: str
+    content_type: Optional[str] = None
+    chunks: Optional[int] = None
+    error: Optional[str] = None
 
 class SearchQuery(BaseModel):
     query: str
@@ -92,10 +104,19 @@ class HealthResponse(BaseModel):
     documents_count: int
     last_indexed: datetime
 
-class AnalyticsQuery(BaseModel):
-    query: str
-    timestamp: datetime
-    response_time: float
+class AnalyticsBucket(BaseModel):
+    bucket: datetime
+    course_id: Optional[str] = None
+    model_used: Optional[str] = None
+    request_count: int
+    success_count: int
+    success_rate: float
+    latency_avg_ms: Optional[float] = None
+    latency_p50_ms: Optional[float] = None
+    latency_p95_ms: Optional[float] = None
+    latency_p99_ms: Optional[float] = None
+    tokens_used: int = 0
+    cost_estimated: float = 0.0
 
 # Mock данные
 mock_users_db = {
@@ -121,35 +142,7 @@ mock_users_db = {
     }
 }
 
-mock_documents_db = [
-    {
-        "id": "doc_001",
-        "filename": "Введение в машинное обучение.pdf",
-        "size": 2048000,
-        "uploaded_at": datetime.now() - timedelta(days=10),
-        "status": "processed",
-        "content_type": "application/pdf"
-    },
-    {
-        "id": "doc_002",
-        "filename": "Нейронные сети для начинающих.txt",
-        "size": 512000,
-        "uploaded_at": datetime.now() - timedelta(days=5),
-        "status": "processed",
-        "content_type": "text/plain"
-    },
-    {
-        "id": "doc_003",
-        "filename": "Python для анализа данных.docx",
-        "size": 4096000,
-        "uploaded_at": datetime.now() - timedelta(days=2),
-        "status": "processing",
-        "content_type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    }
-]
-
 mock_conversations = {}
-mock_analytics = []
 
 tags_metadata = [
     {
@@ -192,6 +185,106 @@ app.add_middleware(
 
 db = DataBase()
 
+# Отложенная пакетная запись истории диалогов
+dialog_writer = DialogHistoryWriter(
+    db,
+    batch_size=int(os.getenv("DIALOG_WRITER_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("DIALOG_WRITER_FLUSH_INTERVAL", "1.0")),
+    spill_path=os.getenv("DIALOG_WRITER_SPILL_PATH", "dialog_history_spill.jsonl"),
+)
+
+# Фоновый пересчет агрегатов аналитики
+rollup_refresher = RollupRefresher(db, interval=float(os.getenv("ROLLUP_REFRESH_INTERVAL", "60")))
+
+# Загруженные документы: извлечение текста, чанки и эмбеддинги в пуле процессов
+document_pipeline = DocumentPipeline(
+    upload_dir=os.getenv("DOCUMENT_UPLOAD_DIR", "uploads"),
+    collection_name=os.getenv("QDRANT_COLLECTION", "test_db1"),
+    max_workers=int(os.getenv("DOCUMENT_WORKERS", "1")),
+)
+
+# Счетчик изменений базы знаний, общий для воркеров gunicorn: воркер, изменивший
+# коллекцию, увеличивает его, остальные сбрасывают свои кэши (см. watch_knowledge_base)
+kb_generation = KnowledgeBaseGeneration(os.getenv("KB_GENERATION_PATH", "kb_generation.json"))
+document_pipeline.on_change = lambda document_id: _knowledge_base_changed("document", document_id=document_id)
+
+# Диалоговый агент (Qdrant + энкодер + GigaChat) создается при первом запросе к чату
+# или заранее - при старте (APP_EAGER_INIT), зависимости берутся из AppContext
+_dialog_agent = None
+_dialog_agent_lock = threading.Lock()
+
+def get_dialog_agent():
+    """Агент с общим семантическим кэшем ответов; тяжелые модели грузятся один раз"""
+    global _dialog_agent
+    with _dialog_agent_lock:
+        if _dialog_agent is None:
+            from core.agent import DialogAgent
+            from core.app_contex import AppContext
+            _dialog_agent = DialogAgent(
+                AppContext.GigaChatClient,
+                AppContext.QdrantManager,
+                AppContext.Rag,
+                answer_cache=AppContext.AnswerCache,
+            )
+        return _dialog_agent
+
+# Гибридный поиск (Qdrant + BM25) для /rag/search; индекс BM25 строится в фоне
+_hybrid_retriever = None
+
+def get_hybrid_retriever():
+    """Общий гибридный поиск; загрузки документов и переиндексация обновляют его индекс BM25"""
+    global _hybrid_retriever
+    with _dialog_agent_lock:
+        if _hybrid_retriever is None:
+            from core.app_contex import AppContext
+            _hybrid_retriever = AppContext.HybridRetriever
+            document_pipeline.lexical_index = _hybrid_retriever.bm25
+            _hybrid_retriever.ensure_index()
+        return _hybrid_retriever
+
+@app.on_event("startup")
+async def on_startup():
+    """Открываем пул соединений с PostgreSQL и запускаем запись истории"""
+    await asyncio.to_thread(db.open_pool)
+    await asyncio.to_thread(db.ensure_schema)
+    # Первый запуск с проекцией бесед - заполняем ее по существующей истории
+    await asyncio.to_thread(db.backfill_conversation_summaries, only_if_empty=True)
+    await asyncio.to_thread(db.mark_all_rollups_dirty, only_if_empty=True)
+    dialog_writer.start()
+    rollup_refresher.start()
+    document_pipeline.start()
+    global _kb_watch_task
+    _kb_watch_task = asyncio.create_task(watch_knowledge_base(float(os.getenv("KB_SYNC_INTERVAL", "2"))))
+    if os.getenv("APP_EAGER_INIT", "true").lower() == "true":
+        # Модели и подключения поднимаются в фоне: сервер принимает запросы сразу,
+        # готовность видна в /rag/ready
+        global _services_task
+        _services_task = asyncio.create_task(_start_services())
+
+_services_task = None
+_kb_watch_task = None
+
+async def _start_services():
+    from core.app_contex import AppContext
+    warm_up = os.getenv("APP_WARM_UP", "true").lower() == "true"
+    readiness = await asyncio.to_thread(AppContext.start, warm_up)
+    try:
+        await asyncio.to_thread(get_hybrid_retriever)
+        await asyncio.to_thread(get_dialog_agent)
+    except Exception as e:
+        logger.error(f"Не удалось подготовить поиск и агента: {e}")
+    logger.info(f"Зависимости: ready={readiness['ready']}, degraded={readiness['degraded']}")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Дописываем очередь истории и закрываем пул соединений с PostgreSQL"""
+    if _kb_watch_task is not None:
+        _kb_watch_task.cancel()
+    await document_pipeline.stop()
+    await asyncio.to_thread(dialog_writer.stop)
+    await asyncio.to_thread(rollup_refresher.stop)
+    await asyncio.to_thread(db.close_pool)
+
 # Генерация токенов (мок)
 def create_access_token(user_id: uuid.UUID) -> str:
     """
@@ -317,41 +410,21 @@ async def auth_reset_password_confirm(confirm_data: ResetPasswordConfirm):
 
 @app.post("/rag/documents/upload", response_model=Document, tags=["Documents"])
 async def rag_documents_upload(file: UploadFile = File(...)):
-    """Загрузка документа"""
-    document_id = f"doc_{uuid.uuid4().hex[:8]}"
-    document = {
-        "id": document_id,
-        "filename": file.filename,
-        "size": 0,  # В реальности нужно получить размер
-        "uploaded_at": datetime.now(),
-        "status": "processing",
-        "content_type": file.content_type
-    }
-    
-    mock_documents_db.append(document)
-    
-    # Имитация обработки
-    import asyncio
-    await asyncio.sleep(1)
-    
-    document["status"] = "processed"
+    """
+    Загрузка документа.
+
+    Файл сохраняется на диск, обработка (текст, чанки, эмбеддинги)
+    идет в фоне: ответ приходит сразу со статусом processing.
+    """
+    document = await document_pipeline.upload(file)
     return Document(**document)
 
 @app.post("/rag/documents/upload-batch", response_model=List[Document], tags=["Documents"])
 async def rag_documents_upload_batch(files: List[UploadFile] = File(...)):
-    """Пакетная загрузка документов"""
+    """Пакетная загрузка документов (обрабатываются параллельно, не больше DOCUMENT_WORKERS сразу)"""
     documents = []
     for file in files:
-        document_id = f"doc_{uuid.uuid4().hex[:8]}"
-        document = {
-            "id": document_id,
-            "filename": file.filename,
-            "size": 0,
-            "uploaded_at": datetime.now(),
-            "status": "processing",
-            "content_type": file.content_type
-        }
-        mock_documents_db.append(document)
+        document = await document_pipeline.upload(file)
         documents.append(Document(**document))
     
     return documents
@@ -359,14 +432,14 @@ async def rag_documents_upload_batch(files: List[UploadFile] = File(...)):
 @app.get("/rag/documents", response_model=List[Document], tags=["Documents"])
 async def rag_documents_get():
     """Получение списка документов"""
-    return [Document(**doc) for doc in mock_documents_db]
+    return [Document(**doc) for doc in document_pipeline.list()]
 
 @app.get("/rag/documents/{document_id}", response_model=Document, tags=["Documents"])
 async def rag_documents_get_by_id(document_id: str):
     """Получение информации о документе"""
-    for doc in mock_documents_db:
-        if doc["id"] == document_id:
-            return Document(**doc)
+    doc = document_pipeline.get(document_id)
+    if doc is not None:
+        return Document(**doc)
     
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
@@ -375,12 +448,8 @@ async def rag_documents_get_by_id(document_id: str):
 
 @app.delete("/rag/documents/{document_id}", tags=["Documents"])
 async def rag_documents_delete(document_id: str):
-    """Удаление документа"""
-    global mock_documents_db
-    initial_length = len(mock_documents_db)
-    mock_documents_db = [doc for doc in mock_documents_db if doc["id"] != document_id]
-    
-    if len(mock_documents_db) == initial_length:
+    """Удаление документа (вместе с его чанками в Qdrant)"""
+    if not await document_pipeline.delete(document_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Документ не найден"
@@ -391,60 +460,62 @@ async def rag_documents_delete(document_id: str):
 # ========== RAG - ПОИСК ==========
 
 @app.post("/rag/search", response_model=List[SearchResult], tags=["Search"])
-async def rag_search(search_query: SearchQuery):
-    """Поиск по документам"""
-    query_lower = search_query.query.lower()
-    
-    # Мок результаты поиска
+async def rag_search(search_query: SearchQuery, response: Response):
+    """
+    Гибридный поиск по базе знаний и документам.
+
+    Векторный поиск в Qdrant и BM25 выполняются параллельно, результаты
+    сливаются по рангам (RRF). threshold - минимальная косинусная близость
+    для векторных кандидатов. Задержка каждого поиска - в заголовке Server-Timing.
+    """
+    try:
+        retriever = await asyncio.to_thread(get_hybrid_retriever)
+    except Exception as e:
+        logger.error(f"Не удалось инициализировать поиск: {e}")
+        raise HTTPException(status_code=503, detail="Сервис поиска недоступен")
+
+    limit = max(1, min(search_query.limit or 10, 100))
+    found = await asyncio.to_thread(retriever.search, search_query.query, limit, search_query.threshold)
+    if len(found["errors"]) == 2:
+        raise HTTPException(status_code=503, detail="Сервис поиска временно недоступен")
+
+    response.headers["Server-Timing"] = ", ".join(
+        f"{name};dur={value}" for name, value in found["latency_ms"].items()
+    )
+
     results = []
-    if "машинное обучение" in query_lower:
-        results.append({
-            "id": "res_001",
-            "document_id": "doc_001",
-            "content": "Машинное обучение — это подраздел искусственного интеллекта, который использует алгоритмы для анализа данных и обучения на их основе.",
-            "score": 0.95,
-            "metadata": {"page": 1, "section": "Введение"}
-        })
-    
-    if "нейронные сети" in query_lower:
-        results.append({
-            "id": "res_002",
-            "document_id": "doc_002",
-            "content": "Нейронные сети состоят из слоев взаимосвязанных узлов (нейронов), которые обрабатывают информацию.",
-            "score": 0.88,
-            "metadata": {"page": 3, "section": "Архитектура"}
-        })
-    
-    if "python" in query_lower or "анализ данных" in query_lower:
+    for hit in found["results"]:
+        payload = hit["payload"]
         results.append({
-            "id": "res_003",
-            "document_id": "doc_003",
-            "content": "Python является популярным языком программирования для анализа данных благодаря библиотекам Pandas и NumPy.",
-            "score": 0.82,
-            "metadata": {"page": 2, "section": "Библиотеки"}
-        })
-    
-    # Если нет конкретных совпадений, возвращаем общие результаты
-    if not results:
-        results = [
-            {
-                "id": "res_default_1",
-                "document_id": "doc_001",
-                "content": "Машинное обучение включает в себя различные методы: обучение с учителем, без учителя и с подкреплением.",
-                "score": 0.75,
-                "metadata": {"page": 2, "section": "Методы"}
+            "id": hit["id"],
+            "document_id": str(payload.get("document_id") or payload.get("source") or ""),
+            "content": hit["text"],
+            "score": round(hit["score"], 6),
+            "metadata": {
+                "source": payload.get("source"),
+                "chunk_index": payload.get("chunk_index"),
+                "dense_rank": hit["dense_rank"],
+                "dense_score": hit["dense_score"],
+                "bm25_rank": hit["bm25_rank"],
+                "bm25_score": hit["bm25_score"],
             },
-            {
-                "id": "res_default_2",
-                "document_id": "doc_002",
-                "content": "Глубокое обучение — это подраздел машинного обучения, использующий глубокие нейронные сети.",
-                "score": 0.70,
-                "metadata": {"page": 4, "section": "Глубокое обучение"}
-            }
-        ]
-    
-    # Лимитируем результаты
-    return results[:search_query.limit]
+        })
+    return results
+
+@app.get("/rag/search/stats", tags=["Search"])
+async def rag_search_stats():
+    """Задержки векторного поиска, BM25 и слияния; состояние индекса BM25 и резервного индекса"""
+    if _hybrid_retriever is None:
+        return {"initialized": False}
+    qdrant_manager = _hybrid_retriever.qdrant_manager
+    return {
+        "initialized": True,
+        **_hybrid_retriever.stats(),
+        "qdrant_connection": qdrant_manager.connection_stats(),
+        "fallback_index": qdrant_manager.fallback_index.stats(),
+        "reranker": qdrant_manager.reranker.stats() if qdrant_manager.reranker is not None else None,
+        "context_packer": qdrant_manager.context_packer.stats() if qdrant_manager.context_packer is not None else None,
+    }
 
 @app.get("/rag/search/suggestions", tags=["Search"])
 async def rag_search_suggestions(query: str):
@@ -515,9 +586,8 @@ async def rag_chat(chat_message: ChatMessage,
     # Получаем User-Agent из заголовков
     user_agent = request.headers.get("user-agent", "Unknown")
 
-    # Исправленный вызов с правильными типами данных
-    # Исправленный вызов
-    result = db.add_dialog_history(
+    # Запись в историю идет в фоне пачками, ответ пользователю не ждет INSERT
+    dialog_writer.submit(dict(
         dialog_id=dialog_id,
         student_id=user_id,
         course_id=None,
@@ -537,7 +607,7 @@ async def rag_chat(chat_message: ChatMessage,
         is_successful=True,
         user_agent=user_agent,  # Реальный User-Agent
         ip_address=client_ip     # Реальный IP-адрес клиента
-    )
+    ))
     
     return {
         "response": response_text,
@@ -548,12 +618,88 @@ async def rag_chat(chat_message: ChatMessage,
 
 logger = logging.getLogger(__name__)
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Одно событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/rag/chat/stream", tags=["Chat"])
+async def rag_chat_stream(chat_message: ChatMessage,
+                          request: Request,
+                          authorization: Optional[str] = Header(None)):
+    """
+    Чат с ИИ с потоковой выдачей ответа (Server-Sent Events).
+
+    События: meta (dialog_id, conversation_id), token (кусок ответа),
+    done (время до первого токена и полное время). Полный ответ пишется
+    в историю после окончания потока, в том числе если клиент отключился.
+    """
+    try:
+        agent = await asyncio.to_thread(get_dialog_agent)
+    except Exception as e:
+        logger.error(f"Не удалось инициализировать диалогового агента: {e}")
+        raise HTTPException(status_code=503, detail="Сервис генерации ответов недоступен")
+
+    dialog_id = str(uuid.uuid4())
+    conversation_id = chat_message.conversation_id or str(uuid.uuid4())
+    client_ip = request.client.host if request.client else "127.0.0.1"
+    user_agent = request.headers.get("user-agent", "Unknown")
+
+    stream = agent.say_stream(chat_message.message)
+
+    async def events():
+        finished = False
+        try:
+            yield _sse_event("meta", {"dialog_id": dialog_id, "conversation_id": conversation_id})
+            # При отключении клиента поток ответа закрывается сразу, а не при сборке
+            # мусора: к записи в историю total_ms уже посчитан
+            async with contextlib.aclosing(stream.__aiter__()) as tokens:
+                async for token in tokens:
+                    yield _sse_event("token", {"text": token})
+            finished = True
+            yield _sse_event("done", {
+                "first_token_ms": stream.first_token_ms,
+                "response_time_ms": stream.total_ms,
+                "from_cache": stream.from_cache,
+                "is_successful": stream.is_successful,
+            })
+        finally:
+            error_message = stream.error or (None if finished else "Клиент отключился до конца ответа")
+            dialog_writer.submit(dict(
+                dialog_id=dialog_id,
+                student_id=chat_message.user_id,
+                course_id=None,
+                session_id=conversation_id,
+                question=chat_message.message,
+                answer=stream.answer,
+                response_time_ms=stream.total_ms,
+                first_token_ms=stream.first_token_ms,
+                context_used=stream.context,
+                model_used="GigaChat (cache)" if stream.from_cache else "GigaChat",
+                is_successful=error_message is None,
+                error_message=error_message,
+                user_agent=user_agent,
+                ip_address=client_ip,
+            ))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/rag/chat/{conversation_id}/history", tags=["Chat"])
 async def rag_chat_history(
     conversation_id: str,
     authorization: str = Header(..., description="Bearer токен"),
+    limit: int = 50,
+    cursor: Optional[str] = None,
 ):
-    """Получение истории конкретной беседы из PostgreSQL"""
+    """
+    Получение истории конкретной беседы из PostgreSQL.
+
+    Без cursor возвращаются последние limit сообщений. Для подгрузки более
+    старых сообщений передайте next_cursor, более новых - prev_cursor.
+    """
     try:
         logger.info(f"Запрос истории для conversation_id: {conversation_id}")
         
@@ -576,11 +722,22 @@ async def rag_chat_history(
         
         logger.info(f"User ID: {user_id}, запрашивает беседу: {conversation_id}")
         
-        # Получаем сообщения беседы из БД
-        messages = db.get_conversation_messages(
-            session_id=conversation_id,
-            student_id=user_id
-        )
+        limit = max(1, min(limit, 200))
+
+        # Получаем страницу сообщений беседы из БД
+        try:
+            page = await db.get_conversation_messages_async(
+                session_id=conversation_id,
+                student_id=user_id,
+                limit=limit,
+                cursor=cursor
+            )
+        except ValueError:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid cursor"
+            )
+        messages = page["items"]
         
         logger.info(f"Найдено сообщений: {len(messages)}")
         
@@ -590,7 +747,9 @@ async def rag_chat_history(
                 "conversation_id": conversation_id,
                 "conversation_name": f"Беседа {conversation_id[:8]}",
                 "message_count": 0,
-                "messages": []
+                "messages": [],
+                "next_cursor": None,
+                "prev_cursor": None
             }
         
         # Формируем ответ в формате для фронтенда
@@ -621,7 +780,9 @@ async def rag_chat_history(
             "conversation_id": conversation_id,
             "conversation_name": f"Беседа {conversation_id[:8]}",
             "message_count": len(formatted_messages),
-            "messages": formatted_messages
+            "messages": formatted_messages,
+            "next_cursor": page["next_cursor"],
+            "prev_cursor": page["prev_cursor"]
         }
         
         logger.info(f"Отправляем ответ с {len(formatted_messages)} сообщениями")
@@ -653,7 +814,7 @@ async def rag_conversations_list(user_token: str):
         )
     
     # Получаем беседы из БД
-    conversations = db.get_conversations_summary(
+    conversations = await db.get_conversations_summary_async(
         student_id=user_id,
         limit=50
     )
@@ -717,43 +878,234 @@ async def rag_status():
     return {
         "status": "healthy",
         "version": "1.0.0",
-        "documents_count": len(mock_documents_db),
+        "documents_count": len(document_pipeline.list()),
         "last_indexed": datetime.now() - timedelta(hours=1)
     }
 
+# Загрузчик базы знаний для инкрементальной переиндексации (модель грузится при первом вызове)
+_knowledge_loader = None
+_reindex_lock = threading.Lock()
+
+def run_reindex() -> Dict[str, int]:
+    """Инкрементальная переиндексация базы знаний; параллельные запуски не допускаются"""
+    global _knowledge_loader
+    if not _reindex_lock.acquire(blocking=False):
+        raise RuntimeError("Переиндексация уже выполняется")
+    try:
+        if _knowledge_loader is None:
+            from vector_db.qdrant_loader import QdrantLoader
+            _knowledge_loader = QdrantLoader(
+                collection_name=os.getenv("QDRANT_COLLECTION", "test_db1"),
+                import_data_name=os.getenv("KNOWLEDGE_BASE_PATH", "KnowlengeBase.xlsx"),
+                key_column=os.getenv("KNOWLEDGE_BASE_KEY_COLUMN") or None,
+            )
+        _knowledge_loader.lexical_index = _hybrid_retriever.bm25 if _hybrid_retriever is not None else None
+        stats = _knowledge_loader.reindex()
+
+        if stats["added"] or stats["updated"] or stats["deleted"]:
+            _knowledge_base_changed("reindex", texts_changed=bool(stats["updated"]))
+        return stats
+    finally:
+        _reindex_lock.release()
+
+def invalidate_knowledge_caches(texts_changed: bool = False):
+    """Сбросить кэши этого воркера, построенные по старой версии базы знаний"""
+    # Ответы, собранные по старой версии базы знаний, больше не годятся
+    if _dialog_agent is not None and _dialog_agent.answer_cache is not None:
+        _dialog_agent.answer_cache.invalidate()
+    if texts_changed and _dialog_agent is not None and _dialog_agent.qdrant_manager.reranker is not None:
+        # Оценки кросс-энкодера привязаны к ID чанков, а тексты изменились
+        _dialog_agent.qdrant_manager.reranker.clear()
+
+def _knowledge_base_changed(reason: str, texts_changed: bool = False, **details):
+    """Этот воркер изменил базу знаний: сбросить свои кэши и сообщить остальным"""
+    invalidate_knowledge_caches(texts_changed)
+    kb_generation.bump(reason, texts_changed=texts_changed, **details)
+
+async def watch_knowledge_base(interval: float):
+    """
+    Следить за изменениями базы знаний из других воркеров: сбросить кэш ответов,
+    кэш реранкера (если менялись тексты) и перестроить BM25
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            change = await asyncio.to_thread(kb_generation.poll)
+            if change is None:
+                continue
+            logger.info(f"База знаний изменена процессом {change['pid']} ({change['reason']}), сброс кэшей")
+            invalidate_knowledge_caches(change.get("texts_changed", True))
+            if _hybrid_retriever is not None:
+                await asyncio.to_thread(_hybrid_retriever.invalidate)
+        except Exception as e:
+            logger.error(f"Ошибка проверки изменений базы знаний: {e}")
+
 @app.post("/rag/reindex", tags=["System"])
 async def rag_reindex():
-    """Переиндексация документов"""
-    return {"message": "Переиндексация запущена", "estimated_time": "5 минут"}
+    """
+    Инкрементальная переиндексация базы знаний.
+
+    Кодируются и записываются только новые и измененные строки,
+    точки удаленных строк удаляются. Возвращает счетчики
+    added / updated / skipped / deleted.
+    """
+    try:
+        stats = await asyncio.to_thread(run_reindex)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Файл базы знаний не найден: {e.filename}")
+    except Exception as e:
+        logger.error(f"Ошибка переиндексации: {e}")
+        raise HTTPException(status_code=503, detail="Не удалось выполнить переиндексацию")
+
+    return {"message": "Переиндексация завершена", **stats}
+
+@app.get("/rag/db/pool", tags=["System"])
+async def rag_db_pool():
+    """Метрики пула соединений PostgreSQL, подготовленных запросов и записи истории"""
+    return {
+        "pool": db.pool_metrics(),
+        "queries": db.query_stats(),
+        "dialog_writer": dialog_writer.stats()
+    }
+
+@app.get("/rag/export/dialogs", tags=["System"])
+async def rag_export_dialogs(
+    format: str = "ndjson",
+    student_id: Optional[str] = None,
+    course_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    batch_size: int = 1000,
+):
+    """
+    Потоковая выгрузка истории диалогов (ndjson, csv, parquet).
+
+    Строки читаются из PostgreSQL серверным курсором пачками и сразу
+    отправляются клиенту, память не растет с размером таблицы.
+    """
+    for value in (student_id, course_id):
+        if value and not DataBase._is_valid_uuid(value):
+            raise HTTPException(status_code=400, detail=f"Некорректный UUID: {value}")
+
+    try:
+        chunks = export_dialog_history(
+            db,
+            format,
+            batch_size=max(1, min(batch_size, 10000)),
+            student_id=student_id,
+            course_id=course_id,
+            date_from=date_from,
+            date_to=date_to,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filename = f"dialog_history_{datetime.now():%Y%m%d_%H%M%S}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/rag/ready", tags=["System"])
+async def rag_ready():
+    """
+    Готовность зависимостей (Qdrant и энкодер, GigaChat, кэш ответов, поиск):
+    состояние, время инициализации и прогрева. 503, пока не все готовы.
+    """
+    from core.app_contex import AppContext
+    readiness = AppContext.readiness()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/rag/memory", tags=["System"])
+async def rag_memory():
+    """
+    Память процесса-воркера (RSS / PSS / общая с главным процессом) и
+    загруженные модели: размер весов, время загрузки, предзагружена ли
+    модель до fork. document_workers - процессы пула обработки документов,
+    у каждого своя копия энкодера
+    """
+    from vector_db.model_registry import memory_report
+    return {**memory_report(), "document_workers": document_pipeline.memory_report()}
 
 @app.get("/rag/health", tags=["System"])
 async def rag_health():
     """Проверка здоровья системы"""
     return {"status": "ok", "timestamp": datetime.now()}
 
-@app.get("/rag/analytics/queries", response_model=List[AnalyticsQuery], tags=["System"])
-async def rag_analytics_queries(days: int = 7):
-    """Получение аналитики запросов"""
-    # Генерируем мок аналитику
-    analytics = []
-    for i in range(min(20, len(mock_analytics))):
-        analytics.append(mock_analytics[i])
-    
-    return analytics
+@app.get("/rag/analytics/queries", response_model=List[AnalyticsBucket], tags=["System"])
+async def rag_analytics_queries(
+    days: int = 7,
+    granularity: str = "hour",
+    course_id: Optional[str] = None
+):
+    """
+    Получение аналитики запросов по часам или дням.
+
+    Читаются готовые агрегаты (курс x модель): число запросов, доля
+    успешных, перцентили задержки, токены и стоимость.
+    """
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity должен быть hour или day")
+
+    since = datetime.now() - timedelta(days=max(1, days))
+    return await db.get_dialog_rollups_async(
+        granularity=granularity,
+        since=since,
+        course_id=course_id
+    )
+
+@app.get("/rag/analytics/overview", tags=["System"])
+async def rag_analytics_overview(days: int = 7):
+    """Итоги за период по моделям (по дневным агрегатам)"""
+    since = datetime.now() - timedelta(days=max(1, days))
+    buckets = await db.get_dialog_rollups_async(granularity="day", since=since)
+
+    models = {}
+    for bucket in buckets:
+        model = models.setdefault(bucket["model_used"] or "unknown", {
+            "request_count": 0,
+            "success_count": 0,
+            "tokens_used": 0,
+            "cost_estimated": 0.0,
+            "latency_weighted_ms": 0.0
+        })
+        model["request_count"] += bucket["request_count"]
+        model["success_count"] += bucket["success_count"]
+        model["tokens_used"] += bucket["tokens_used"]
+        model["cost_estimated"] += bucket["cost_estimated"]
+        model["latency_weighted_ms"] += (bucket["latency_avg_ms"] or 0) * bucket["request_count"]
+
+    for model in models.values():
+        count = model["request_count"]
+        model["success_rate"] = model["success_count"] / count if count else 0.0
+        model["latency_avg_ms"] = model.pop("latency_weighted_ms") / count if count else None
+
+    return {
+        "days": days,
+        "request_count": sum(m["request_count"] for m in models.values()),
+        "models": models,
+        "refresher": rollup_refresher.stats()
+    }
 
 @app.get("/rag/analytics/documents", tags=["System"])
 async def rag_analytics_documents():
     """Получение аналитики документов"""
+    documents = document_pipeline.list()
     doc_types = {}
-    for doc in mock_documents_db:
-        doc_type = doc["content_type"].split('/')[-1]
+    for doc in documents:
+        doc_type = (doc["content_type"] or "unknown").split('/')[-1]
         doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
     
     return {
-        "total_documents": len(mock_documents_db),
+        "total_documents": len(documents),
         "document_types": doc_types,
-        "total_size_mb": sum(doc["size"] for doc in mock_documents_db) / (1024 * 1024),
-        "processed": len([d for d in mock_documents_db if d["status"] == "processed"])
+        "total_size_mb": sum(doc["size"] for doc in documents) / (1024 * 1024),
+        "processed": len([d for d in documents if d["status"] == "processed"]),
+        "processing": len([d for d in documents if d["status"] == "processing"]),
+        "failed": len([d for d in documents if d["status"] == "failed"])
     }
 
 # ========== ДОПОЛНИТЕЛЬНЫЕ РОУТЫ ==========
@@ -1,36 +1,170 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import AsyncIterator, Callable, Optional
+
 from qdrant_client import QdrantClient
+from core.answer_cache import SemanticAnswerCache
 from rag.engine import RagEngine
 from llm.gigachat_client import GigaChatClient
 from vector_db.qdrant_manager import QdrantManager
 
 
+logger = logging.getLogger(__name__)
+
+
+class AnswerStream:
+    """
+    Ответ агента, который генерируется потоком.
+
+    Итерируется асинхронно по кускам текста; после окончания потока
+    в answer лежит полный ответ, а в first_token_ms / total_ms - время
+    до первого куска и до конца генерации.
+    """
+
+    def __init__(self, produce: Callable[["AnswerStream"], AsyncIterator[str]]):
+        self._started = time.perf_counter()
+        self._tokens = produce(self)
+        self.parts = []
+        self.first_token_ms: Optional[int] = None
+        self.total_ms: Optional[int] = None
+        self.from_cache = False
+        self.context: Optional[str] = None
+        self.error: Optional[str] = None
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def is_successful(self) -> bool:
+        return self.error is None
+
+    async def __aiter__(self):
+        try:
+            # Генерация (и запрос к LLM) закрывается вместе с потоком, в том числе при отключении клиента
+            async with contextlib.aclosing(self._tokens) as tokens:
+                async for token in tokens:
+                    if self.first_token_ms is None:
+                        self.first_token_ms = int((time.perf_counter() - self._started) * 1000)
+                    self.parts.append(token)
+                    yield token
+        finally:
+            self.total_ms = int((time.perf_counter() - self._started) * 1000)
+
+
 class DialogAgent:
-    def __init__(self, gigachat: GigaChatClient, qdrant: QdrantManager, rag: RagEngine):
+    SYSTEM_PROMPT = "Ты - AI-ассистент университета. Отвечай на вопросы студентов на основе предоставленного контекста."
+
+    def __init__(self, gigachat: GigaChatClient, qdrant: QdrantManager, rag: RagEngine,
+                 answer_cache: Optional[SemanticAnswerCache] = None):
         """
         Инициализация диалогового агента.
         
         Args:
             gigachat: Модель GigaChat
             qdrant: Модель векторной бд Qdrant
+            answer_cache: Семантический кэш ответов (None - без кэша)
         """
 
         self.gigachat_client = gigachat
         self.qdrant_manager = qdrant
         self.rag = rag
+        self.answer_cache = answer_cache
 
-    def say(self, message):
+    def say(self, message, course_id: Optional[str] = None):
         print(f"[Agent] Received: {message}")
-        
+
+        # Семантический кэш: близкий вопрос по тому же курсу уже отвечен
+        query_vector = self._embed_for_cache(message)
+        # Версия коллекции - одна на запрос: для поиска в кэше и для записи в него
+        collection = self.qdrant_manager.collection_version() if query_vector is not None else None
+        if query_vector is not None:
+            cached = self.answer_cache.lookup(query_vector, collection, course_id)
+            if cached is not None:
+                print(f"[Agent] Answer from cache: {cached}")
+                return cached
+
+        started = time.perf_counter()
+
         # Получаем контекст из Qdrant
         context = self.qdrant_manager.search_relevant_info(message)
         
         # Генерируем ответ с помощью GigaChat
-        prompt = "Ты - AI-ассистент университета. Отвечай на вопросы студентов на основе предоставленного контекста."
-        answer = self.gigachat_client.ask(prompt, context, message)
+        answer = self.gigachat_client.ask(self.SYSTEM_PROMPT, context, message)
+
+        # Ответы без контекста из базы знаний (ошибка или пустой поиск) и ошибки модели не кэшируются
+        if query_vector is not None and QdrantManager.has_context(context) and answer != GigaChatClient.ERROR_ANSWER:
+            self.answer_cache.store(
+                query_vector, message, answer,
+                collection=collection,
+                course_id=course_id,
+                llm_ms=(time.perf_counter() - started) * 1000,
+            )
         
         print(f"[Agent] Final answer: {answer}")
         return answer
 
+    def say_stream(self, message, course_id: Optional[str] = None) -> AnswerStream:
+        """
+        Потоковый вариант say: куски ответа отдаются по мере генерации.
+
+        Ответ из кэша отдается одним куском. Полный ответ попадает в кэш
+        только если поток дошел до конца без ошибок.
+        """
+        return AnswerStream(lambda stream: self._stream_tokens(stream, message, course_id))
+
+    async def _stream_tokens(self, stream: AnswerStream, message, course_id):
+        print(f"[Agent] Received (stream): {message}")
+
+        # Эмбеддинг и поиск в Qdrant синхронные - выносим из event loop
+        query_vector = await asyncio.to_thread(self._embed_for_cache, message)
+        collection = None
+        if query_vector is not None:
+            # Версия коллекции может потребовать запроса к Qdrant - тоже не в event loop
+            collection = await asyncio.to_thread(self.qdrant_manager.collection_version)
+            cached = self.answer_cache.lookup(query_vector, collection, course_id)
+            if cached is not None:
+                stream.from_cache = True
+                yield cached
+                return
+
+        started = time.perf_counter()
+        stream.context = await asyncio.to_thread(self.qdrant_manager.search_relevant_info, message)
+
+        try:
+            async for token in self.gigachat_client.ask_astream(self.SYSTEM_PROMPT, stream.context, message):
+                yield token
+        except Exception as e:
+            logger.error(f"[Agent] Ошибка потоковой генерации: {e}")
+            stream.error = str(e)
+            if not stream.parts:
+                yield GigaChatClient.ERROR_ANSWER
+            return
+
+        if query_vector is not None and QdrantManager.has_context(stream.context) and stream.answer.strip():
+            self.answer_cache.store(
+                query_vector, message, stream.answer,
+                collection=collection,
+                course_id=course_id,
+                llm_ms=(time.perf_counter() - started) * 1000,
+            )
+
+    def _embed_for_cache(self, message):
+        """Вектор вопроса для кэша ответов (тот же, что пойдет в поиск)"""
+        if self.answer_cache is None:
+            return None
+        try:
+            return self.qdrant_manager.embed_query(message)
+        except Exception as e:
+            logger.warning(f"[Agent] Кэш ответов пропущен, не удалось получить эмбеддинг: {e}")
+            return None
+
+    def answer_cache_stats(self):
+        """Доля попаданий кэша ответов и сэкономленное время LLM"""
+        return self.answer_cache.stats() if self.answer_cache is not None else None
+
     def process_message(self, user_message, chat_history):
         # 1. Анализируем намерение
         intent = self.classify_intent(user_message)
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_db.embedding_service import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Namespace:
+    """Записи кэша одного курса в одной версии коллекции"""
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.answers: List[str] = []
+        self.questions: List[str] = []
+        self.created_at: List[float] = []
+        self.llm_ms: List[float] = []
+
+    def __len__(self):
+        return len(self.answers)
+
+    def drop(self, keep: np.ndarray):
+        """Оставить только записи с индексами keep"""
+        self.vectors = self.vectors[keep]
+        self.answers = [self.answers[i] for i in keep]
+        self.questions = [self.questions[i] for i in keep]
+        self.created_at = [self.created_at[i] for i in keep]
+        self.llm_ms = [self.llm_ms[i] for i in keep]
+
+
+class SemanticAnswerCache:
+    """
+    Семантический кэш ответов агента.
+
+    Вопрос кодируется тем же энкодером, что и поиск в Qdrant. Если среди
+    ранее отвеченных вопросов того же курса и той же версии коллекции есть
+    вопрос с косинусной близостью >= threshold, возвращается его ответ
+    без поиска и вызова LLM.
+
+    Записи живут ttl секунд. invalidate(collection) после переиндексации
+    увеличивает поколение коллекции, и старые ответы больше не находятся.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600.0, max_entries: int = 5000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._namespaces: Dict[Tuple[str, int, str], _Namespace] = {}
+        self._generations: Dict[str, int] = {}
+        self._size = 0
+
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+        self._llm_ms_saved = 0.0
+        # Близость лучшего кандидата при каждом поиске - по ней подбирается порог
+        self._similarity = Histogram([0.5, 0.7, 0.8, 0.85, 0.9, 0.925, 0.95, 0.975, 0.99])
+
+    def _namespace_key(self, collection: str, course_id: Optional[str]) -> Tuple[str, int, str]:
+        return collection, self._generations.get(collection, 0), str(course_id or "")
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector, collection: str, course_id: Optional[str] = None) -> Optional[str]:
+        """Найти ответ на семантически близкий вопрос или None"""
+        query = self._unit(vector)
+        now = time.time()
+
+        with self._lock:
+            self._stats["lookups"] += 1
+            namespace = self._namespaces.get(self._namespace_key(collection, course_id))
+            if namespace is not None and len(namespace):
+                self._expire(namespace, now)
+
+            if namespace is None or not len(namespace):
+                self._stats["misses"] += 1
+                return None
+
+            similarities = namespace.vectors @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            self._similarity.observe(similarity)
+
+            if similarity < self.threshold:
+                self._stats["misses"] += 1
+                return None
+
+            self._stats["hits"] += 1
+            self._llm_ms_saved += namespace.llm_ms[best]
+            logger.info(f"[AnswerCache] Попадание: similarity={similarity:.3f}, вопрос: '{namespace.questions[best][:80]}'")
+            return namespace.answers[best]
+
+    def store(self, vector, question: str, answer: str, collection: str,
+              course_id: Optional[str] = None, llm_ms: float = 0.0):
+        """Запомнить ответ; llm_ms - сколько стоил поиск и вызов LLM"""
+        query = self._unit(vector)
+
+        with self._lock:
+            key = self._namespace_key(collection, course_id)
+            namespace = self._namespaces.get(key)
+            if namespace is None:
+                namespace = self._namespaces[key] = _Namespace(query.shape[0])
+
+            namespace.vectors = np.vstack([namespace.vectors, query[None, :]])
+            namespace.answers.append(answer)
+            namespace.questions.append(question)
+            namespace.created_at.append(time.time())
+            namespace.llm_ms.append(llm_ms)
+            self._size += 1
+            self._stats["stores"] += 1
+
+            if self._size > self.max_entries:
+                self._evict_oldest()
+
+    def invalidate(self, collection: Optional[str] = None):
+        """Сбросить ответы коллекции (или все) после переиндексации базы знаний"""
+        with self._lock:
+            for key in list(self._namespaces):
+                if collection is None or key[0] == collection:
+                    self._size -= len(self._namespaces.pop(key))
+            if collection is None:
+                for name in self._generations:
+                    self._generations[name] += 1
+            else:
+                self._generations[collection] = self._generations.get(collection, 0) + 1
+            self._stats["invalidations"] += 1
+        logger.info(f"[AnswerCache] Кэш ответов сброшен: {collection or 'все коллекции'}")
+
+    def _expire(self, namespace: _Namespace, now: float):
+        if not self.ttl or now - namespace.created_at[0] < self.ttl:
+            return
+        keep = np.array([i for i, created in enumerate(namespace.created_at) if now - created < self.ttl], dtype=np.int64)
+        removed = len(namespace) - len(keep)
+        namespace.drop(keep)
+        self._size -= removed
+        self._stats["expired"] += removed
+
+    def _evict_oldest(self):
+        """Вытеснить самую старую запись среди всех пространств"""
+        oldest_key = min(
+            (key for key, namespace in self._namespaces.items() if len(namespace)),
+            key=lambda key: self._namespaces[key].created_at[0],
+        )
+        namespace = self._namespaces[oldest_key]
+        namespace.drop(np.arange(1, len(namespace)))
+        if not len(namespace):
+            del self._namespaces[oldest_key]
+        self._size -= 1
+        self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, object]:
+        """Доля попаданий, сэкономленное время LLM и распределение близости"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._size
+            stats["threshold"] = self.threshold
+            stats["llm_ms_saved"] = round(self._llm_ms_saved, 3)
+            stats["similarity"] = self._similarity.snapshot()
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+        return stats
@@ -1,10 +1,192 @@
+'''
+Контейнер зависимостей приложения.
+
+Каждая зависимость (QdrantManager, GigaChatClient, ...) - ленивый Service:
+создается при первом обращении AppContext.<Имя>, а не при импорте модуля.
+AppContext.start() создает все зависимости параллельно (например, при
+старте сервера) и, по желанию, прогревает их, чтобы первый настоящий
+запрос не ждал загрузки модели.
+
+Ошибка создания не прячется в полу-инициализированный объект: обращение
+к упавшей зависимости бросает ServiceUnavailable, повторная попытка -
+не чаще раза в RETRY_INTERVAL секунд. Состояние и время инициализации /
+прогрева каждой зависимости - в AppContext.readiness() (/rag/ready).
+'''
+
+import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from core.answer_cache import SemanticAnswerCache
 from rag.engine import RagEngine
+from vector_db.hybrid_search import HybridRetriever
 from vector_db.qdrant_manager import QdrantManager
 from llm.gigachat_client import GigaChatClient
 
 
+logger = logging.getLogger(__name__)
+
+STATE_PENDING = "pending"
+STATE_INITIALIZING = "initializing"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+class ServiceUnavailable(RuntimeError):
+    """Зависимость не удалось создать"""
+
+
+class Service:
+    """Ленивая зависимость с состоянием, временем инициализации и прогревом"""
+
+    RETRY_INTERVAL = 30.0
+
+    def __init__(self, factory: Callable[[], Any], warm_up: Optional[Callable[[Any], None]] = None,
+                 health: Optional[Callable[[Any], bool]] = None):
+        """
+        Args:
+            factory: создает объект зависимости
+            warm_up: прогрев готового объекта (например, пробное кодирование)
+            health: проверка работоспособности готового объекта; False - "degraded"
+        """
+        self.factory = factory
+        self.warm_up_func = warm_up
+        self.health = health
+        self.name = None
+
+        self._lock = threading.Lock()
+        self._value = None
+        self.state = STATE_PENDING
+        self.error: Optional[str] = None
+        self.init_ms: Optional[float] = None
+        self.warm_up_ms: Optional[float] = None
+        self._failed_at = 0.0
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        return self.get()
+
+    def get(self):
+        if self.state == STATE_READY:
+            return self._value
+        with self._lock:
+            if self.state == STATE_READY:
+                return self._value
+            if self.state == STATE_FAILED and time.monotonic() - self._failed_at < self.RETRY_INTERVAL:
+                raise ServiceUnavailable(f"{self.name}: {self.error}")
+
+            self.state = STATE_INITIALIZING
+            started = time.perf_counter()
+            try:
+                value = self.factory()
+            except Exception as e:
+                self.state = STATE_FAILED
+                self.error = str(e)
+                self._failed_at = time.monotonic()
+                logger.error(f"[AppContext] {self.name}: ошибка инициализации: {e}")
+                raise ServiceUnavailable(f"{self.name}: {e}") from e
+
+            self._value = value
+            self.init_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.error = None
+            self.state = STATE_READY
+            logger.info(f"[AppContext] {self.name} готов за {self.init_ms} мс")
+            return value
+
+    def warm(self):
+        """Прогреть зависимость (один раз)"""
+        value = self.get()
+        if self.warm_up_func is None or self.warm_up_ms is not None:
+            return
+        started = time.perf_counter()
+        self.warm_up_func(value)
+        self.warm_up_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"[AppContext] {self.name} прогрет за {self.warm_up_ms} мс")
+
+    def status(self) -> Dict[str, Any]:
+        status = {
+            "state": self.state,
+            "init_ms": self.init_ms,
+            "warm_up_ms": self.warm_up_ms,
+            "error": self.error,
+        }
+        if self.state == STATE_READY and self.health is not None:
+            try:
+                status["healthy"] = bool(self.health(self._value))
+            except Exception as e:
+                status["healthy"] = False
+                status["error"] = str(e)
+        return status
+
+
+def _warm_qdrant(manager: QdrantManager):
+    # Первое кодирование в PyTorch / ONNX Runtime заметно медленнее последующих
+    manager.embedder.encode("прогрев модели эмбеддингов")
+    if manager.reranker is not None:
+        manager.reranker.warm_up()
+
+
 class AppContext:
-    QdrantManager = QdrantManager(host=os.getenv("QDRANT_HOST"))
-    GigaChatClient = GigaChatClient(api_key=os.getenv("GIGACHAT_API_KEY"))
-    Rag = RagEngine(qdrant = QdrantManager, gigachat = GigaChatClient)
\ No newline at end of file
+    QdrantManager = Service(
+        lambda: QdrantManager(host=os.getenv("QDRANT_HOST"), collection_name=os.getenv("QDRANT_COLLECTION", "test_db1")),
+        warm_up=_warm_qdrant,
+        health=lambda manager: manager.is_connected,
+    )
+    GigaChatClient = Service(lambda: GigaChatClient(api_key=os.getenv("GIGACHAT_API_KEY")))
+    Rag = Service(lambda: RagEngine(qdrant=AppContext.QdrantManager, gigachat=AppContext.GigaChatClient))
+    AnswerCache = Service(lambda: SemanticAnswerCache(
+        threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000")),
+    ))
+    HybridRetriever = Service(
+        lambda: HybridRetriever(
+            AppContext.QdrantManager,
+            rrf_k=int(os.getenv("HYBRID_RRF_K", "60")),
+            candidates=int(os.getenv("HYBRID_CANDIDATES", "50")),
+            refresh_interval=float(os.getenv("BM25_REFRESH_INTERVAL", "0")),
+        ),
+        warm_up=lambda retriever: retriever.ensure_index(),
+        health=lambda retriever: retriever.bm25_ready,
+    )
+
+    @classmethod
+    def services(cls) -> Dict[str, Service]:
+        return {name: value for name, value in vars(cls).items() if isinstance(value, Service)}
+
+    @classmethod
+    def start(cls, warm_up: bool = False, names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Создать (и прогреть) зависимости параллельно. Зависимости друг
+        друга (Rag -> QdrantManager) дожидаются через блокировку Service.
+        Ошибки не пробрасываются - они видны в readiness().
+        """
+        services = cls.services()
+        selected = [services[name] for name in (names or services)]
+
+        def init(service: Service):
+            try:
+                service.warm() if warm_up else service.get()
+            except Exception as e:
+                logger.error(f"[AppContext] {service.name}: {e}")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(selected), thread_name_prefix="AppContext") as pool:
+            list(pool.map(init, selected))
+        logger.info(f"[AppContext] Старт зависимостей за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return cls.readiness()
+
+    @classmethod
+    def readiness(cls) -> Dict[str, Any]:
+        """ready - все зависимости созданы; degraded - созданы, но проверка health не прошла"""
+        statuses = {name: service.status() for name, service in cls.services().items()}
+        return {
+            "ready": all(status["state"] == STATE_READY for status in statuses.values()),
+            "degraded": sorted(name for name, status in statuses.items() if status.get("healthy") is False),
+            "services": statuses,
+        }
@@ -1,6 +1,14 @@
 from pydantic_settings import BaseSettings
 
-class Settings(BaseSettings):
+class EmbeddingSettings(BaseSettings):
+    """Настройки модели эмбеддингов (читаются отдельно: им не нужны токены ботов и LLM)"""
+    embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # torch - SentenceTransformer на PyTorch; onnx / onnx-int8 - ONNX Runtime (scripts/export_onnx.py)
+    embedding_backend: str = "torch"
+    embedding_onnx_dir: str = "models/onnx"
+    embedding_threads: int = 0  # потоков ONNX Runtime (0 - по числу ядер)
+
+class Settings(EmbeddingSettings):
     # Telegram
     telegram_bot_token: str
     admin_ids: list[int]
@@ -18,8 +26,19 @@ class Settings(BaseSettings):
     gigachat_model: str = "GigaChat-2-Max"
     gigachat_credentials: str
     
-    # Model settings
-    embedding_model: str = "all-MiniLM-L6-v2"
+    # Model settings (embedding_* - в EmbeddingSettings)
     llm_temperature: float = 0.7
 
-settings = Settings()
\ No newline at end of file
+embedding_settings = EmbeddingSettings()
+
+_settings = None
+
+def __getattr__(name):
+    # settings создается при первом обращении: модулям, которым нужны только
+    # настройки эмбеддингов, не требуются токены Telegram и GigaChat
+    global _settings
+    if name == "settings":
+        if _settings is None:
+            _settings = Settings()
+        return _settings
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
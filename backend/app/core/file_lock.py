@@ -0,0 +1,57 @@
+# file_lock.py
+'''
+Блокировка между процессами на файле (flock) - для файлов, общих для
+воркеров gunicorn на одном узле: резервный файл истории диалогов,
+реестр загруженных документов, счетчик изменений базы знаний.
+
+Без fcntl (Windows) блокировка действует только внутри процесса: там
+приложение запускается одним процессом (uvicorn).
+'''
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+_thread_locks: Dict[str, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+@contextmanager
+def file_lock(path: str):
+    """Эксклюзивная блокировка на время блока with (файл path создается при необходимости)"""
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        with open(path, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def process_alive(pid: int) -> bool:
+    """Жив ли процесс pid (на этом узле)"""
+    if pid == os.getpid() or fcntl is None:
+        # На Windows os.kill(pid, 0) завершил бы процесс, а воркер там один
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
@@ -0,0 +1,65 @@
+# kb_generation.py
+'''
+Счетчик изменений базы знаний, общий для воркеров gunicorn на узле.
+
+Переиндексация и загрузка / удаление документов меняют коллекцию Qdrant,
+а кэш ответов, кэш оценок реранкера и индекс BM25 живут в памяти каждого
+воркера. Воркер, изменивший базу, увеличивает счетчик (bump), остальные
+периодически проверяют его (poll) и сбрасывают свои кэши.
+
+Счетчик хранится в JSON-файле: при нескольких узлах путь должен вести
+в общую файловую систему.
+'''
+
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from core.file_lock import file_lock
+
+
+class KnowledgeBaseGeneration:
+    """Номер версии базы знаний в файле path"""
+
+    def __init__(self, path: str = "kb_generation.json"):
+        self.path = path
+        self._seen = self.read()["generation"]
+
+    def read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"generation": 0, "pid": None, "reason": None, "updated_at": None}
+
+    def bump(self, reason: str, **details) -> int:
+        """База изменена этим процессом - сообщить остальным"""
+        with file_lock(self.path + ".lock"):
+            previous = self.read()["generation"]
+            state = {
+                "generation": previous + 1,
+                "pid": os.getpid(),
+                "reason": reason,
+                "updated_at": datetime.now().isoformat(),
+                **details,
+            }
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        if previous == self._seen:
+            # Иначе перед этим базу менял другой процесс - poll() это увидит
+            self._seen = state["generation"]
+        return state["generation"]
+
+    def poll(self) -> Optional[Dict[str, Any]]:
+        """Изменение, которое этот процесс еще не видел (None - изменений нет)"""
+        state = self.read()
+        seen, self._seen = self._seen, state["generation"]
+        if state["generation"] == seen:
+            return None
+        if state["pid"] == os.getpid() and state["generation"] == seen + 1:
+            # Единственное изменение сделал этот же процесс
+            return None
+        return state
@@ -0,0 +1,32 @@
+# gunicorn.conf.py
+'''
+Запуск API с несколькими воркерами (из папки app):
+    gunicorn -c gunicorn.conf.py app:app
+
+При MODEL_PRELOAD=true приложение и модели (энкодер эмбеддингов, кросс-энкодер
+при RERANKER_ENABLED) загружаются один раз в главном процессе до fork,
+воркеры получают веса копией-при-записи (vector_db/model_registry.py).
+Процессы пула документов (DOCUMENT_WORKERS на воркер) запускаются через spawn
+и держат собственную копию энкодера. Память каждого воркера и его пула -
+GET /rag/memory.
+'''
+
+import os
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("MODEL_PRELOAD", "true").lower() == "true"
+# Загрузка моделей в воркере без предзагрузки может идти дольше стандартных 30 с
+timeout = 120
+
+
+def on_starting(server):
+    if preload_app:
+        from vector_db.model_registry import preload
+        preload()
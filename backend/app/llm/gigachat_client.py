@@ -11,7 +11,7 @@ API Документация > https://developers.sber.ru/docs/ru/gigachat/promp
 
 from langchain_gigachat.chat_models import GigaChat
 import os
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator
 import logging
 from dotenv import load_dotenv
 
@@ -26,6 +26,9 @@ class GigaChatClient:
     ROLE_SYSTEM = "system"
     ROLE_USER = "user"
 
+    # Ответ при ошибке вызова модели (такие ответы не кэшируются)
+    ERROR_ANSWER = "Извините, произошла ошибка при обработке вашего запроса."
+
     def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
         """
         Инициализация клиента GigaChat.
@@ -78,10 +81,7 @@ class GigaChatClient:
         Returns:
             Ответ модели
         """
-        message = [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": f"Контекст: {context}\n\nВопрос: {question}"}
-        ]
+        message = self._build_messages(prompt, context, question)
         
         try:
             response = self.llm.invoke(message)
@@ -91,7 +91,31 @@ class GigaChatClient:
             
         except Exception as e:
             logger.error(f"[GigaChat] Error: {e}")
-            return "Извините, произошла ошибка при обработке вашего запроса."
+            return self.ERROR_ANSWER
+
+    def ask_stream(self, prompt: str, context: str, question: str) -> Iterator[str]:
+        """
+        Потоковый вариант ask: отдает куски ответа по мере генерации.
+
+        Ошибки пробрасываются вызывающему - к этому моменту часть
+        ответа могла быть уже отправлена пользователю.
+        """
+        for chunk in self.llm.stream(self._build_messages(prompt, context, question)):
+            if chunk.content:
+                yield chunk.content
+
+    async def ask_astream(self, prompt: str, context: str, question: str) -> AsyncIterator[str]:
+        """Асинхронный потоковый вариант ask (для FastAPI и Telegram)"""
+        async for chunk in self.llm.astream(self._build_messages(prompt, context, question)):
+            if chunk.content:
+                yield chunk.content
+
+    def _build_messages(self, prompt: str, context: str, question: str) -> List[Dict[str, str]]:
+        """Сообщения для модели: системный промпт + контекст с вопросом"""
+        return [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": f"Контекст: {context}\n\nВопрос: {question}"}
+        ]
 
     def _extract_content(self, response: Any) -> str:
         """Извлекает контент из ответа модели."""
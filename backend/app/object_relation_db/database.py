@@ -1,4 +1,5 @@
 # database.py
+import asyncio
 import hashlib
 import os
 import secrets
@@ -8,10 +9,17 @@ from dotenv import load_dotenv
 import logging
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+from contextlib import contextmanager
 import json
 
+from object_relation_db.pagination import NEXT, PREV, decode_cursor, encode_cursor
+from object_relation_db.pool import ConnectionPool
+from object_relation_db.queries import CatalogConnection, QueryCatalog
+from object_relation_db.schema import CONVERSATION_TITLE_SQL, NO_COURSE_ID, ROLLUP_TABLES, SCHEMA_STATEMENTS
+
 
 logger = logging.getLogger(__name__)  # Создаем логгер для этого модуля
 
@@ -25,43 +33,125 @@ class DataBase:
         print("PGSQL_USER:", os.getenv("PGSQL_USER"))
         print("PGSQL_PASSWORD:", "***" if os.getenv("PGSQL_PASSWORD") else "NOT SET")
 
+        # Пул создается при старте приложения (open_pool) и закрывается при остановке (close_pool).
+        # Пока пул не открыт (скрипты, отладка) методы работают через одиночные соединения.
+        self.pool: Optional[ConnectionPool] = None
+
+        # Именованные подготовленные запросы для горячих путей чтения
+        self.queries = QueryCatalog()
+
+    def _connect_kwargs(self) -> Dict[str, Any]:
+        return dict(
+            host = os.getenv("PGSQL_HOST"),
+            port = os.getenv("PGSQL_PORT"),
+            user = os.getenv("PGSQL_USER"),
+            password = os.getenv("PGSQL_PASSWORD"),
+            database = os.getenv("PGSQL_DATABASE"),
+            # Соединение помнит, какие запросы каталога на нем уже подготовлены
+            connection_factory = CatalogConnection
+        )
+
+    def open_pool(self, minconn: Optional[int] = None, maxconn: Optional[int] = None):
+        """Открыть пул соединений (вызывается на старте приложения)"""
+        if self.pool is not None and self.pool.is_open:
+            return
+
+        minconn = minconn or int(os.getenv("PGSQL_POOL_MIN", "2"))
+        maxconn = maxconn or int(os.getenv("PGSQL_POOL_MAX", "10"))
+        timeout = float(os.getenv("PGSQL_POOL_TIMEOUT", "10"))
+
         try:
-            
-            connection = self.create_connection_db()
-            # Создание курсора
-            cur = connection.cursor()
-            
-            # Выполнение запроса
-            cur.execute("SELECT version();")
-            
-            # Получение результата
-            version = cur.fetchone()
-            print(f"PostgreSQL version: {version[0]}")
-
-            connection.close()
+            self.pool = ConnectionPool(minconn, maxconn, timeout=timeout, **self._connect_kwargs())
+            self.pool.open()
+
+            with self.pool.connection() as connection:
+                with connection.cursor() as cur:
+                    cur.execute("SELECT version();")
+                    version = cur.fetchone()
+                    print(f"PostgreSQL version: {version[0]}")
 
         except Exception as error:
             print(f"Ошибка подключение к PGSQL: {error}")
+            self.pool = None
 
-    def create_connection_db(self):
+    def ensure_schema(self):
+        """Создать недостающие индексы и таблицы (см. schema.py)"""
+        with self.connection() as connection:
+            if not connection:
+                return
+            try:
+                with connection.cursor() as cursor:
+                    for statement in SCHEMA_STATEMENTS:
+                        cursor.execute(statement)
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                logger.error(f"Ошибка при обновлении схемы БД: {e}")
+
+    def close_pool(self):
+        """Закрыть пул соединений (вызывается при остановке приложения)"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def query_stats(self) -> Dict[str, Dict[str, float]]:
+        """Задержки и число вызовов по каждому запросу каталога"""
+        return self.queries.stats()
+
+    def pool_metrics(self) -> Dict[str, Any]:
+        """Метрики пула соединений"""
+        if self.pool is None:
+            return {"open": False}
+        return self.pool.metrics()
+
+    @contextmanager
+    def connection(self):
+        """
+        Соединение для одного запроса.
+
+        Берется из пула, если он открыт, иначе создается одиночное
+        соединение, которое закрывается по выходу из блока.
+        Если подключиться не удалось - возвращает None.
+        """
+        if self.pool is not None and self.pool.is_open:
+            with self.pool.connection() as connection:
+                yield connection
+            return
+
+        connection = self.create_connection_db()
         try:
-            connection = psycopg2.connect(
-                host = os.getenv("PGSQL_HOST"),
-                port = os.getenv("PGSQL_PORT"),
-                user = os.getenv("PGSQL_USER"),
-                password = os.getenv("PGSQL_PASSWORD"),
-                database = os.getenv("PGSQL_DATABASE")
-                # port - указывается самостоятельно
-            )
-            print(f"Успешное подключение к БД")
-            
-            self.print_all_tables(connection)
+            yield connection
+        finally:
+            if connection:
+                connection.close()
 
+    def create_connection_db(self):
+        try:
+            connection = psycopg2.connect(**self._connect_kwargs())
+            logger.debug("Успешное подключение к БД")
             return connection
         except Exception as error:
             print(f"Ошибка подключение к PGSQL: {error}")
             return None
 
+    async def _run_async(self, method, *args, **kwargs):
+        """Выполнить синхронный метод в потоке, не блокируя event loop"""
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def add_dialog_history_async(self, **kwargs) -> bool:
+        return await self._run_async(self.add_dialog_history, **kwargs)
+
+    async def get_dialog_history_by_student_async(self, *args, **kwargs) -> Dict[str, Any]:
+        return await self._run_async(self.get_dialog_history_by_student, *args, **kwargs)
+
+    async def get_conversations_summary_async(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return await self._run_async(self.get_conversations_summary, *args, **kwargs)
+
+    async def get_conversation_messages_async(self, *args, **kwargs) -> Dict[str, Any]:
+        return await self._run_async(self.get_conversation_messages, *args, **kwargs)
+
+    async def get_dialog_rollups_async(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        return await self._run_async(self.get_dialog_rollups, *args, **kwargs)
 
     def print_all_tables(self, connection):
         '''Напечатать все таблицы в базе данных'''
@@ -131,77 +221,128 @@ class DataBase:
     
     def get_dialog_history_by_student(
         self, 
-        student_id: int, 
+        student_id: str, 
         limit: int = 100, 
-        offset: int = 0
-    ) -> List[Dict[str, Any]]:
-        """Получить историю диалогов для конкретного студента"""
-        connection = self.create_connection_db()
-        if not connection:
-            return []
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Получить страницу истории диалогов студента (от новых к старым).
+
+        Пагинация по курсору (created_at, dialog_id), а не LIMIT/OFFSET:
+        каждая страница - диапазонное чтение по idx_dialog_composite,
+        независимо от того, насколько далеко пролистана история.
+
+        Args:
+            student_id: UUID студента
+            limit: Размер страницы
+            cursor: next_cursor или prev_cursor из предыдущего ответа
+
+        Returns:
+            {"items": [...], "next_cursor": str | None, "prev_cursor": str | None}
+        """
+        if not self._is_valid_uuid(student_id):
+            return self._empty_page()
+
+        with self.connection() as connection:
+            if not connection:
+                return self._empty_page()
         
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    SELECT 
-                        dialog_id,
-                        student_id,
-                        course_id,
-                        session_id,
-                        question,
-                        answer,
-                        question_vector_id,
-                        answer_vector_id,
-                        used_chunk_ids,
-                        response_time_ms,
-                        rating,
-                        feedback_text,
-                        context_used,
-                        model_used,
-                        tokens_used,
-                        cost_estimated,
-                        is_successful,
-                        error_message,
-                        user_agent,
-                        ip_address,
-                        created_at
-                    FROM dialog_history
-                    WHERE student_id = %s
-                    ORDER BY created_at DESC
-                    LIMIT %s OFFSET %s
-                """, (student_id, limit, offset))
-                
-                # Получаем названия колонок
-                column_names = [desc[0] for desc in cursor.description]
+            try:
+                with connection.cursor() as db_cursor:
+                    page = self._fetch_keyset_page(
+                        db_cursor,
+                        "student_history",
+                        params=[str(student_id)],
+                        limit=limit,
+                        page_cursor=cursor,
+                    )
                 
-                # Преобразуем результаты в список словарей
-                results = []
-                for row in cursor.fetchall():
-                    row_dict = dict(zip(column_names, row))
-                    
                     # Обрабатываем специальные поля
-                    if row_dict.get('used_chunk_ids'):
-                        try:
-                            row_dict['used_chunk_ids'] = json.loads(row_dict['used_chunk_ids'])
-                        except:
-                            row_dict['used_chunk_ids'] = []
-                    
-                    if row_dict.get('context_used'):
-                        try:
-                            row_dict['context_used'] = json.loads(row_dict['context_used'])
-                        except:
-                            row_dict['context_used'] = []
+                    for row_dict in page["items"]:
+                        used_chunk_ids = row_dict.get('used_chunk_ids')
+                        if isinstance(used_chunk_ids, str):
+                            try:
+                                row_dict['used_chunk_ids'] = json.loads(used_chunk_ids)
+                            except ValueError:
+                                row_dict['used_chunk_ids'] = []
                     
-                    results.append(row_dict)
+                        if row_dict.get('context_used'):
+                            try:
+                                row_dict['context_used'] = json.loads(row_dict['context_used'])
+                            except ValueError:
+                                row_dict['context_used'] = []
                 
-                return results
+                    return page
                 
-        except Exception as e:
-            print(f"Ошибка при получении истории диалогов: {e}")
-            return []
-        finally:
-            connection.close()
+            except ValueError:
+                # Поврежденный курсор - ошибка клиента, пробрасываем
+                raise
+            except Exception as e:
+                print(f"Ошибка при получении истории диалогов: {e}")
+                return self._empty_page()
+
+    @staticmethod
+    def _empty_page() -> Dict[str, Any]:
+        return {"items": [], "next_cursor": None, "prev_cursor": None}
+
+    def _fetch_keyset_page(
+        self,
+        db_cursor,
+        query_prefix: str,
+        params: List[Any],
+        limit: int,
+        page_cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Выбрать страницу dialog_history по курсору (created_at, dialog_id).
+
+        query_prefix - семейство запросов каталога ({prefix}_first/_next/_prev).
+        Страница всегда возвращается от новых к старым.
+        """
+        direction = NEXT
+        query_params = list(params)
+        query_name = f"{query_prefix}_first"
+
+        if page_cursor:
+            created_at, dialog_id, direction = decode_cursor(page_cursor)
+            if not self._is_valid_uuid(dialog_id):
+                raise ValueError("Некорректный курсор: dialog_id не UUID")
+            query_name = f"{query_prefix}_{direction}"
+            query_params += [created_at, dialog_id]
+
+        self.queries.execute(db_cursor, query_name, query_params + [limit + 1])
+
+        column_names = [desc[0] for desc in db_cursor.description]
+        rows = [dict(zip(column_names, row)) for row in db_cursor.fetchall()]
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == PREV:
+            rows.reverse()
+
+        if not rows:
+            return self._empty_page()
+
+        # Есть ли записи старше/новее текущей страницы
+        has_older = has_more if direction == NEXT else True
+        has_newer = bool(page_cursor) if direction == NEXT else has_more
+
+        first, last = rows[0], rows[-1]
+        return {
+            "items": rows,
+            "next_cursor": encode_cursor(last["created_at"], last["dialog_id"], NEXT) if has_older else None,
+            "prev_cursor": encode_cursor(first["created_at"], first["dialog_id"], PREV) if has_newer else None,
+        }
     
+    DIALOG_HISTORY_COLUMNS = (
+        "dialog_id", "student_id", "course_id", "session_id",
+        "question", "answer", "question_vector_id", "answer_vector_id",
+        "used_chunk_ids", "response_time_ms", "rating", "feedback_text",
+        "context_used", "model_used", "tokens_used", "cost_estimated",
+        "is_successful", "error_message", "user_agent", "ip_address",
+        "first_token_ms", "created_at",
+    )
+
     def add_dialog_history(
         self,
         dialog_id: str,  # ИЗМЕНЕНО: должен быть UUID в виде строки
@@ -223,84 +364,434 @@ class DataBase:
         is_successful: bool = True,
         user_agent: Optional[str] = None,
         ip_address: Optional[str] = None,
+        error_message: Optional[str] = None,
+        first_token_ms: Optional[int] = None,
 ) -> bool:
     
         """Добавить диалог вопрос-ответ"""
-        connection = self.create_connection_db()
-        if not connection:
-            return False
-        
+        record = dict(
+            dialog_id=dialog_id, student_id=student_id, course_id=course_id, session_id=session_id,
+            question=question, answer=answer, question_vector_id=question_vector_id,
+            answer_vector_id=answer_vector_id, used_chunk_ids=used_chunk_ids,
+            response_time_ms=response_time_ms, rating=rating, feedback_text=feedback_text,
+            context_used=context_used, model_used=model_used, tokens_used=tokens_used,
+            cost_estimated=cost_estimated, is_successful=is_successful,
+            user_agent=user_agent, ip_address=ip_address,
+            error_message=error_message, first_token_ms=first_token_ms,
+        )
         try:
-            with connection.cursor() as cursor:
-                created_at_value = datetime.now()
-                
-                # Проверяем и преобразуем UUID
-                try:
-                    # Преобразуем строки в UUID объекты для проверки
-                    if dialog_id:
-                        dialog_uuid = uuid.UUID(dialog_id)
-                    if student_id:
-                        student_uuid = uuid.UUID(student_id)
-                    if course_id:
-                        course_uuid = uuid.UUID(course_id)
-                    if session_id:
-                        session_uuid = uuid.UUID(session_id)
-                except ValueError as e:
-                    logger.error(f"Неверный формат UUID: {e}")
-                    return False
-                
-                # Преобразуем used_chunk_ids в JSON
-                used_chunk_ids_json = None
-                if used_chunk_ids and isinstance(used_chunk_ids, list):
-                    used_chunk_ids_json = json.dumps(used_chunk_ids)
-                
-                # Валидация IP-адреса
-                valid_ip_address = None
-                if ip_address:
-                    # Преобразуем 'localhost' в '127.0.0.1'
-                    if ip_address.lower() == 'localhost':
-                        valid_ip_address = '127.0.0.1'
-                    # Проверяем, похож ли на IP-адрес
-                    elif self._is_valid_ip(ip_address):
-                        valid_ip_address = ip_address
-                    else:
-                        logger.warning(f"Некорректный IP-адрес: {ip_address}. Установлен NULL.")
-                        valid_ip_address = None
-                
-                query = """
-                    INSERT INTO public.dialog_history (
-                        dialog_id, student_id, course_id, session_id,
-                        question, answer, question_vector_id, answer_vector_id,
-                        used_chunk_ids, response_time_ms, rating, feedback_text,
-                        context_used, model_used, tokens_used, cost_estimated,
-                        is_successful, user_agent, ip_address, created_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING dialog_id
-                """
-
-                params = (
-                    dialog_id, student_id, course_id, session_id,
-                    question, answer, question_vector_id, answer_vector_id,
-                    used_chunk_ids_json,  # JSON строка вместо списка
-                    response_time_ms, rating, feedback_text,
-                    context_used, model_used, tokens_used, cost_estimated,
-                    is_successful, user_agent, ip_address, created_at_value
-                )
-                
-                cursor.execute(query, params)
-                inserted_id = cursor.fetchone()[0]
-                logger.info(f"Диалог добавлен с dialog_id: {inserted_id}")
-                connection.commit()
-                return True
-                
+            # Одна запись - частный случай пачки: так же обновляется и проекция бесед
+            inserted = self.add_dialog_history_batch([record])
+            logger.info(f"Диалог добавлен с dialog_id: {dialog_id}")
+            return inserted == 1
         except Exception as e:
             logger.error(f"Ошибка PostgreSQL при записи диалога: {e}")
             logger.error(f"Параметры: dialog_id={dialog_id}, student_id={student_id}, session_id={session_id}")
-            connection.rollback()
             return False
-        finally:
-            connection.close()
+
+    def add_dialog_history_batch(self, records: List[Dict[str, Any]], page_size: int = 500) -> int:
+        """
+        Добавить пачку диалогов одним многострочным INSERT.
+
+        records - словари с теми же полями, что и у add_dialog_history
+        (плюс необязательный created_at). Записи с некорректными UUID
+        пропускаются. Повторная вставка того же dialog_id игнорируется,
+        поэтому пачку можно безопасно отправить еще раз.
+
+        Ошибки PostgreSQL пробрасываются вызывающему, чтобы он мог
+        сохранить записи в резервный файл.
+
+        Returns:
+            Количество реально вставленных строк
+        """
+        rows = [row for row in (self._prepare_dialog_row(r) for r in records) if row is not None]
+        if not rows:
+            return 0
+
+        with self.connection() as connection:
+            if not connection:
+                raise psycopg2.OperationalError("Нет соединения с PostgreSQL")
+
+            try:
+                with connection.cursor() as cursor:
+                    query = f"""
+                        INSERT INTO public.dialog_history ({", ".join(self.DIALOG_HISTORY_COLUMNS)})
+                        VALUES %s
+                        ON CONFLICT (dialog_id) DO NOTHING
+                        RETURNING session_id, student_id, question, answer, created_at
+                    """
+                    inserted_rows = execute_values(cursor, query, rows, page_size=page_size, fetch=True)
+                    # Проекцию обновляем в той же транзакции и только по реально вставленным строкам
+                    self._update_conversation_summaries(cursor, inserted_rows)
+                    self._mark_rollups_dirty(cursor, inserted_rows)
+                connection.commit()
+                logger.info(f"Записано диалогов пачкой: {len(inserted_rows)} из {len(rows)}")
+                return len(inserted_rows)
+            except Exception:
+                connection.rollback()
+                raise
+
+    def _update_conversation_summaries(self, cursor, inserted_rows: List[tuple]):
+        """
+        Инкрементально обновить conversation_summaries по новым диалогам.
+
+        Диалоги сначала сворачиваются по session_id в Python, поэтому пачка
+        дает одну строку UPSERT на беседу.
+        """
+        sessions: Dict[str, Dict[str, Any]] = {}
+        for session_id, student_id, question, answer, created_at in inserted_rows:
+            summary = sessions.get(str(session_id))
+            if summary is None:
+                sessions[str(session_id)] = {
+                    "student_id": str(student_id),
+                    "first_question": question,
+                    "last_question": question,
+                    "last_answer": answer,
+                    "message_count": 1,
+                    "created_at": created_at,
+                    "updated_at": created_at,
+                }
+                continue
+
+            summary["message_count"] += 1
+            if created_at < summary["created_at"]:
+                summary["created_at"] = created_at
+                summary["first_question"] = question
+            if created_at >= summary["updated_at"]:
+                summary["updated_at"] = created_at
+                summary["last_question"] = question
+                summary["last_answer"] = answer
+
+        if not sessions:
+            return
+
+        values = [
+            (
+                session_id, summary["student_id"], summary["first_question"],
+                summary["last_question"], summary["last_answer"], summary["message_count"],
+                summary["created_at"], summary["updated_at"],
+            )
+            for session_id, summary in sessions.items()
+        ]
+        title_sql = CONVERSATION_TITLE_SQL.format(question="v.first_question", session_id="v.session_id")
+        execute_values(cursor, f"""
+            INSERT INTO public.conversation_summaries AS cs (
+                session_id, student_id, title, last_question, last_answer,
+                message_count, created_at, updated_at
+            )
+            SELECT
+                v.session_id::uuid, v.student_id::uuid, {title_sql}, v.last_question, v.last_answer,
+                v.message_count::integer, v.created_at::timestamp, v.updated_at::timestamp
+            FROM (VALUES %s) AS v (
+                session_id, student_id, first_question, last_question, last_answer,
+                message_count, created_at, updated_at
+            )
+            ON CONFLICT (session_id) DO UPDATE SET
+                message_count = cs.message_count + EXCLUDED.message_count,
+                title = CASE WHEN EXCLUDED.created_at < cs.created_at THEN EXCLUDED.title ELSE cs.title END,
+                last_question = CASE WHEN EXCLUDED.updated_at >= cs.updated_at
+                                     THEN EXCLUDED.last_question ELSE cs.last_question END,
+                last_answer = CASE WHEN EXCLUDED.updated_at >= cs.updated_at
+                                   THEN EXCLUDED.last_answer ELSE cs.last_answer END,
+                created_at = LEAST(cs.created_at, EXCLUDED.created_at),
+                updated_at = GREATEST(cs.updated_at, EXCLUDED.updated_at)
+        """, values)
+
+    def _mark_rollups_dirty(self, cursor, inserted_rows: List[tuple]):
+        """Отметить часы с новыми диалогами для пересчета агрегатов аналитики"""
+        hours = {
+            created_at.replace(minute=0, second=0, microsecond=0)
+            for *_, created_at in inserted_rows
+            if created_at is not None
+        }
+        if hours:
+            execute_values(
+                cursor,
+                "INSERT INTO public.dialog_rollup_dirty (bucket) VALUES %s ON CONFLICT DO NOTHING",
+                [(hour,) for hour in sorted(hours)],
+            )
+
+    def refresh_dialog_rollups(self, chunk_size: int = 500) -> int:
+        """
+        Пересчитать агрегаты аналитики по отмеченным часам.
+
+        Берутся часы из dialog_rollup_dirty, для них и для их дней агрегаты
+        строятся заново по dialog_history (диапазонное чтение по created_at).
+        Отметки удаляются в той же транзакции, поэтому при ошибке пересчет
+        повторится при следующем запуске.
+
+        Returns:
+            Количество пересчитанных часов
+        """
+        with self.connection() as connection:
+            if not connection:
+                return 0
+
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("DELETE FROM public.dialog_rollup_dirty RETURNING bucket")
+                    hours = sorted(row[0] for row in cursor.fetchall())
+                    if hours:
+                        days = sorted({hour.replace(hour=0) for hour in hours})
+                        for granularity, buckets in (("hour", hours), ("day", days)):
+                            for i in range(0, len(buckets), chunk_size):
+                                self._rebuild_rollup_buckets(cursor, granularity, buckets[i:i + chunk_size])
+                connection.commit()
+                if hours:
+                    logger.info(f"Агрегаты аналитики пересчитаны за {len(hours)} ч.")
+                return len(hours)
+            except Exception as e:
+                connection.rollback()
+                logger.error(f"Ошибка при пересчете агрегатов аналитики: {e}")
+                return 0
+
+    def _rebuild_rollup_buckets(self, cursor, granularity: str, buckets: List[datetime]):
+        table = ROLLUP_TABLES[granularity]
+        cursor.execute(f"DELETE FROM public.{table} WHERE bucket = ANY(%s)", (buckets,))
+        cursor.execute(f"""
+            INSERT INTO public.{table} (
+                bucket, course_id, model_used, request_count, success_count,
+                latency_avg_ms, latency_p50_ms, latency_p95_ms, latency_p99_ms,
+                tokens_used, cost_estimated
+            )
+            SELECT
+                date_trunc(%(granularity)s, created_at) AS bucket,
+                COALESCE(course_id, %(no_course)s::uuid),
+                COALESCE(model_used, ''),
+                COUNT(*),
+                COUNT(*) FILTER (WHERE is_successful),
+                AVG(response_time_ms),
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY response_time_ms),
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY response_time_ms),
+                percentile_cont(0.99) WITHIN GROUP (ORDER BY response_time_ms),
+                COALESCE(SUM(tokens_used), 0),
+                COALESCE(SUM(cost_estimated), 0)
+            FROM public.dialog_history
+            WHERE created_at >= %(start)s
+              AND created_at < %(end)s::timestamp + %(step)s::interval
+              AND date_trunc(%(granularity)s, created_at) = ANY(%(buckets)s)
+            GROUP BY 1, 2, 3
+        """, {
+            "granularity": granularity,
+            "no_course": NO_COURSE_ID,
+            "start": buckets[0],
+            "end": buckets[-1],
+            "step": f"1 {granularity}",
+            "buckets": buckets,
+        })
+
+    def mark_all_rollups_dirty(self, only_if_empty: bool = False) -> int:
+        """
+        Отметить для пересчета все часы, за которые есть история.
+
+        Используется для первичного заполнения агрегатов: сам пересчет
+        выполнит фоновая задача (refresh_dialog_rollups).
+        """
+        with self.connection() as connection:
+            if not connection:
+                return 0
+
+            try:
+                with connection.cursor() as cursor:
+                    if only_if_empty:
+                        cursor.execute("SELECT EXISTS (SELECT 1 FROM public.dialog_rollup_hourly)")
+                        if cursor.fetchone()[0]:
+                            connection.rollback()
+                            return 0
+                    cursor.execute("""
+                        INSERT INTO public.dialog_rollup_dirty (bucket)
+                        SELECT DISTINCT date_trunc('hour', created_at)
+                        FROM public.dialog_history
+                        WHERE created_at IS NOT NULL
+                        ON CONFLICT DO NOTHING
+                    """)
+                    marked = cursor.rowcount
+                connection.commit()
+                return marked
+            except Exception as e:
+                connection.rollback()
+                logger.error(f"Ошибка при отметке агрегатов для пересчета: {e}")
+                return 0
+
+    def get_dialog_rollups(
+        self,
+        granularity: str = "day",
+        since: Optional[datetime] = None,
+        course_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Прочитать готовые агрегаты аналитики (от новых корзин к старым).
+
+        Args:
+            granularity: hour или day
+            since: Начало периода (включительно)
+            course_id: Фильтр по курсу (UUID)
+        """
+        if granularity not in ROLLUP_TABLES:
+            raise ValueError(f"Неизвестная гранулярность: {granularity}")
+        if course_id and not self._is_valid_uuid(course_id):
+            return []
+
+        with self.connection() as connection:
+            if not connection:
+                return []
+
+            try:
+                with connection.cursor() as cursor:
+                    self.queries.execute(
+                        cursor,
+                        f"rollup_{granularity}",
+                        (since or datetime(1970, 1, 1), str(course_id) if course_id else None),
+                    )
+                    column_names = [desc[0] for desc in cursor.description]
+
+                    buckets = []
+                    for row in cursor.fetchall():
+                        row_dict = dict(zip(column_names, row))
+                        if row_dict["course_id"] == NO_COURSE_ID:
+                            row_dict["course_id"] = None
+                        row_dict["model_used"] = row_dict["model_used"] or None
+                        row_dict["success_rate"] = (
+                            row_dict["success_count"] / row_dict["request_count"]
+                            if row_dict["request_count"] else 0.0
+                        )
+                        row_dict["cost_estimated"] = float(row_dict["cost_estimated"] or 0)
+                        buckets.append(row_dict)
+                    return buckets
+
+            except Exception as e:
+                logger.error(f"Ошибка при чтении агрегатов аналитики: {e}")
+                return []
+
+    def backfill_conversation_summaries(self, only_if_empty: bool = False) -> int:
+        """
+        Пересчитать conversation_summaries по всей dialog_history.
+
+        Таблица проекции блокируется от записи на время пересчета, поэтому
+        диалоги, записанные параллельно, не будут посчитаны дважды.
+
+        Args:
+            only_if_empty: Пересчитывать, только если проекция еще пустая
+
+        Returns:
+            Количество пересчитанных бесед
+        """
+        with self.connection() as connection:
+            if not connection:
+                return 0
+
+            try:
+                with connection.cursor() as cursor:
+                    if only_if_empty:
+                        cursor.execute("SELECT EXISTS (SELECT 1 FROM public.conversation_summaries)")
+                        if cursor.fetchone()[0]:
+                            connection.rollback()
+                            return 0
+
+                    cursor.execute("LOCK TABLE public.conversation_summaries IN SHARE ROW EXCLUSIVE MODE")
+                    title_sql = CONVERSATION_TITLE_SQL.format(question="first_q.question", session_id="s.session_id")
+                    cursor.execute(f"""
+                        INSERT INTO public.conversation_summaries AS cs (
+                            session_id, student_id, title, last_question, last_answer,
+                            message_count, created_at, updated_at
+                        )
+                        SELECT
+                            s.session_id, s.student_id, {title_sql}, last_q.question, last_q.answer,
+                            s.message_count, s.created_at, s.updated_at
+                        FROM (
+                            SELECT
+                                session_id,
+                                (array_agg(student_id))[1] AS student_id,
+                                COUNT(*) AS message_count,
+                                MIN(created_at) AS created_at,
+                                MAX(created_at) AS updated_at
+                            FROM public.dialog_history
+                            GROUP BY session_id
+                        ) s
+                        JOIN LATERAL (
+                            SELECT question
+                            FROM public.dialog_history
+                            WHERE session_id = s.session_id
+                            ORDER BY created_at ASC, dialog_id ASC
+                            LIMIT 1
+                        ) first_q ON true
+                        JOIN LATERAL (
+                            SELECT question, answer
+                            FROM public.dialog_history
+                            WHERE session_id = s.session_id
+                            ORDER BY created_at DESC, dialog_id DESC
+                            LIMIT 1
+                        ) last_q ON true
+                        ON CONFLICT (session_id) DO UPDATE SET
+                            student_id = EXCLUDED.student_id,
+                            title = EXCLUDED.title,
+                            last_question = EXCLUDED.last_question,
+                            last_answer = EXCLUDED.last_answer,
+                            message_count = EXCLUDED.message_count,
+                            created_at = EXCLUDED.created_at,
+                            updated_at = EXCLUDED.updated_at
+                    """)
+                    rebuilt = cursor.rowcount
+                connection.commit()
+                logger.info(f"Проекция conversation_summaries пересчитана: {rebuilt} бесед")
+                return rebuilt
+            except Exception as e:
+                connection.rollback()
+                logger.error(f"Ошибка при пересчете conversation_summaries: {e}")
+                return 0
+
+    def _prepare_dialog_row(self, record: Dict[str, Any]) -> Optional[tuple]:
+        """Проверить поля диалога и собрать кортеж параметров для INSERT"""
+        # Проверяем UUID
+        try:
+            for field in ("dialog_id", "student_id", "course_id", "session_id"):
+                if record.get(field):
+                    uuid.UUID(str(record[field]))
+        except ValueError as e:
+            logger.error(f"Неверный формат UUID: {e}")
+            return None
+
+        # Преобразуем used_chunk_ids в JSON
+        used_chunk_ids = record.get("used_chunk_ids")
+        used_chunk_ids_json = None
+        if used_chunk_ids and isinstance(used_chunk_ids, list):
+            used_chunk_ids_json = json.dumps(used_chunk_ids)
+
+        # Валидация IP-адреса
+        ip_address = record.get("ip_address")
+        valid_ip_address = None
+        if ip_address:
+            # Преобразуем 'localhost' в '127.0.0.1'
+            if ip_address.lower() == 'localhost':
+                valid_ip_address = '127.0.0.1'
+            # Проверяем, похож ли на IP-адрес
+            elif self._is_valid_ip(ip_address):
+                valid_ip_address = ip_address
+            else:
+                logger.warning(f"Некорректный IP-адрес: {ip_address}. Установлен NULL.")
+
+        created_at = record.get("created_at") or datetime.now()
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+
+        values = dict(record)
+        values.update(
+            used_chunk_ids=used_chunk_ids_json,  # JSON строка вместо списка
+            ip_address=valid_ip_address,
+            created_at=created_at,
+            is_successful=record.get("is_successful", True),
+        )
+        return tuple(values.get(column) for column in self.DIALOG_HISTORY_COLUMNS)
         
+    @staticmethod
+    def _is_valid_uuid(value) -> bool:
+        """Проверка, что значение - UUID (строкой или объектом)"""
+        try:
+            uuid.UUID(str(value))
+            return True
+        except (ValueError, TypeError, AttributeError):
+            return False
+
     def _is_valid_ip(self, ip_address: str) -> bool:
         """Проверка валидности IP-адреса"""
         import re
@@ -314,172 +805,131 @@ class DataBase:
 
     def get_conversations_summary(
         self, 
-        student_id: int, 
+        student_id: str, 
         limit: int = 50
     ) -> List[Dict[str, Any]]:
-        """Получить сводку по диалогам (аналог списка бесед)"""
-        connection = self.create_connection_db()
-        if not connection:
+        """
+        Получить сводку по диалогам (аналог списка бесед).
+
+        Читается готовая проекция conversation_summaries - один диапазон
+        по индексу (student_id, updated_at DESC), без агрегации истории.
+        """
+        if not self._is_valid_uuid(student_id):
             return []
+
+        with self.connection() as connection:
+            if not connection:
+                return []
         
-        try:
-            with connection.cursor() as cursor:
-                student_id_str = str(student_id)
-
-                # Группируем по session_id для получения "бесед"
-                cursor.execute("""
-                    SELECT 
-                        session_id::text as id,
-                        MIN(created_at) as created_at,
-                        MAX(created_at) as updated_at,
-                        COUNT(*) as message_count,
-                        STRING_AGG(question, ' ' ORDER BY created_at) as questions_text,
-                        -- Получаем последний вопрос через подзапрос
-                        (SELECT question 
-                        FROM dialog_history dh2 
-                        WHERE dh2.session_id = dh.session_id 
-                        ORDER BY created_at DESC 
-                        LIMIT 1) as last_question,
-                        -- Получаем последний ответ через подзапрос  
-                        (SELECT answer
-                        FROM dialog_history dh3
-                        WHERE dh3.session_id = dh.session_id
-                        ORDER BY created_at DESC
-                        LIMIT 1) as last_answer
-                    FROM dialog_history dh
-                    WHERE student_id = %s
-                    GROUP BY session_id
-                    ORDER BY MAX(created_at) DESC
-                    LIMIT %s;
-                """, (student_id_str, limit))
+            try:
+                with connection.cursor() as cursor:
+                    self.queries.execute(cursor, "conversations_summary", (str(student_id), limit))
                 
-                # Получаем названия колонок
-                column_names = [desc[0] for desc in cursor.description]
+                    # Получаем названия колонок
+                    column_names = [desc[0] for desc in cursor.description]
                 
-                # Преобразуем результаты
-                conversations = []
-                for row in cursor.fetchall():
-                    row_dict = dict(zip(column_names, row))
-                    
-                    # Преобразуем UUID в строку
-                    session_id = row_dict.get('id')
-                    if session_id:
-                        session_id = str(session_id)
-                    
-                    # Создаем заголовок из первых слов вопроса
-                    questions_text = row_dict.get('questions_text', '')
-                    if questions_text:
-                        # Берем первые 3 слова для заголовка
-                        words = questions_text.split()[:3]
-                        title = ' '.join(words)
-                        if len(questions_text.split()) > 3:
-                            title += '...'
-                    else:
-                        title = f"Диалог {session_id[:8] if session_id else ''}"
+                    # Преобразуем результаты
+                    conversations = []
+                    for row in cursor.fetchall():
+                        row_dict = dict(zip(column_names, row))
                     
-                    # Создаем последнее сообщение
-                    last_question = row_dict.get('last_question', '')
-                    last_answer = row_dict.get('last_answer', '')
+                        # Создаем последнее сообщение
+                        last_question = row_dict.get('last_question') or ''
+                        last_answer = row_dict.get('last_answer') or ''
                     
-                    if last_answer:
-                        last_message = f"В: {last_question[:50]}... | О: {last_answer[:50]}..."
-                    else:
-                        last_message = f"В: {last_question[:100]}..."
+                        if last_answer:
+                            last_message = f"В: {last_question[:50]}... | О: {last_answer[:50]}..."
+                        else:
+                            last_message = f"В: {last_question[:100]}..."
                     
-                    conversation = {
-                        "id": session_id,  # Используем преобразованный UUID
-                        "title": title,
-                        "last_message": last_message,
-                        "message_count": row_dict.get('message_count', 0),
-                        "created_at": row_dict.get('created_at'),
-                        "updated_at": row_dict.get('updated_at')
-                    }
+                        conversation = {
+                            "id": row_dict.get('id'),
+                            "title": row_dict.get('title'),
+                            "last_message": last_message,
+                            "message_count": row_dict.get('message_count', 0),
+                            "created_at": row_dict.get('created_at'),
+                            "updated_at": row_dict.get('updated_at')
+                        }
                     
-                    conversations.append(conversation)
+                        conversations.append(conversation)
                 
-                return conversations
+                    return conversations
                 
-        except Exception as e:
-            print(f"Ошибка при получении сводки диалогов: {e}")
-            import traceback
-            traceback.print_exc()  # Для детальной информации об ошибке
-            return []
-        finally:
-            connection.close()
+            except Exception as e:
+                print(f"Ошибка при получении сводки диалогов: {e}")
+                import traceback
+                traceback.print_exc()  # Для детальной информации об ошибке
+                return []
     
     def get_conversation_messages(
         self, 
         session_id: str, 
-        student_id: Optional[int] = None
-    ) -> List[Dict[str, Any]]:
-        """Получить все сообщения конкретной сессии (беседы)"""
-        connection = self.create_connection_db()
-        if not connection:
-            return []
+        student_id: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Получить страницу сообщений конкретной сессии (беседы).
+
+        Без курсора возвращаются последние limit сообщений. next_cursor
+        листает к более старым сообщениям, prev_cursor - к более новым.
+        Внутри страницы сообщения идут в хронологическом порядке.
+
+        Returns:
+            {"items": [...], "next_cursor": str | None, "prev_cursor": str | None}
+        """
+        # session_id сравнивается как uuid, чтобы работал индекс; не-UUID беседы в БД быть не может
+        if not self._is_valid_uuid(session_id) or (student_id and not self._is_valid_uuid(student_id)):
+            return self._empty_page()
+
+        with self.connection() as connection:
+            if not connection:
+                return self._empty_page()
         
-        try:
-            with connection.cursor() as cursor:
-                student_id_str = str(student_id) if student_id else None
-                
-                # Всегда используем session_id::text для сравнения UUID как строк
-                query = """
-                    SELECT 
-                        dialog_id,
-                        question,
-                        answer,
-                        response_time_ms,
-                        rating,
-                        feedback_text,
-                        model_used,
-                        tokens_used,
-                        cost_estimated,
-                        is_successful,
-                        created_at
-                    FROM dialog_history
-                    WHERE session_id::text = %s
-                """
-                params = [session_id]
-                
-                if student_id_str:
-                    query += " AND student_id = %s"
-                    params.append(student_id_str)
-                
-                query += " ORDER BY created_at ASC"
-                
-                print(f"DEBUG: Выполняем запрос: {query}")
-                print(f"DEBUG: Параметры: session_id={session_id}, student_id={student_id_str}")
-                
-                cursor.execute(query, params)
+            try:
+                with connection.cursor() as db_cursor:
+                    if student_id:
+                        query_prefix = "session_student_messages"
+                        params = [session_id, str(student_id)]
+                    else:
+                        query_prefix = "session_messages"
+                        params = [session_id]
                 
-                column_names = [desc[0] for desc in cursor.description]
+                    page = self._fetch_keyset_page(
+                        db_cursor,
+                        query_prefix,
+                        params=params,
+                        limit=limit,
+                        page_cursor=cursor,
+                    )
                 
-                messages = []
-                for row in cursor.fetchall():
-                    row_dict = dict(zip(column_names, row))
+                    messages = []
+                    for row_dict in reversed(page["items"]):
+                        message = {
+                            "id": row_dict.get('dialog_id'),
+                            "question": row_dict.get('question'),
+                            "answer": row_dict.get('answer'),
+                            "response_time": row_dict.get('response_time_ms'),
+                            "first_token_time": row_dict.get('first_token_ms'),
+                            "rating": row_dict.get('rating'),
+                            "feedback": row_dict.get('feedback_text'),
+                            "model": row_dict.get('model_used'),
+                            "tokens": row_dict.get('tokens_used'),
+                            "cost": row_dict.get('cost_estimated'),
+                            "is_successful": row_dict.get('is_successful'),
+                            "created_at": row_dict.get('created_at')
+                        }
                     
-                    message = {
-                        "id": row_dict.get('dialog_id'),
-                        "question": row_dict.get('question'),
-                        "answer": row_dict.get('answer'),
-                        "response_time": row_dict.get('response_time_ms'),
-                        "rating": row_dict.get('rating'),
-                        "feedback": row_dict.get('feedback_text'),
-                        "model": row_dict.get('model_used'),
-                        "tokens": row_dict.get('tokens_used'),
-                        "cost": row_dict.get('cost_estimated'),
-                        "is_successful": row_dict.get('is_successful'),
-                        "created_at": row_dict.get('created_at')
-                    }
-                    
-                    messages.append(message)
+                        messages.append(message)
                 
-                print(f"DEBUG: Найдено сообщений: {len(messages)}")
-                return messages
+                    page["items"] = messages
+                    return page
                 
-        except Exception as e:
-            print(f"Ошибка при получении сообщений сессии: {e}")
-            import traceback
-            traceback.print_exc()  # Для детальной информации об ошибке
-            return []
-        finally:
-            connection.close()
\ No newline at end of file
+            except ValueError:
+                # Поврежденный курсор - ошибка клиента, пробрасываем
+                raise
+            except Exception as e:
+                print(f"Ошибка при получении сообщений сессии: {e}")
+                import traceback
+                traceback.print_exc()  # Для детальной информации об ошибке
+                return self._empty_page()
@@ -0,0 +1,264 @@
+# dialog_writer.py
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from core.file_lock import file_lock, process_alive
+
+
+logger = logging.getLogger(__name__)
+
+
+class DialogHistoryWriter:
+    """
+    Отложенная (write-behind) запись dialog_history.
+
+    Обработчики кладут записи в очередь через submit() и сразу отвечают
+    пользователю. Фоновый поток собирает записи в пачки и пишет их одним
+    многострочным INSERT, когда набралось batch_size записей или прошло
+    flush_interval секунд с первой записи пачки.
+
+    Если PostgreSQL недоступен или не успевает (очередь переполнена),
+    записи дописываются в локальный JSONL-файл (spill_path) с fsync и
+    позже досылаются в базу. При остановке очередь дописывается до конца.
+
+    Файл общий для воркеров gunicorn: дописывание и забор файла на досылку
+    идут под межпроцессной блокировкой (spill_path.lock), а досылает каждый
+    воркер из своего файла spill_path.replay.<pid>.
+    """
+
+    def __init__(
+        self,
+        db,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        spill_path: str = "dialog_history_spill.jsonl",
+        replay_interval: float = 30.0,
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.replay_interval = replay_interval
+
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._spill_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._last_replay = 0.0
+
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "last_flush_ms": 0.0,
+            "last_batch_size": 0,
+        }
+
+    def start(self):
+        """Запустить фоновый поток записи"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="DialogHistoryWriter", daemon=True)
+        self._thread.start()
+        logger.info(f"[DialogWriter] Запущен (batch_size={self.batch_size}, flush_interval={self.flush_interval} с)")
+
+    def stop(self, timeout: float = 30.0):
+        """Остановить поток, предварительно записав все, что осталось в очереди"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+        # Если поток не успел - сохраняем остаток в файл, чтобы ничего не потерять
+        leftovers = self._drain_nowait(self._queue.qsize())
+        if leftovers:
+            self._spill(leftovers)
+        logger.info("[DialogWriter] Остановлен")
+
+    def submit(self, record: Dict[str, Any]):
+        """Поставить диалог в очередь на запись (не блокирует)"""
+        record = dict(record)
+        # Время фиксируем в момент вопроса, а не в момент записи пачки
+        record.setdefault("created_at", datetime.now())
+
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # База не успевает разбирать очередь - сразу пишем в файл
+            logger.warning("[DialogWriter] Очередь переполнена, запись сохранена в резервный файл")
+            self._spill([record])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_size"] = self._queue.qsize()
+        stats["spill_file_exists"] = os.path.exists(self.spill_path)
+        return stats
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+            self._maybe_replay()
+
+        # Дописываем остаток очереди перед выходом
+        while True:
+            batch = self._drain_nowait(self.batch_size)
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _collect_batch(self) -> List[Dict[str, Any]]:
+        """Ждать первую запись, затем добирать пачку до batch_size или до истечения flush_interval"""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain_nowait(self, limit: int) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> bool:
+        started = time.perf_counter()
+        try:
+            inserted = self.db.add_dialog_history_batch(batch)
+        except Exception as e:
+            logger.error(f"[DialogWriter] Ошибка записи пачки из {len(batch)} диалогов: {e}")
+            with self._stats_lock:
+                self._stats["failed_batches"] += 1
+            self._spill(batch)
+            return False
+
+        flush_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats["written"] += inserted
+            self._stats["batches"] += 1
+            self._stats["last_flush_ms"] = round(flush_ms, 3)
+            self._stats["last_batch_size"] = len(batch)
+        return True
+
+    def _file_lock(self):
+        return file_lock(self.spill_path + ".lock")
+
+    def _spill(self, records: List[Dict[str, Any]]):
+        """Дописать записи в резервный файл (JSONL) с fsync"""
+        with self._spill_lock, self._file_lock():
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, default=self._json_default) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        with self._stats_lock:
+            self._stats["spilled"] += len(records)
+
+    def _maybe_replay(self):
+        """Периодически досылать записи из резервного файла в базу"""
+        now = time.monotonic()
+        if now - self._last_replay < self.replay_interval:
+            return
+        self._last_replay = now
+        self.replay_spill()
+
+    def replay_spill(self) -> int:
+        """
+        Отправить в базу записи из резервного файла.
+
+        Файл атомарно переименовывается (в файл этого процесса) перед
+        чтением, поэтому новые записи, попавшие в резерв во время досылки,
+        не теряются, а два воркера не досылают одно и то же.
+        Повторы безопасны: dialog_id с конфликтом пропускаются.
+        """
+        replay_path = f"{self.spill_path}.replay.{os.getpid()}"
+        with self._spill_lock, self._file_lock():
+            for path in glob.glob(glob.escape(self.spill_path) + ".replay*"):
+                # Остаток от прошлой неудачной попытки (своей или завершившегося воркера) - обратно в резерв
+                owner = path.rsplit(".", 1)[-1]
+                if path == replay_path or not owner.isdigit() or not process_alive(int(owner)):
+                    self._append_file(path, self.spill_path)
+            if not os.path.exists(self.spill_path):
+                return 0
+            os.replace(self.spill_path, replay_path)
+
+        replayed = 0
+        with open(replay_path, encoding="utf-8") as f:
+            batch = []
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                batch.append(json.loads(line))
+                if len(batch) >= self.batch_size:
+                    if not self._replay_batch(batch):
+                        return replayed
+                    replayed += len(batch)
+                    batch = []
+            if batch:
+                if not self._replay_batch(batch):
+                    return replayed
+                replayed += len(batch)
+
+        os.remove(replay_path)
+        with self._stats_lock:
+            self._stats["replayed"] += replayed
+        if replayed:
+            logger.info(f"[DialogWriter] Из резервного файла дозаписано диалогов: {replayed}")
+        return replayed
+
+    def _replay_batch(self, batch: List[Dict[str, Any]]) -> bool:
+        try:
+            self.db.add_dialog_history_batch(batch)
+            return True
+        except Exception as e:
+            # Файл .replay остается на диске и будет перенесен в резерв при следующей попытке
+            logger.warning(f"[DialogWriter] PostgreSQL все еще недоступен, досылка отложена: {e}")
+            return False
+
+    @staticmethod
+    def _append_file(source: str, target: str):
+        with open(source, encoding="utf-8") as src, open(target, "a", encoding="utf-8") as dst:
+            for line in src:
+                dst.write(line)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.remove(source)
+
+    @staticmethod
+    def _json_default(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value)
@@ -0,0 +1,228 @@
+# export.py
+'''
+Потоковая выгрузка dialog_history (NDJSON / CSV / Parquet).
+
+Строки читаются серверным именованным курсором пачками по batch_size,
+поэтому память не зависит от размера таблицы: в каждый момент в процессе
+находится только одна пачка.
+
+Пример:
+    for chunk in export_dialog_history(db, "ndjson", student_id="..."):
+        out.write(chunk)
+'''
+
+import csv
+import io
+import json
+import logging
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet - необязательный формат
+    pa = None
+    pq = None
+
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = [
+    "dialog_id", "student_id", "course_id", "session_id",
+    "question", "answer", "question_vector_id", "answer_vector_id",
+    "used_chunk_ids", "response_time_ms", "rating", "feedback_text",
+    "context_used", "model_used", "tokens_used", "cost_estimated",
+    "is_successful", "error_message", "user_agent", "ip_address", "first_token_ms", "created_at",
+]
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def iter_dialog_batches(
+    db,
+    student_id: Optional[str] = None,
+    course_id: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    batch_size: int = 1000,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Читать dialog_history пачками через именованный (серверный) курсор.
+
+    Соединение занято на все время чтения и возвращается в пул,
+    когда итератор исчерпан или закрыт.
+    """
+    conditions = []
+    params: List[Any] = []
+    if student_id:
+        conditions.append("student_id = %s::uuid")
+        params.append(str(student_id))
+    if course_id:
+        conditions.append("course_id = %s::uuid")
+        params.append(str(course_id))
+    if date_from:
+        conditions.append("created_at >= %s")
+        params.append(date_from)
+    if date_to:
+        conditions.append("created_at < %s")
+        params.append(date_to)
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with db.connection() as connection:
+        if not connection:
+            raise ConnectionError("Нет соединения с PostgreSQL")
+
+        # Имя курсора уникально в пределах соединения
+        cursor = connection.cursor(name=f"export_{uuid.uuid4().hex}")
+        cursor.itersize = batch_size
+        try:
+            cursor.execute(f"""
+                SELECT {", ".join(EXPORT_COLUMNS)}
+                FROM public.dialog_history
+                {where_sql}
+                ORDER BY created_at, dialog_id
+            """, params)
+
+            exported = 0
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                exported += len(rows)
+                yield [dict(zip(EXPORT_COLUMNS, row)) for row in rows]
+            logger.info(f"[Export] Выгружено диалогов: {exported}")
+        finally:
+            cursor.close()
+            connection.rollback()
+
+
+def export_dialog_history(db, fmt: str = "ndjson", batch_size: int = 1000, **filters) -> Iterator[bytes]:
+    """
+    Выгрузить dialog_history в заданном формате.
+
+    Args:
+        fmt: ndjson, csv или parquet
+        filters: student_id, course_id, date_from, date_to
+
+    Yields:
+        Куски файла (bytes) - по одному на пачку строк
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    if fmt == "parquet" and pa is None:
+        raise ValueError("Для выгрузки в Parquet нужен пакет pyarrow (pip install pyarrow)")
+
+    batches = iter_dialog_batches(db, batch_size=batch_size, **filters)
+    if fmt == "ndjson":
+        return _ndjson_chunks(batches)
+    if fmt == "csv":
+        return _csv_chunks(batches)
+    return _parquet_chunks(batches)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _ndjson_chunks(batches) -> Iterator[bytes]:
+    for batch in batches:
+        lines = [json.dumps(row, ensure_ascii=False, default=_json_default) for row in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _csv_chunks(batches) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        for row in batch:
+            writer.writerow([_csv_value(row[column]) for column in EXPORT_COLUMNS])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файл для ParquetWriter, который отдает записанные байты кусками"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_schema():
+    string = pa.string()
+    return pa.schema([
+        ("dialog_id", string), ("student_id", string), ("course_id", string), ("session_id", string),
+        ("question", string), ("answer", string), ("question_vector_id", string), ("answer_vector_id", string),
+        ("used_chunk_ids", string), ("response_time_ms", pa.int32()), ("rating", pa.int32()),
+        ("feedback_text", string), ("context_used", string), ("model_used", string),
+        ("tokens_used", pa.int32()), ("cost_estimated", pa.float64()), ("is_successful", pa.bool_()),
+        ("error_message", string), ("user_agent", string), ("ip_address", string),
+        ("first_token_ms", pa.int32()), ("created_at", pa.timestamp("us")),
+    ])
+
+
+def _parquet_chunks(batches) -> Iterator[bytes]:
+    schema = _parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for batch in batches:
+            columns = {column: [] for column in EXPORT_COLUMNS}
+            for row in batch:
+                for column in EXPORT_COLUMNS:
+                    value = row[column]
+                    if column == "used_chunk_ids" and value is not None:
+                        value = json.dumps(value, ensure_ascii=False)
+                    elif column == "cost_estimated" and value is not None:
+                        value = float(value)
+                    elif column == "ip_address" and value is not None:
+                        value = str(value)
+                    columns[column].append(value)
+            # Каждая пачка - отдельная row group
+            writer.write_table(pa.table(columns, schema=schema))
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.take()
@@ -0,0 +1,48 @@
+# pagination.py
+'''
+Курсоры для keyset-пагинации истории диалогов.
+
+Курсор - непрозрачная строка (base64url от JSON) с позицией последней
+или первой записи страницы: (created_at, dialog_id) и направлением.
+
+Записи упорядочены от новых к старым:
+    next - более старые записи (следующая страница)
+    prev - более новые записи (предыдущая страница)
+'''
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Tuple
+
+NEXT = "next"
+PREV = "prev"
+
+
+def encode_cursor(created_at: datetime, dialog_id, direction: str = NEXT) -> str:
+    """Собрать курсор из позиции записи (created_at в dialog_history - NOT NULL, см. schema.py)"""
+    payload = {"t": created_at.isoformat(), "id": str(dialog_id), "d": direction}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, str, str]:
+    """
+    Разобрать курсор.
+
+    Returns:
+        (created_at, dialog_id, direction)
+
+    Raises:
+        ValueError: если курсор поврежден
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        direction = payload.get("d", NEXT)
+        if direction not in (NEXT, PREV):
+            raise ValueError(f"Неизвестное направление: {direction}")
+        return datetime.fromisoformat(payload["t"]), str(payload["id"]), direction
+    except (KeyError, TypeError, AttributeError, UnicodeError, json.JSONDecodeError, binascii.Error) as e:
+        raise ValueError(f"Некорректный курсор: {e}") from e
@@ -0,0 +1,125 @@
+# pool.py
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from psycopg2 import pool as pg_pool
+
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(pg_pool.PoolError):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """
+    Пул соединений PostgreSQL поверх psycopg2.ThreadedConnectionPool.
+
+    В отличие от ThreadedConnectionPool, который сразу бросает PoolError
+    при исчерпании соединений, здесь поток ждет свободное соединение
+    (не дольше timeout секунд). Дополнительно собираются метрики
+    ожидания и выдачи соединений.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float = 10.0, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._connect_kwargs = connect_kwargs
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+
+        # Метрики
+        self._checkouts = 0
+        self._in_use = 0
+        self._timeouts = 0
+        self._broken = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._hold_total_ms = 0.0
+
+    @property
+    def is_open(self) -> bool:
+        return self._pool is not None and not self._pool.closed
+
+    def open(self):
+        """Создать пул и открыть minconn соединений"""
+        if self.is_open:
+            return
+        self._pool = pg_pool.ThreadedConnectionPool(self.minconn, self.maxconn, **self._connect_kwargs)
+        logger.info(f"[PGSQL] Пул соединений открыт (min={self.minconn}, max={self.maxconn})")
+
+    def close(self):
+        """Закрыть все соединения пула"""
+        if self._pool is not None and not self._pool.closed:
+            self._pool.closeall()
+            logger.info("[PGSQL] Пул соединений закрыт")
+        self._pool = None
+
+    @contextmanager
+    def connection(self):
+        """Взять соединение из пула на время блока with"""
+        if not self.is_open:
+            raise pg_pool.PoolError("Пул соединений не открыт")
+
+        wait_started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"Нет свободных соединений в пуле за {self.timeout} с")
+
+        try:
+            connection = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        wait_ms = (time.perf_counter() - wait_started) * 1000
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_total_ms += wait_ms
+            self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+
+        hold_started = time.perf_counter()
+        try:
+            yield connection
+        except Exception:
+            if not connection.closed:
+                connection.rollback()
+            raise
+        finally:
+            hold_ms = (time.perf_counter() - hold_started) * 1000
+            # Разорванные соединения не возвращаем в пул, а закрываем
+            broken = bool(connection.closed)
+            try:
+                self._pool.putconn(connection, close=broken)
+            finally:
+                with self._lock:
+                    self._in_use -= 1
+                    self._hold_total_ms += hold_ms
+                    if broken:
+                        self._broken += 1
+                self._slots.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Метрики пула: выдачи соединений, время ожидания и удержания"""
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "open": self.is_open,
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self._in_use,
+                "checkouts": checkouts,
+                "timeouts": self._timeouts,
+                "broken_connections": self._broken,
+                "wait_avg_ms": round(self._wait_total_ms / checkouts, 3) if checkouts else 0.0,
+                "wait_max_ms": round(self._wait_max_ms, 3),
+                "hold_avg_ms": round(self._hold_total_ms / checkouts, 3) if checkouts else 0.0,
+            }
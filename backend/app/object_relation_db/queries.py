@@ -0,0 +1,208 @@
+# queries.py
+'''
+Каталог именованных запросов к PostgreSQL.
+
+Каждый запрос объявляется один раз с типами параметров (uuid, timestamp,
+integer ...) и готовится на сервере через PREPARE при первом обращении
+на конкретном соединении. Дальше выполняется только EXECUTE, поэтому
+запрос не перепланируется, а сравнения идут по типизированным UUID
+и попадают в индексы.
+'''
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+from psycopg2.extensions import connection as PgConnection
+
+from object_relation_db.schema import ROLLUP_TABLES
+
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogConnection(PgConnection):
+    """Соединение, которое помнит, какие запросы уже подготовлены на сервере"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+
+class Query:
+    """Именованный запрос с типизированными параметрами ($1, $2 ...)"""
+
+    def __init__(self, name: str, sql: str, arg_types: Sequence[str] = ()):
+        self.name = name
+        self.sql = sql
+        self.arg_types = tuple(arg_types)
+
+    @property
+    def prepare_sql(self) -> str:
+        args = f"({', '.join(self.arg_types)})" if self.arg_types else ""
+        return f"PREPARE {self.name}{args} AS {self.sql}"
+
+    @property
+    def execute_sql(self) -> str:
+        if not self.arg_types:
+            return f"EXECUTE {self.name}"
+        return f"EXECUTE {self.name} ({', '.join(['%s'] * len(self.arg_types))})"
+
+
+# ---------- dialog_history: keyset-пагинация ----------
+
+STUDENT_HISTORY_COLUMNS = """
+    dialog_id, student_id, course_id, session_id, question, answer,
+    question_vector_id, answer_vector_id, used_chunk_ids, response_time_ms,
+    rating, feedback_text, context_used, model_used, tokens_used,
+    cost_estimated, is_successful, error_message, user_agent, ip_address,
+    first_token_ms, created_at
+"""
+
+SESSION_MESSAGES_COLUMNS = """
+    dialog_id, question, answer, response_time_ms, first_token_ms, rating, feedback_text,
+    model_used, tokens_used, cost_estimated, is_successful, created_at
+"""
+
+
+def _keyset_queries(prefix: str, columns: str, where: str, where_types: Tuple[str, ...]) -> List[Query]:
+    """
+    Три варианта запроса страницы: first (без курсора), next (старше курсора),
+    prev (новее курсора).
+
+    Условие по курсору записано как created_at <= X AND (created_at < X OR dialog_id < Y):
+    первая часть идет в условие индекса по created_at, вторая лишь отсекает
+    записи с одинаковым временем.
+    """
+    n = len(where_types)
+    at, did, lim = f"${n + 1}", f"${n + 2}", f"${n + 3}"
+    select = f"SELECT {columns} FROM public.dialog_history WHERE {where}"
+
+    return [
+        Query(
+            f"{prefix}_first",
+            f"{select} ORDER BY created_at DESC, dialog_id DESC LIMIT ${n + 1}",
+            where_types + ("integer",),
+        ),
+        Query(
+            f"{prefix}_next",
+            f"{select} AND created_at <= {at} AND (created_at < {at} OR dialog_id < {did})"
+            f" ORDER BY created_at DESC, dialog_id DESC LIMIT {lim}",
+            where_types + ("timestamp", "uuid", "integer"),
+        ),
+        Query(
+            f"{prefix}_prev",
+            f"{select} AND created_at >= {at} AND (created_at > {at} OR dialog_id > {did})"
+            f" ORDER BY created_at ASC, dialog_id ASC LIMIT {lim}",
+            where_types + ("timestamp", "uuid", "integer"),
+        ),
+    ]
+
+
+QUERIES: List[Query] = [
+    *_keyset_queries("student_history", STUDENT_HISTORY_COLUMNS, "student_id = $1", ("uuid",)),
+    *_keyset_queries("session_messages", SESSION_MESSAGES_COLUMNS, "session_id = $1", ("uuid",)),
+    *_keyset_queries(
+        "session_student_messages", SESSION_MESSAGES_COLUMNS,
+        "session_id = $1 AND student_id = $2", ("uuid", "uuid"),
+    ),
+    Query(
+        "conversations_summary",
+        """
+        SELECT session_id::text AS id, title, last_question, last_answer,
+               message_count, created_at, updated_at
+        FROM public.conversation_summaries
+        WHERE student_id = $1
+        ORDER BY updated_at DESC
+        LIMIT $2
+        """,
+        ("uuid", "integer"),
+    ),
+    *[
+        Query(
+            f"rollup_{granularity}",
+            f"""
+            SELECT bucket, course_id::text AS course_id, model_used, request_count, success_count,
+                   latency_avg_ms, latency_p50_ms, latency_p95_ms, latency_p99_ms,
+                   tokens_used, cost_estimated
+            FROM public.{table}
+            WHERE bucket >= $1 AND ($2::uuid IS NULL OR course_id = $2)
+            ORDER BY bucket DESC, course_id, model_used
+            """,
+            ("timestamp", "uuid"),
+        )
+        for granularity, table in ROLLUP_TABLES.items()
+    ],
+]
+
+
+class QueryCatalog:
+    """Выполнение запросов каталога с PREPARE на соединение и счетчиками задержек"""
+
+    def __init__(self, queries: Sequence[Query] = QUERIES):
+        self.queries: Dict[str, Query] = {q.name: q for q in queries}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {
+            name: {"calls": 0, "errors": 0, "prepares": 0, "total_ms": 0.0, "max_ms": 0.0}
+            for name in self.queries
+        }
+
+    def execute(self, cursor, name: str, params: Sequence[Any] = ()):
+        """
+        Выполнить запрос каталога на курсоре.
+
+        Если соединение еще не видело этот запрос, он сначала готовится
+        через PREPARE (один раз на соединение пула).
+        """
+        query = self.queries[name]
+        connection = cursor.connection
+        prepared = getattr(connection, "prepared_statements", None)
+
+        started = time.perf_counter()
+        try:
+            if prepared is None:
+                # Соединение не из каталога - подготовить негде, выполняем как есть
+                cursor.execute(self._inline_sql(query), {f"p{i}": v for i, v in enumerate(params, 1)})
+            else:
+                if name not in prepared:
+                    cursor.execute(query.prepare_sql)
+                    prepared.add(name)
+                    with self._lock:
+                        self._stats[name]["prepares"] += 1
+                cursor.execute(query.execute_sql, params)
+        except Exception:
+            with self._lock:
+                self._stats[name]["errors"] += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                stats = self._stats[name]
+                stats["calls"] += 1
+                stats["total_ms"] += elapsed_ms
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Счетчики по каждому запросу: вызовы, ошибки, PREPARE, средняя и максимальная задержка"""
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                calls = stats["calls"]
+                result[name] = {
+                    "calls": calls,
+                    "errors": stats["errors"],
+                    "prepares": stats["prepares"],
+                    "avg_ms": round(stats["total_ms"] / calls, 3) if calls else 0.0,
+                    "max_ms": round(stats["max_ms"], 3),
+                }
+            return result
+
+    @staticmethod
+    def _inline_sql(query: Query) -> str:
+        """$1, $2 ... -> %(p1)s::type для обычного параметризованного запроса"""
+        sql = query.sql
+        # С конца, чтобы $1 не задел $10
+        for i in range(len(query.arg_types), 0, -1):
+            sql = sql.replace(f"${i}", f"%(p{i})s::{query.arg_types[i - 1]}")
+        return sql
@@ -0,0 +1,70 @@
+# rollups.py
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class RollupRefresher:
+    """
+    Фоновый пересчет агрегатов аналитики (dialog_rollup_hourly / daily).
+
+    При записи диалогов часы с новыми строками отмечаются в
+    dialog_rollup_dirty; раз в interval секунд поток пересчитывает
+    агрегаты только по этим часам и их дням.
+    """
+
+    def __init__(self, db, interval: float = 60.0):
+        self.db = db
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._runs = 0
+        self._last_run: Optional[datetime] = None
+        self._last_duration_ms = 0.0
+        self._last_refreshed_hours = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="RollupRefresher", daemon=True)
+        self._thread.start()
+        logger.info(f"[Rollups] Пересчет агрегатов запущен (каждые {self.interval} с)")
+
+    def stop(self, timeout: float = 30.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def refresh(self) -> int:
+        """Пересчитать агрегаты сейчас"""
+        started = time.perf_counter()
+        refreshed = self.db.refresh_dialog_rollups()
+        self._runs += 1
+        self._last_run = datetime.now()
+        self._last_duration_ms = (time.perf_counter() - started) * 1000
+        self._last_refreshed_hours = refreshed
+        return refreshed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self._runs,
+            "last_run": self._last_run,
+            "last_duration_ms": round(self._last_duration_ms, 3),
+            "last_refreshed_hours": self._last_refreshed_hours,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"[Rollups] Ошибка пересчета агрегатов: {e}")
+            self._stop.wait(self.interval)
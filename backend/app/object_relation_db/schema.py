@@ -0,0 +1,103 @@
+# schema.py
+'''
+Дополнительные объекты схемы, которые приложение создает само при старте.
+
+Основная таблица dialog_history описана в дампе bk_dialog_history.sql.
+Здесь только то, что добавлено поверх нее; все выражения идемпотентны.
+'''
+
+# Заголовок беседы: первые 3 слова первого вопроса (и "..." если слов больше)
+CONVERSATION_TITLE_SQL = """
+    COALESCE(
+        NULLIF(
+            array_to_string((regexp_split_to_array(btrim({question}), '\\s+'))[1:3], ' ')
+            || CASE WHEN array_length(regexp_split_to_array(btrim({question}), '\\s+'), 1) > 3
+                    THEN '...' ELSE '' END,
+            ''
+        ),
+        'Диалог ' || left({session_id}::text, 8)
+    )
+"""
+
+# Ключ "без курса" в таблицах агрегатов (course_id входит в первичный ключ)
+NO_COURSE_ID = "00000000-0000-0000-0000-000000000000"
+
+ROLLUP_TABLES = {
+    "hour": "dialog_rollup_hourly",
+    "day": "dialog_rollup_daily",
+}
+
+
+def _rollup_table_sql(table: str) -> str:
+    return f"""
+    CREATE TABLE IF NOT EXISTS public.{table} (
+        bucket timestamp without time zone NOT NULL,
+        course_id uuid NOT NULL,
+        model_used character varying(100) NOT NULL,
+        request_count integer NOT NULL,
+        success_count integer NOT NULL,
+        latency_avg_ms double precision,
+        latency_p50_ms double precision,
+        latency_p95_ms double precision,
+        latency_p99_ms double precision,
+        tokens_used bigint NOT NULL DEFAULT 0,
+        cost_estimated numeric(14,6) NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, course_id, model_used)
+    )
+    """
+
+
+SCHEMA_STATEMENTS = [
+    # Время до первого токена при потоковой генерации ответа
+    """
+    ALTER TABLE public.dialog_history ADD COLUMN IF NOT EXISTS first_token_ms integer
+    """,
+    # Курсоры пагинации и агрегаты опираются на created_at: строки без времени
+    # (старые данные) получают 'epoch' - в списках они оказываются самыми старыми,
+    # как и при NULLS LAST, - а столбец становится NOT NULL. Проверка по
+    # information_schema, чтобы не сканировать таблицу при каждом запуске
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'dialog_history'
+              AND column_name = 'created_at' AND is_nullable = 'YES'
+        ) THEN
+            UPDATE public.dialog_history SET created_at = 'epoch' WHERE created_at IS NULL;
+            ALTER TABLE public.dialog_history ALTER COLUMN created_at SET NOT NULL;
+        END IF;
+    END
+    $$
+    """,
+    # Keyset-пагинация сообщений беседы: (session_id, created_at, dialog_id)
+    """
+    CREATE INDEX IF NOT EXISTS idx_dialog_session_created
+        ON public.dialog_history USING btree (session_id, created_at DESC, dialog_id DESC)
+    """,
+    # Проекция "список бесед": одна строка на session_id, обновляется при записи диалога
+    """
+    CREATE TABLE IF NOT EXISTS public.conversation_summaries (
+        session_id uuid PRIMARY KEY,
+        student_id uuid NOT NULL,
+        title text NOT NULL,
+        last_question text,
+        last_answer text,
+        message_count integer NOT NULL DEFAULT 0,
+        created_at timestamp without time zone NOT NULL,
+        updated_at timestamp without time zone NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_conversation_summaries_student
+        ON public.conversation_summaries USING btree (student_id, updated_at DESC)
+    """,
+    # Агрегаты для аналитики по часам и дням (курс x модель)
+    *[_rollup_table_sql(table) for table in ROLLUP_TABLES.values()],
+    # Часы, в которые записаны новые диалоги и агрегаты по которым нужно пересчитать
+    """
+    CREATE TABLE IF NOT EXISTS public.dialog_rollup_dirty (
+        bucket timestamp without time zone PRIMARY KEY
+    )
+    """,
+]
@@ -0,0 +1,172 @@
+# context_packer.py
+'''
+Сборка контекста для LLM в пределах бюджета токенов.
+
+Чанки выбираются жадно по maximal marginal relevance:
+    lambda * sim(запрос, чанк) - (1 - lambda) * max sim(чанк, уже выбранные)
+Косинусы считаются матрично по векторам, которые уже пришли из поиска,
+и почти повторяющиеся чанки (косинус с уже выбранным >= redundancy_threshold)
+в контекст не попадают вовсе. Чанк, который не влезает
+целиком, обрезается по границе предложения; если не влезает даже первое
+предложение, он пропускается.
+
+Токены считаются приближенно (символы / CHARS_PER_TOKEN): токенизатор
+GigaChat локально недоступен. Можно передать свой token_counter.
+'''
+
+import logging
+import math
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_db.embedding_service import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+# Среднее число символов на токен GigaChat для русского текста
+CHARS_PER_TOKEN = 3.5
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+class PackedContext:
+    """Собранный контекст: текст, ID вошедших чанков и счетчики токенов"""
+
+    def __init__(self, text: str = "", candidate_tokens: int = 0):
+        self.text = text
+        self.chunk_ids: List[str] = []
+        self.tokens = 0
+        self.candidate_tokens = candidate_tokens
+        self.truncated = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        """Сколько токенов сэкономлено против склейки всех кандидатов"""
+        return max(0, self.candidate_tokens - self.tokens)
+
+
+class ContextPacker:
+    """MMR-отбор чанков под бюджет токенов"""
+
+    SEPARATOR = "\n"
+
+    def __init__(self, max_tokens: int = 1500, mmr_lambda: float = 0.7, redundancy_threshold: float = 0.95,
+                 token_counter: Callable[[str], int] = estimate_tokens,
+                 text_getter: Optional[Callable[[Any], str]] = None):
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.redundancy_threshold = redundancy_threshold
+        self.token_counter = token_counter
+        self.text_getter = text_getter or (lambda hit: str((hit.payload or {}).get("text", "")))
+
+        self._requests = 0
+        self._tokens_saved_total = 0
+        self._redundant_dropped = 0
+        self._tokens_used = Histogram([100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000])
+        self._tokens_saved = Histogram([0, 50, 100, 250, 500, 1000, 2000, 4000])
+
+    def _order(self, query_vector, hits) -> List[Tuple[int, float]]:
+        """
+        Порядок кандидатов по MMR: (индекс, макс. косинус с выбранными ранее).
+        Без векторов - исходный порядок.
+        """
+        vectors = [getattr(hit, "vector", None) for hit in hits]
+        if query_vector is None or any(v is None or isinstance(v, dict) for v in vectors):
+            return [(i, 0.0) for i in range(len(hits))]
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        relevance = matrix @ query
+        similarity = matrix @ matrix.T
+        redundancy = np.full(len(hits), -np.inf, dtype=np.float32)
+        remaining = np.ones(len(hits), dtype=bool)
+
+        order = []
+        for _ in range(len(hits)):
+            penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+            score = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * penalty
+            score[~remaining] = -np.inf
+            chosen = int(np.argmax(score))
+            order.append((chosen, float(penalty[chosen])))
+            remaining[chosen] = False
+            redundancy = np.maximum(redundancy, similarity[:, chosen])
+        return order
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """Начало текста из целых предложений в пределах budget токенов"""
+        kept = []
+        for sentence in _SENTENCE_END_RE.split(text):
+            candidate = " ".join(kept + [sentence])
+            if self.token_counter(candidate) > budget:
+                break
+            kept.append(sentence)
+        return " ".join(kept)
+
+    def pack(self, query_vector, hits, max_tokens: Optional[int] = None) -> PackedContext:
+        """
+        Собрать контекст из hits (объекты с id, payload и, желательно, vector).
+
+        Args:
+            query_vector: эмбеддинг запроса (для MMR)
+            hits: кандидаты в порядке релевантности
+            max_tokens: бюджет (по умолчанию из конструктора)
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        texts = [self.text_getter(hit) for hit in hits]
+        separator_tokens = self.token_counter(self.SEPARATOR)
+        result = PackedContext(
+            text="",
+            candidate_tokens=self.token_counter(self.SEPARATOR.join(t for t in texts if t)),
+        )
+
+        parts = []
+        used = 0
+        for index, redundancy in self._order(query_vector, hits):
+            text = texts[index].strip()
+            if not text:
+                continue
+            if redundancy >= self.redundancy_threshold:
+                self._redundant_dropped += 1
+                continue
+            available = budget - used - (separator_tokens if parts else 0)
+            if available <= 0:
+                break
+            tokens = self.token_counter(text)
+            if tokens > available:
+                text = self._truncate(text, available)
+                if not text:
+                    continue
+                tokens = self.token_counter(text)
+                result.truncated += 1
+            parts.append(text)
+            result.chunk_ids.append(str(hits[index].id))
+            used += tokens + (separator_tokens if len(parts) > 1 else 0)
+
+        result.text = self.SEPARATOR.join(parts)
+        result.tokens = self.token_counter(result.text)
+
+        self._requests += 1
+        self._tokens_saved_total += result.tokens_saved
+        self._tokens_used.observe(result.tokens)
+        self._tokens_saved.observe(result.tokens_saved)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self._requests,
+            "max_tokens": self.max_tokens,
+            "tokens_saved_total": self._tokens_saved_total,
+            "redundant_dropped": self._redundant_dropped,
+            "tokens_used": self._tokens_used.snapshot(),
+            "tokens_saved": self._tokens_saved.snapshot(),
+        }
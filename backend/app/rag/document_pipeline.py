@@ -0,0 +1,355 @@
+# document_pipeline.py
+'''
+Обработка загруженных документов: файл -> текст -> чанки -> эмбеддинги -> Qdrant.
+
+Загрузка копируется на диск кусками (размер считается по ходу), после чего
+запрос сразу возвращает документ со статусом processing. Извлечение текста
+(PDF / DOCX / TXT), разбиение на чанки по токенам энкодера с отсевом
+почти-дубликатов и кодирование идут в пуле процессов,
+запись в Qdrant - в потоке, поэтому event loop не блокируется. Одновременно
+обрабатывается не больше max_workers документов; каждый процесс пула
+держит свою копию энкодера.
+
+Статусы документа: processing -> processed | failed.
+
+Реестр документов - JSON-файлы в {upload_dir}/.registry, общие для всех
+воркеров gunicorn на узле: статус документа виден из любого воркера,
+а документ, воркер-обработчик которого завершился, помечается failed.
+'''
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.file_lock import process_alive
+
+
+logger = logging.getLogger(__name__)
+
+STATUS_PROCESSING = "processing"
+STATUS_PROCESSED = "processed"
+STATUS_FAILED = "failed"
+
+TEXT_ENCODINGS = ("utf-8-sig", "cp1251")
+
+_DOCUMENT_ID_RE = re.compile(r"^doc_[0-9a-f]{8}$")
+
+
+def extract_text(path: str, content_type: Optional[str] = None) -> str:
+    """Текст документа PDF / DOCX / TXT"""
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".pdf" or content_type == "application/pdf":
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ValueError("Для PDF нужен пакет pypdf (pip install pypdf)")
+        reader = PdfReader(path)
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+    if extension == ".docx" or content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+        try:
+            import docx
+        except ImportError:
+            raise ValueError("Для DOCX нужен пакет python-docx (pip install python-docx)")
+        return "\n\n".join(paragraph.text for paragraph in docx.Document(path).paragraphs)
+
+    if extension in (".txt", ".md") or (content_type or "").startswith("text/"):
+        with open(path, "rb") as f:
+            data = f.read()
+        for encoding in TEXT_ENCODINGS:
+            try:
+                return data.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        return data.decode("utf-8", errors="replace")
+
+    raise ValueError(f"Неподдерживаемый тип документа: {content_type or extension}")
+
+
+def process_document(path: str, content_type: Optional[str], model_name: Optional[str],
+                     chunk_tokens: Optional[int], overlap: int) -> Tuple[List[str], np.ndarray]:
+    """
+    Выполняется в процессе пула: извлечь текст, разбить на чанки по токенам
+    энкодера, отбросить почти-дубликаты (колонтитулы, повторы) и закодировать.
+    """
+    from vector_db.chunking import MinHashDeduplicator, TokenChunker
+    from vector_db.model_registry import get_encoder
+
+    text = extract_text(path, content_type)
+
+    # Процесс пула запускается через spawn и загружает модель сам при первом
+    # документе; дальше она берется из реестра процесса
+    encoder = get_encoder(model_name=model_name)
+
+    chunks = []
+    chunker = TokenChunker.for_encoder(encoder, overlap=overlap, max_tokens=chunk_tokens)
+    deduplicator = MinHashDeduplicator()
+    # Абзацы режутся отдельно, чтобы окно не склеивало несвязанные куски
+    for paragraph in text.split("\n\n"):
+        for chunk in chunker.split(paragraph):
+            if not deduplicator.is_duplicate(chunk):
+                chunks.append(chunk)
+    if not chunks:
+        raise ValueError("В документе не найден текст")
+
+    vectors = encoder.encode(chunks, batch_size=64, convert_to_numpy=True, show_progress_bar=False)
+    return chunks, vectors.astype(np.float32)
+
+
+class DocumentPipeline:
+    """Реестр загруженных документов и их фоновая обработка"""
+
+    # Размер куска при копировании загрузки на диск
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(
+        self,
+        upload_dir: str = "uploads",
+        collection_name: str = "test_db1",
+        model_name: Optional[str] = None,  # None - модель и бэкенд из EmbeddingSettings
+        max_workers: int = 1,
+        chunk_tokens: Optional[int] = None,
+        chunk_overlap: int = 32,
+    ):
+        self.upload_dir = upload_dir
+        self.collection_name = collection_name
+        self.model_name = model_name
+        self.max_workers = max_workers
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+
+        # Вызывается с ID документа, когда его чанки записаны в Qdrant или удалены
+        self.on_change: Optional[Callable[[str], None]] = None
+        # Индекс BM25 гибридного поиска, если он уже создан (обновляется вместе с Qdrant)
+        self.lexical_index = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+        self._client = None
+
+    @property
+    def registry_dir(self) -> str:
+        return os.path.join(self.upload_dir, ".registry")
+
+    def _meta_path(self, document_id: str) -> str:
+        return os.path.join(self.registry_dir, f"{document_id}.json")
+
+    def _save(self, document: Dict[str, Any], create: bool = False) -> bool:
+        """
+        Записать документ в реестр (атомарно). Без create запись только обновляется:
+        документ, удаленный из другого воркера, не появляется снова.
+        """
+        path = self._meta_path(document["id"])
+        if not create and not os.path.exists(path):
+            return False
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, default=lambda value: value.isoformat())
+        os.replace(tmp_path, path)
+        return True
+
+    def _load(self, document_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._meta_path(document_id), encoding="utf-8") as f:
+                document = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        document["uploaded_at"] = datetime.fromisoformat(document["uploaded_at"])
+        if document["status"] == STATUS_PROCESSING and not process_alive(document.get("worker_pid", 0)):
+            document["status"] = STATUS_FAILED
+            document["error"] = "Обработка прервана: процесс-обработчик завершился"
+            self._save(document)
+        return document
+
+    def start(self):
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.registry_dir, exist_ok=True)
+        # spawn, а не fork: воркер держит потоки (запись истории, пулы поиска,
+        # OpenMP/ONNX Runtime), и fork копирует их блокировки в захваченном состоянии.
+        # Цена - своя копия энкодера в каждом процессе пула (процессы запускаются
+        # при первых документах), поэтому по умолчанию процесс один
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+
+    def memory_report(self) -> List[Dict[str, Any]]:
+        """Память процессов пула (в каждом - своя копия энкодера)"""
+        from vector_db.model_registry import process_memory
+
+        processes = getattr(self._executor, "_processes", None) or {}
+        return [{"pid": pid, "memory_mb": process_memory(pid)} for pid in list(processes)]
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from qdrant_client import QdrantClient
+            self._client = QdrantClient(
+                host=os.getenv("QDRANT_HOST", "localhost"),
+                port=int(os.getenv("QDRANT_PORT", "6333")),
+                timeout=30,
+            )
+        return self._client
+
+    async def upload(self, file) -> Dict[str, Any]:
+        """
+        Сохранить загруженный файл (UploadFile) на диск и поставить в очередь обработки.
+
+        Возвращает запись документа со статусом processing, не дожидаясь обработки.
+        """
+        document_id = f"doc_{uuid.uuid4().hex[:8]}"
+        filename = os.path.basename(file.filename or document_id)
+        path = os.path.join(self.upload_dir, f"{document_id}_{filename}")
+
+        size = 0
+        with open(path, "wb") as out:
+            while True:
+                chunk = await file.read(self.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await asyncio.to_thread(out.write, chunk)
+                size += len(chunk)
+
+        document = {
+            "id": document_id,
+            "filename": filename,
+            "size": size,
+            "uploaded_at": datetime.now(),
+            "status": STATUS_PROCESSING,
+            "content_type": file.content_type,
+            "chunks": None,
+            "error": None,
+            "path": path,
+            "worker_pid": os.getpid(),
+        }
+        self._save(document, create=True)
+
+        task = asyncio.create_task(self._process(document))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return document
+
+    async def _process(self, document: Dict[str, Any]):
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            try:
+                chunks, vectors = await loop.run_in_executor(
+                    self._executor, process_document,
+                    document["path"], document["content_type"], self.model_name,
+                    self.chunk_tokens, self.chunk_overlap,
+                )
+                await asyncio.to_thread(self._upsert_chunks, document, chunks, vectors)
+            except asyncio.CancelledError:
+                document["status"] = STATUS_FAILED
+                document["error"] = "Обработка прервана остановкой сервера"
+                self._save(document)
+                raise
+            except Exception as e:
+                logger.error(f"[Documents] Ошибка обработки {document['filename']}: {e}")
+                document["status"] = STATUS_FAILED
+                document["error"] = str(e)
+                self._save(document)
+                return
+
+            document["chunks"] = len(chunks)
+            document["status"] = STATUS_PROCESSED
+            if self._save(document):
+                logger.info(f"[Documents] {document['filename']}: {len(chunks)} чанков в Qdrant")
+            else:
+                # Документ удалили (возможно, из другого воркера), пока шла запись
+                await asyncio.to_thread(self._delete_points, document["id"], len(chunks))
+            if self.on_change is not None:
+                self.on_change(document["id"])
+
+    def _upsert_chunks(self, document: Dict[str, Any], chunks: List[str], vectors: np.ndarray):
+        if not os.path.exists(self._meta_path(document["id"])):
+            # Документ удалили, пока он обрабатывался
+            return
+        from qdrant_client.models import PointStruct
+        from vector_db.ingestion import ORIGIN_DOCUMENT, point_id
+
+        points = [
+            PointStruct(
+                id=point_id(document["id"], str(i)),
+                vector=vector.tolist(),
+                payload={
+                    "text": chunk,
+                    "source": document["filename"],
+                    "document_id": document["id"],
+                    "chunk_index": i,
+                    "origin": ORIGIN_DOCUMENT,
+                },
+            )
+            for i, (chunk, vector) in enumerate(zip(chunks, vectors))
+        ]
+        for i in range(0, len(points), 256):
+            self.client.upsert(self.collection_name, points=points[i:i + 256], wait=True)
+        if self.lexical_index is not None:
+            self.lexical_index.add_points(points)
+
+    def _delete_points(self, document_id: str, chunks: int):
+        from qdrant_client.http import models
+
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=models.FilterSelector(filter=models.Filter(must=[
+                models.FieldCondition(key="document_id", match=models.MatchValue(value=document_id)),
+            ])),
+        )
+        if self.lexical_index is not None:
+            from vector_db.ingestion import point_id
+            self.lexical_index.remove_points(point_id(document_id, str(i)) for i in range(chunks))
+
+    async def delete(self, document_id: str) -> bool:
+        """Удалить документ, его файл и его чанки из Qdrant"""
+        document = self.get(document_id)
+        if document is None:
+            return False
+
+        def cleanup():
+            for path in (self._meta_path(document_id), document["path"]):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            # По фильтру, а не по статусу: после сбоя или прерванной обработки
+            # в коллекции могут остаться записанные чанки
+            self._delete_points(document_id, document["chunks"] or 0)
+
+        await asyncio.to_thread(cleanup)
+        if document["status"] == STATUS_PROCESSED and self.on_change is not None:
+            self.on_change(document_id)
+        return True
+
+    def list(self) -> List[Dict[str, Any]]:
+        try:
+            names = sorted(os.listdir(self.registry_dir))
+        except FileNotFoundError:
+            return []
+        documents = [self._load(name[:-len(".json")]) for name in names if name.endswith(".json")]
+        return sorted((d for d in documents if d is not None), key=lambda d: d["uploaded_at"])
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        if not _DOCUMENT_ID_RE.match(document_id):
+            return None
+        return self._load(document_id)
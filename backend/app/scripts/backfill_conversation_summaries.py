@@ -0,0 +1,15 @@
+'''
+Пересчет проекции conversation_summaries по всей dialog_history.
+
+Запуск из папки app:
+    python -m scripts.backfill_conversation_summaries
+'''
+
+from object_relation_db.database import DataBase
+
+
+if __name__ == "__main__":
+    db = DataBase()
+    db.ensure_schema()
+    rebuilt = db.backfill_conversation_summaries()
+    print(f"[PGSQL] Пересчитано бесед: {rebuilt}")
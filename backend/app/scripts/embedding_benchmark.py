@@ -0,0 +1,89 @@
+'''
+Сравнение бэкендов эмбеддингов: время загрузки, память, скорость кодирования.
+
+Запуск из папки app:
+    python -m scripts.embedding_benchmark
+    python -m scripts.embedding_benchmark --backends torch,onnx-int8 --texts 2000 --threads 4
+
+Каждый бэкенд меряется в отдельном процессе, чтобы время холодной
+загрузки и RSS не зависели от уже загруженных библиотек:
+    load_s        - импорт библиотек и загрузка модели
+    rss_mb        - RSS процесса после загрузки и прогрева
+    throughput    - текстов в секунду при кодировании пачками (загрузка в Qdrant)
+    query_p50/p99 - задержка кодирования одного запроса (как в чате)
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def measure(backend, texts_count, batch_size, queries):
+    started = time.perf_counter()
+    from vector_db.embedding_backends import load_encoder
+    from vector_db.model_registry import process_memory
+    encoder = load_encoder(backend)
+    load_s = time.perf_counter() - started
+
+    from scripts.embedding_parity import SAMPLE_TEXTS
+    texts = [f"{SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]} ({i})" for i in range(texts_count)]
+    encoder.encode(texts[:batch_size], batch_size=batch_size)  # прогрев
+
+    started = time.perf_counter()
+    encoder.encode(texts, batch_size=batch_size)
+    throughput = texts_count / (time.perf_counter() - started)
+
+    latencies = []
+    for i in range(queries):
+        started = time.perf_counter()
+        encoder.encode([texts[i % len(texts)]], batch_size=1)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "rss_mb": process_memory()["rss"],
+        "throughput": round(throughput, 1),
+        "query_p50_ms": round(latencies[len(latencies) // 2], 2),
+        "query_p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов эмбеддингов")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=None, help="EMBEDDING_THREADS для ONNX Runtime")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.texts, args.batch_size, args.queries)))
+        sys.exit(0)
+
+    env = dict(os.environ)
+    if args.threads is not None:
+        env["EMBEDDING_THREADS"] = str(args.threads)
+
+    rows = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        result = subprocess.run(
+            [sys.executable, "-m", "scripts.embedding_benchmark", "--worker", backend,
+             "--texts", str(args.texts), "--batch-size", str(args.batch_size), "--queries", str(args.queries)],
+            capture_output=True, text=True, env=env,
+        )
+        if result.returncode != 0:
+            print(f"[Bench] {backend}: ошибка\n{result.stderr.strip()[-2000:]}")
+            continue
+        rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'бэкенд':<10} {'загрузка, с':<12} {'RSS, МБ':<9} {'текстов/с':<10} {'запрос p50, мс':<15} {'p99, мс'}")
+    for row in rows:
+        print(f"{row['backend']:<10} {row['load_s']:<12} {row['rss_mb']:<9} {row['throughput']:<10} "
+              f"{row['query_p50_ms']:<15} {row['query_p99_ms']}")
@@ -0,0 +1,89 @@
+'''
+Проверка совпадения эмбеддингов ONNX-бэкендов с моделью на PyTorch.
+
+Запуск из папки app (после python -m scripts.export_onnx):
+    python -m scripts.embedding_parity
+    python -m scripts.embedding_parity --file KnowlengeBase.xlsx --limit 500 --min-cosine-int8 0.98
+
+Для каждого текста считается косинус между вектором бэкенда и вектором
+PyTorch; кроме того, сравниваются ближайшие соседи каждого текста среди
+остальных (доля совпавших top-k). Код выхода 1, если минимальный косинус
+ниже порога - так проверку можно запускать перед переключением бэкенда.
+'''
+
+import argparse
+import sys
+
+import numpy as np
+
+from vector_db.embedding_backends import load_encoder
+from vector_db.ingestion import iter_rows, row_to_text
+
+
+SAMPLE_TEXTS = [
+    "Когда заканчивается прием курсовых работ?",
+    "Расписание экзаменов на зимнюю сессию",
+    "Как восстановить пароль от личного кабинета студента?",
+    "Машинное обучение - подраздел искусственного интеллекта.",
+    "Нейронные сети состоят из слоев взаимосвязанных узлов.",
+    "Python is a popular language for data analysis.",
+    "Стипендия начисляется до 25 числа каждого месяца.",
+    "Где найти методические указания по лабораторной работе №3?",
+    "Пересдача назначается не ранее чем через неделю после экзамена.",
+    "Код ошибки E1234 при загрузке задания в систему",
+]
+
+
+def load_texts(path, limit):
+    if not path:
+        return SAMPLE_TEXTS
+    texts = []
+    for row in iter_rows(path):
+        text = row_to_text(row).strip()
+        if text:
+            texts.append(text)
+        if len(texts) >= limit:
+            break
+    return texts
+
+
+def neighbours(vectors, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarity = normed @ normed.T
+    np.fill_diagonal(similarity, -np.inf)
+    return np.argsort(-similarity, axis=1)[:, :k]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Совпадение эмбеддингов ONNX и PyTorch")
+    parser.add_argument("--file", default=None, help="xlsx/csv базы знаний (по умолчанию встроенные примеры)")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--backends", default="onnx,onnx-int8")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--min-cosine", type=float, default=0.999, help="порог для onnx")
+    parser.add_argument("--min-cosine-int8", type=float, default=0.98, help="порог для onnx-int8")
+    args = parser.parse_args()
+
+    texts = load_texts(args.file, args.limit)
+    reference = np.asarray(load_encoder("torch").encode(texts, batch_size=32), dtype=np.float32)
+    k = min(args.top_k, len(texts) - 1)
+    reference_neighbours = neighbours(reference, k)
+    print(f"[Parity] {len(texts)} текстов, эталон - PyTorch")
+
+    failed = False
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        vectors = np.asarray(load_encoder(backend).encode(texts, batch_size=32), dtype=np.float32)
+        cosine = np.sum(vectors * reference, axis=1) / (
+            np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        overlap = np.mean([
+            len(set(a) & set(b)) / k for a, b in zip(neighbours(vectors, k), reference_neighbours)
+        ]) if k > 0 else 1.0
+        threshold = args.min_cosine_int8 if backend == "onnx-int8" else args.min_cosine
+        ok = cosine.min() >= threshold
+        failed = failed or not ok
+        print(f"[Parity] {backend:<10} косинус min={cosine.min():.5f} mean={cosine.mean():.5f} "
+              f"p1={np.percentile(cosine, 1):.5f}; совпадение top-{k} соседей {overlap:.3f}; "
+              f"порог {threshold} - {'OK' if ok else 'НЕ ПРОЙДЕН'}")
+
+    sys.exit(1 if failed else 0)
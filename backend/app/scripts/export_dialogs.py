@@ -0,0 +1,54 @@
+'''
+Выгрузка истории диалогов из PostgreSQL в файл.
+
+Запуск из папки app:
+    python -m scripts.export_dialogs --format csv --output dialogs.csv
+    python -m scripts.export_dialogs --format parquet --course-id <uuid> --date-from 2025-09-01 -o dialogs.parquet
+
+Строки читаются серверным курсором пачками, память не зависит от размера таблицы.
+'''
+
+import argparse
+import sys
+from datetime import datetime
+
+from object_relation_db.database import DataBase
+from object_relation_db.export import FORMATS, export_dialog_history
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Выгрузка dialog_history")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("-o", "--output", help="Файл для записи (по умолчанию stdout)")
+    parser.add_argument("--student-id")
+    parser.add_argument("--course-id")
+    parser.add_argument("--date-from", type=datetime.fromisoformat)
+    parser.add_argument("--date-to", type=datetime.fromisoformat)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    db = DataBase()
+
+    chunks = export_dialog_history(
+        db,
+        args.format,
+        batch_size=args.batch_size,
+        student_id=args.student_id,
+        course_id=args.course_id,
+        date_from=args.date_from,
+        date_to=args.date_to,
+    )
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        written = 0
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(f"[Export] Записано байт: {written}", file=sys.stderr)
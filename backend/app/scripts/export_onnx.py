@@ -0,0 +1,28 @@
+'''
+Экспорт модели эмбеддингов в ONNX и динамическое int8-квантование.
+
+Запуск из папки app (нужны torch, sentence-transformers, onnx, onnxruntime):
+    python -m scripts.export_onnx
+    python -m scripts.export_onnx --model sentence-transformers/all-MiniLM-L6-v2 --output models/onnx
+
+После экспорта бэкенд выбирается настройкой EMBEDDING_BACKEND=onnx или onnx-int8.
+Проверка совпадения с PyTorch - python -m scripts.embedding_parity.
+'''
+
+import argparse
+
+from core.config import EmbeddingSettings
+from vector_db.embedding_backends import export_onnx
+
+
+if __name__ == "__main__":
+    settings = EmbeddingSettings()
+    parser = argparse.ArgumentParser(description="Экспорт модели эмбеддингов в ONNX")
+    parser.add_argument("--model", default=settings.embedding_model)
+    parser.add_argument("--output", default=settings.embedding_onnx_dir)
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--no-quantize", action="store_true", help="не создавать int8-версию")
+    args = parser.parse_args()
+
+    for path in export_onnx(args.model, args.output, quantize=not args.no_quantize, opset=args.opset):
+        print(f"[Embeddings] Создан {path}")
@@ -1,91 +1,54 @@
-import time
-import pandas as pd
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
-from qdrant_client.models import VectorParams, Distance, PointStruct
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-import torch
-
 '''
-Нужна ещё openpyxl
-pip install openpyxl
+Загрузка базы знаний (xlsx/csv) в Qdrant.
 
- http://localhost:6333/collections <--- проверка коллекций
+Запуск из папки app (нужен пакет vector_db):
+    python -m scripts.qdrant_loader                 # инкрементально: только новые/измененные строки
+    python -m scripts.qdrant_loader --full          # собрать новую версию коллекции и переключить алиас
+    python -m scripts.qdrant_loader --rollback      # вернуть алиас на предыдущую версию
+    python -m scripts.qdrant_loader --full --quantization int8  # новая версия с квантованием int8
+    python -m scripts.qdrant_loader --file course.csv --key-column id --batch-size 512 --concurrency 4
 
+Полная пересборка идет в отдельную версию коллекции, поиск в это время
+работает по старой. После падения она продолжается с контрольной точки
+(--restart - собрать заново).
 
+После загрузки коллекция выгружается в резервный индекс (--fallback-path),
+по которому бот ищет, пока Qdrant недоступен.
 '''
 
-class QdrantLoader:
-    def __init__(self):
-        self.collection_name = "test_db1"
-        self.import_data_name = "KnowlengeBase.xlsx"
-        self.client = QdrantClient(host="localhost", port=6333)
-
-    def load(self):
-        # Загрузка модели для эмбеддингов
-        model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-
-        df = pd.read_excel(self.import_data_name)
-        client = QdrantClient("localhost", port=6333)
-
-        points = []
-        for index, row in df.iterrows():
-            # Создаем объединенный текст из всех колонок
-            text = " ".join([str(x) for x in row.values if pd.notna(x)])
-            vector = model.encode(text).tolist()
-            
-            # Создаем payload с ОБЯЗАТЕЛЬНЫМ полем "text"
-            payload = row.to_dict()
-            payload["text"] = text  # Добавляем поле text
-            
-            points.append(PointStruct(
-                id=index,
-                vector=vector,
-                payload=payload
-            ))
-
-        client.upsert(self.collection_name, points=points)
-        print(f"[Qdrant] Loaded {len(points)} documents with 'text' field")
+import argparse
 
-    def create_collection(self):
-        client = QdrantClient(host="localhost", port=6333)
-        
-        # Сначала пытаемся удалить существующую коллекцию
-        try:
-            client.delete_collection(collection_name=self.collection_name)
-            print(f"[Qdrant] Existing collection '{self.collection_name}' deleted")
-            time.sleep(1)  # Даем время на завершение удаления
-        except Exception as e:
-            print(f"[Qdrant] No collection to delete or error: {e}")
-        
-        # Создаем новую коллекцию
-        client.create_collection(
-            collection_name=self.collection_name,
-            vectors_config=models.VectorParams(
-                size=384,  # Размерность векторов
-                distance=models.Distance.COSINE  # Метрика расстояния
-            )
-        )
-        print(f"[Qdrant] New collection '{self.collection_name}' created")
+from vector_db.qdrant_loader import QdrantLoader
+from vector_db.quantization import QUANTIZATION_MODES
 
-    def _optimize_collection(self):
-        """Принудительная оптимизация коллекции для индексации"""
-        try:
-            # Запускаем оптимизацию
-            self.client.update_collection(
-                collection_name=self.collection_name,
-                optimizer_config=models.OptimizersConfigDiff(
-                    indexing_threshold=100  # Понижаем порог индексации
-                )
-            )
-            print("[Qdrant] Optimization triggered")
-            time.sleep(3)  # Ждем оптимизацию
-        except Exception as e:
-            print(f"[Qdrant] Optimization error: {e}")
 
 if __name__ == "__main__":
-    qdrant_loader = QdrantLoader();
-    qdrant_loader.create_collection()
-    qdrant_loader.load()
-    qdrant_loader._optimize_collection()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Загрузка базы знаний (xlsx/csv) в Qdrant")
+    parser.add_argument("--file", default="KnowlengeBase.xlsx")
+    parser.add_argument("--collection", default="test_db1")
+    parser.add_argument("--key-column", default=None, help="колонка с постоянным ключом строки")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="размер чанка в токенах (по умолчанию - предел модели)")
+    parser.add_argument("--chunk-overlap", type=int, default=32, help="перекрытие чанков в токенах")
+    parser.add_argument("--dedup-threshold", type=float, default=0.85, help="порог сходства для отсева почти-дубликатов")
+    parser.add_argument("--fallback-path", default=None,
+                        help="каталог резервного индекса (по умолчанию FALLBACK_INDEX_PATH, \"\" - не выгружать)")
+    parser.add_argument("--quantization", choices=QUANTIZATION_MODES, default="none",
+                        help="квантование новой версии коллекции (см. scripts/quantization_benchmark.py)")
+    parser.add_argument("--full", action="store_true", help="собрать новую версию коллекции из файла целиком")
+    parser.add_argument("--rollback", action="store_true", help="переключить алиас на предыдущую версию")
+    parser.add_argument("--restart", action="store_true", help="при --full игнорировать контрольную точку")
+    args = parser.parse_args()
+
+    qdrant_loader = QdrantLoader(
+        args.collection, args.file, args.batch_size, args.concurrency, key_column=args.key_column,
+        chunk_tokens=args.chunk_tokens, chunk_overlap=args.chunk_overlap, dedup_threshold=args.dedup_threshold,
+        fallback_path=args.fallback_path, quantization=args.quantization,
+    )
+    if args.rollback:
+        qdrant_loader.rollback()
+    elif args.full:
+        qdrant_loader.rebuild(restart=args.restart)
+    else:
+        print(f"[Qdrant] Reindex: {qdrant_loader.reindex()}")
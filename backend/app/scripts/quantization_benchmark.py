@@ -0,0 +1,139 @@
+'''
+Сравнение режимов квантования коллекции: полнота, задержка поиска, память.
+
+Запуск из папки app:
+    python -m scripts.quantization_benchmark --collection test_db1
+    python -m scripts.quantization_benchmark --modes none,int8 --queries 500 --top-k 5 --oversampling 1.5
+
+Векторы коллекции копируются во временные коллекции {коллекция}_bench_{режим}
+(по одной на режим), запросами служат случайные векторы самой коллекции.
+Эталон - точный поиск (exact) по float32. Для int8 / binary поиск меряется
+с переоценкой по исходным векторам (rescore) и без нее.
+
+Память - оценка объема векторов в RAM (без графа HNSW и payload);
+у квантованных режимов исходные float32 векторы лежат на диске.
+'''
+
+import argparse
+import time
+
+import numpy as np
+from qdrant_client.models import PointStruct
+
+from vector_db.qdrant_loader import QdrantLoader
+from vector_db.quantization import DEFAULT_OVERSAMPLING, QUANTIZATION_MODES, search_params, vector_memory_bytes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк квантования Qdrant")
+    parser.add_argument("--collection", default="test_db1")
+    parser.add_argument("--modes", default=",".join(QUANTIZATION_MODES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--oversampling", type=float, default=None, help="по умолчанию - свой для каждого режима")
+    parser.add_argument("--limit", type=int, default=None, help="сколько точек коллекции взять (по умолчанию все)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="не удалять временные коллекции")
+    return parser.parse_args()
+
+
+def read_vectors(loader: QdrantLoader, limit=None):
+    ids, vectors = [], []
+    offset = None
+    while True:
+        points, offset = loader.client.scroll(
+            collection_name=loader.collection_name,
+            limit=loader.SCROLL_PAGE_SIZE,
+            offset=offset,
+            with_payload=False,
+            with_vectors=True,
+        )
+        for point in points:
+            ids.append(point.id)
+            vectors.append(point.vector)
+        if offset is None or (limit and len(ids) >= limit):
+            break
+    if limit:
+        ids, vectors = ids[:limit], vectors[:limit]
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def copy_collection(loader: QdrantLoader, name, ids, vectors):
+    if loader.client.collection_exists(name):
+        loader.client.delete_collection(name)
+    loader.create_collection(name, vector_size=vectors.shape[1])
+    for i in range(0, len(ids), loader.batch_size):
+        loader.client.upsert(name, points=[
+            PointStruct(id=pid, vector=vector.tolist())
+            for pid, vector in zip(ids[i:i + loader.batch_size], vectors[i:i + loader.batch_size])
+        ], wait=True)
+    loader._enable_indexing(name)
+    loader.wait_until_ready(name)
+
+
+def run_queries(loader: QdrantLoader, name, queries, top_k, params):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        hits = loader.client.search(
+            collection_name=name,
+            query_vector=query.tolist(),
+            limit=top_k,
+            search_params=params,
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([hit.id for hit in hits])
+    return results, np.asarray(latencies)
+
+
+def recall(results, truth, top_k):
+    return float(np.mean([len(set(found) & set(expected)) / top_k for found, expected in zip(results, truth)]))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    loader = QdrantLoader(args.collection, fallback_path="")
+
+    ids, vectors = read_vectors(loader, args.limit)
+    if not ids:
+        raise SystemExit(f"Коллекция '{args.collection}' пуста")
+    rng = np.random.RandomState(args.seed)
+    queries = vectors[rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)]
+    print(f"[Bench] {len(ids)} векторов x {vectors.shape[1]}, {len(queries)} запросов, top-{args.top_k}")
+
+    names = {}
+    try:
+        for mode in dict.fromkeys(["none"] + modes):
+            names[mode] = f"{args.collection}_bench_{mode}"
+            loader.quantization = mode
+            copy_collection(loader, names[mode], ids, vectors)
+
+        truth, _ = run_queries(loader, names["none"], queries, args.top_k, search_params(exact=True))
+
+        rows = []
+        for mode in modes:
+            oversampling = args.oversampling or DEFAULT_OVERSAMPLING[mode]
+            variants = [True] if mode == "none" else [True, False]
+            for rescore in variants:
+                params = search_params(oversampling=oversampling, rescore=rescore)
+                results, latencies = run_queries(loader, names[mode], queries, args.top_k, params)
+                rows.append((
+                    mode,
+                    "-" if mode == "none" else ("да" if rescore else "нет"),
+                    "-" if mode == "none" else f"{oversampling:g}",
+                    recall(results, truth, args.top_k),
+                    np.percentile(latencies, 50),
+                    np.percentile(latencies, 99),
+                    vector_memory_bytes(mode, len(ids), vectors.shape[1]) / 2 ** 20,
+                ))
+
+        print(f"\n{'режим':<8} {'rescore':<8} {'oversampling':<13} {f'recall@{args.top_k}':<10} "
+              f"{'p50, мс':<9} {'p99, мс':<9} {'RAM векторов, МБ'}")
+        for mode, rescore, oversampling, rec, p50, p99, ram in rows:
+            print(f"{mode:<8} {rescore:<8} {oversampling:<13} {rec:<10.4f} {p50:<9.2f} {p99:<9.2f} {ram:.1f}")
+    finally:
+        if not args.keep:
+            for name in names.values():
+                if loader.client.collection_exists(name):
+                    loader.client.delete_collection(name)
@@ -1,8 +1,12 @@
+import asyncio
 import os
 import threading
+import time
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import Application, MessageHandler, filters
 from core.app_contex import AppContext
 from core.agent import DialogAgent
+from llm.gigachat_client import GigaChatClient
 
 class TelegramRunner:
 
@@ -21,7 +25,8 @@ class TelegramRunner:
                 token=os.getenv("TELEGRAM_BOT_TOKEN"), 
                 gigachat=gigachat, 
                 qdrant=qdrant, 
-                rag=rag
+                rag=rag,
+                answer_cache=AppContext.AnswerCache
             )
             
             # Запускаем бота
@@ -61,10 +66,15 @@ class TelegramRunner:
             print("\n👋 Завершение работы...")
 
 class TelegramBotClient:
-    def __init__(self, token: str, gigachat, qdrant, rag):
+    # Максимальная длина одного сообщения Telegram
+    MESSAGE_LIMIT = 4096
+
+    def __init__(self, token: str, gigachat, qdrant, rag, answer_cache=None):
         self.token = token
         self.bot = Application.builder().token(self.token).build()
-        self.agent = DialogAgent(gigachat, qdrant, rag)
+        self.agent = DialogAgent(gigachat, qdrant, rag, answer_cache=answer_cache)
+        # Telegram ограничивает частоту правок сообщения - не чаще раза в edit_interval секунд
+        self.edit_interval = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.0"))
         
         # Настраиваем обработчики при инициализации
         self._setup_handlers()
@@ -80,11 +90,82 @@ class TelegramBotClient:
             if "статус" in message.lower():
                 await update.message.reply_text("Агент работает")
             else:
-                response = self.agent.say(message)
-                await update.message.reply_text(response)
+                await self._reply_streaming(update, message)
         
         self.bot.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
 
+    async def _reply_streaming(self, update, message):
+        """
+        Отправить ответ агента по мере генерации.
+
+        Первое сообщение отправляется с первым куском ответа, дальше оно
+        редактируется не чаще edit_interval. Если ответ не помещается
+        в одно сообщение, продолжение идет следующим сообщением.
+        Пустой ответ (или из одних пробелов) Telegram не принимает -
+        вместо него отправляется ERROR_ANSWER.
+        """
+        stream = self.agent.say_stream(message)
+        reply = None      # сообщение, которое сейчас дописывается
+        offset = 0        # с какого символа ответа начинается это сообщение
+        shown = ""        # что в нем сейчас отображается
+        next_edit = 0.0
+
+        async for _ in stream:
+            text = stream.answer
+            # Заполненные сообщения закрываем и начинаем следующее
+            while reply is not None and len(text) - offset > self.MESSAGE_LIMIT:
+                full = text[offset:offset + self.MESSAGE_LIMIT]
+                if full != shown:
+                    await self._edit_message(reply, full)
+                offset += self.MESSAGE_LIMIT
+                reply, shown = None, ""
+
+            current = text[offset:offset + self.MESSAGE_LIMIT]
+            if reply is None:
+                if not current.strip():
+                    # Ждем первый непустой кусок
+                    continue
+                reply = await update.message.reply_text(current)
+                shown = current
+                next_edit = time.monotonic() + self.edit_interval
+            elif time.monotonic() >= next_edit and current != shown:
+                delay = await self._edit_message(reply, current)
+                shown = current
+                next_edit = time.monotonic() + max(self.edit_interval, delay)
+
+        # Финальная правка с полным текстом (и продолжения, если ответ длинный)
+        text = stream.answer
+        if not text.strip():
+            print("[Telegram] Модель вернула пустой ответ")
+            await update.message.reply_text(GigaChatClient.ERROR_ANSWER)
+            return
+        while offset < len(text) or reply is not None:
+            current = text[offset:offset + self.MESSAGE_LIMIT]
+            if reply is None:
+                if current.strip():
+                    await update.message.reply_text(current)
+            elif current != shown:
+                delay = await self._edit_message(reply, current)
+                if delay:
+                    await asyncio.sleep(delay)
+                    await self._edit_message(reply, current)
+            offset += self.MESSAGE_LIMIT
+            reply, shown = None, ""
+
+        print(f"[Telegram] Ответ отправлен: первый токен {stream.first_token_ms} мс, всего {stream.total_ms} мс")
+
+    async def _edit_message(self, reply, text) -> float:
+        """Отредактировать сообщение; возвращает паузу, которую просит Telegram"""
+        try:
+            await reply.edit_text(text)
+        except RetryAfter as e:
+            retry_after = e.retry_after  # int или timedelta в зависимости от версии библиотеки
+            return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+        except BadRequest as e:
+            # "Message is not modified" и подобные - не повод обрывать ответ
+            print(f"[Telegram] Правка сообщения не удалась: {e}")
+        return 0.0
+
     def run(self):
         """Запуск бота (синхронный метод для использования в потоках)"""
         print("Бот запущен...")
@@ -0,0 +1,179 @@
+# bm25_index.py
+'''
+Лексический индекс BM25 в памяти процесса поверх тех же чанков, что в Qdrant.
+
+Ключ документа - ID точки Qdrant, поэтому результаты двух поисков можно
+сливать по ID. Индекс обновляется инкрементально (add_points / remove_points)
+из путей загрузки или целиком перестраивается из коллекции (build_from_qdrant).
+
+Слова приводятся к основе стеммером Snowball для русского языка, если
+установлен пакет snowballstemmer, иначе обрезаются до первых 6 букв.
+'''
+
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import snowballstemmer
+except ImportError:  # Стеммер - необязательная зависимость
+    snowballstemmer = None
+
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_FALLBACK_STEM_LENGTH = 6
+
+
+class BM25Index:
+    """Инвертированный индекс BM25 (k1, b - стандартные параметры формулы)"""
+
+    # Поля payload, которые индекс хранит для выдачи результатов
+    PAYLOAD_FIELDS = ("text", "source", "document_id", "chunk_index", "row_id")
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._stemmer = snowballstemmer.stemmer("russian") if snowballstemmer else None
+        self._lock = threading.RLock()
+        # Изменения, пришедшие во время перестройки (повторяются после подмены)
+        self._journal: Optional[List[Tuple[str, Any]]] = None
+        self._clear()
+
+    def _clear(self):
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._terms: Dict[str, List[str]] = {}
+        self._payloads: Dict[str, Dict[str, Any]] = {}
+        self._total_length = 0
+
+    def tokenize(self, text: str) -> List[str]:
+        words = _WORD_RE.findall(text.lower().replace("ё", "е"))
+        if self._stemmer is not None:
+            return self._stemmer.stemWords(words)
+        return [word[:_FALLBACK_STEM_LENGTH] for word in words]
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, doc_id: str, text: str, payload: Optional[Dict[str, Any]] = None):
+        """Добавить или заменить документ"""
+        doc_id = str(doc_id)
+        counts = Counter(self.tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+            length = sum(counts.values())
+            self._lengths[doc_id] = length
+            self._terms[doc_id] = list(counts)
+            self._total_length += length
+            payload = payload or {}
+            self._payloads[doc_id] = {key: payload[key] for key in self.PAYLOAD_FIELDS if key in payload}
+            self._payloads[doc_id].setdefault("text", text)
+
+    def add_points(self, points: Iterable):
+        """Добавить точки Qdrant (PointStruct / Record): текст берется из payload["text"]"""
+        points = list(points)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("add", points))
+            for point in points:
+                payload = point.payload or {}
+                if payload.get("text"):
+                    self.add(point.id, str(payload["text"]), payload)
+
+    def remove_points(self, doc_ids: Iterable):
+        doc_ids = [str(doc_id) for doc_id in doc_ids]
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append(("remove", doc_ids))
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        terms = self._terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        self._payloads.pop(doc_id, None)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """(ID, score) лучших документов по BM25"""
+        terms = set(self.tokenize(query))
+        with self._lock:
+            n = len(self._lengths)
+            if not n or not terms:
+                return []
+            avg_length = self._total_length / n
+
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def payload(self, doc_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._payloads.get(str(doc_id), {}))
+
+    def build_from_qdrant(self, client, collection_name: str, page_size: int = 1000) -> int:
+        """
+        Перестроить индекс по всем точкам коллекции.
+
+        Новый индекс собирается отдельно и подменяет старый целиком,
+        поэтому поиск во время перестройки работает по прежним данным.
+        Изменения, пришедшие через add_points / remove_points во время
+        чтения коллекции, после подмены применяются повторно.
+        """
+        with self._lock:
+            self._journal = []
+        fresh = BM25Index(self.k1, self.b)
+        try:
+            offset = None
+            while True:
+                points, offset = client.scroll(
+                    collection_name=collection_name,
+                    limit=page_size,
+                    offset=offset,
+                    with_payload=list(self.PAYLOAD_FIELDS),
+                    with_vectors=False,
+                )
+                fresh.add_points(points)
+                if offset is None:
+                    break
+        except Exception:
+            with self._lock:
+                self._journal = None
+            raise
+
+        with self._lock:
+            self._postings = fresh._postings
+            self._lengths = fresh._lengths
+            self._terms = fresh._terms
+            self._payloads = fresh._payloads
+            self._total_length = fresh._total_length
+            journal, self._journal = self._journal, None
+            for operation, items in journal:
+                if operation == "add":
+                    self.add_points(items)
+                else:
+                    self.remove_points(items)
+        logger.info(f"[BM25] Индекс по '{collection_name}' построен: {len(self)} чанков")
+        return len(self)
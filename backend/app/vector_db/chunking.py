@@ -0,0 +1,150 @@
+# chunking.py
+'''
+Разбиение текстов на чанки по токенам энкодера и отсев почти-дубликатов.
+
+TokenChunker режет текст скользящим окном в max_tokens токенов того же
+токенизатора, что у модели эмбеддингов, с перекрытием overlap, поэтому
+длинные материалы не обрезаются энкодером молча.
+
+MinHashDeduplicator отбрасывает чанки, почти совпадающие с уже принятыми
+(оценка сходства Жаккара по MinHash, кандидаты - через LSH по полосам),
+до того как их закодируют и запишут в Qdrant.
+'''
+
+import re
+import zlib
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+
+class TokenChunker:
+    """Скользящее окно по токенам (нужен "быстрый" токенизатор HuggingFace с offsets)"""
+
+    def __init__(self, tokenizer, max_tokens: int = 256, overlap: int = 32):
+        if overlap >= max_tokens:
+            raise ValueError("overlap должен быть меньше max_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    @classmethod
+    def for_encoder(cls, encoder, overlap: int = 32, max_tokens: Optional[int] = None) -> "TokenChunker":
+        """Чанкер под SentenceTransformer: окно не длиннее max_seq_length модели"""
+        # 2 токена резервируются под [CLS] и [SEP]
+        limit = (encoder.max_seq_length or 256) - 2
+        return cls(encoder.tokenizer, min(max_tokens or limit, limit), overlap)
+
+    def split(self, text: str) -> List[str]:
+        text = text.strip()
+        if not text:
+            return []
+
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding["offset_mapping"]
+        if len(offsets) <= self.max_tokens:
+            return [text]
+
+        chunks = []
+        step = self.max_tokens - self.overlap
+        for start in range(0, len(offsets), step):
+            window = offsets[start:start + self.max_tokens]
+            chunk = text[window[0][0]:window[-1][1]].strip()
+            if chunk:
+                chunks.append(chunk)
+            if start + self.max_tokens >= len(offsets):
+                break
+        return chunks
+
+
+class MinHashDeduplicator:
+    """
+    Отсев почти-дубликатов по MinHash + LSH.
+
+    Сигнатура - num_perm минимумов хэшей словесных шинглов. Сигнатура
+    делится на bands полос; чанки, у которых совпала хотя бы одна полоса,
+    сравниваются по оценке Жаккара, и при сходстве >= threshold новый
+    чанк считается дубликатом.
+    """
+
+    _PRIME = np.uint64(4294967311)  # простое больше 2^32
+    _WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm должно делиться на bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.RandomState(seed)
+        # a < 2^31, чтобы a * x + b не переполнял uint64
+        self._a = rng.randint(1, 2 ** 31, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 2 ** 31, size=num_perm).astype(np.uint64)
+
+        self._signatures: List[np.ndarray] = []
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self.checked = 0
+        self.duplicates = 0
+
+    def _shingles(self, text: str) -> Set[int]:
+        words = self._WORD_RE.findall(text.lower())
+        if len(words) < self.shingle_size:
+            words = [" ".join(words)] if words else [text]
+            size = 1
+        else:
+            size = self.shingle_size
+        return {
+            zlib.crc32(" ".join(words[i:i + size]).encode("utf-8"))
+            for i in range(len(words) - size + 1)
+        }
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(self._shingles(text), dtype=np.uint64)
+        values = (np.outer(hashes, self._a) + self._b) % self._PRIME
+        return values.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[band * self.rows_per_band:(band + 1) * self.rows_per_band].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def is_duplicate(self, text: str) -> bool:
+        """Проверить чанк и, если он новый, запомнить его"""
+        self.checked += 1
+        if self._check_and_add(text):
+            self.duplicates += 1
+            return True
+        return False
+
+    def seed(self, text: str):
+        """Запомнить уже сохраненный чанк (без учета в статистике)"""
+        self._check_and_add(text)
+
+    def _check_and_add(self, text: str) -> bool:
+        signature = self.signature(text)
+        keys = self._band_keys(signature)
+
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(self._buckets[band].get(key, ()))
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                return True
+
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(index)
+        return False
+
+    def filter(self, chunks: List[str]) -> List[int]:
+        """Индексы чанков, которые не являются дубликатами"""
+        return [i for i, chunk in enumerate(chunks) if not self.is_duplicate(chunk)]
+
+    def stats(self) -> Dict[str, int]:
+        return {"chunks_checked": self.checked, "duplicates_dropped": self.duplicates}
@@ -0,0 +1,190 @@
+# embedding_backends.py
+'''
+Бэкенды модели эмбеддингов, выбираемые настройками (core/config.py, EmbeddingSettings).
+
+    torch     - SentenceTransformer на PyTorch (как раньше)
+    onnx      - та же модель, экспортированная в ONNX, на ONNX Runtime (CPU)
+    onnx-int8 - ONNX с динамическим int8-квантованием весов
+
+Экспорт: python -m scripts.export_onnx (нужен PyTorch, делается один раз).
+Для работы ONNX-бэкендам нужны только onnxruntime и transformers
+(токенизатор), без PyTorch.
+
+Все бэкенды ведут себя как SentenceTransformer в том объеме, в каком он
+используется в проекте: encode(), tokenizer, max_seq_length,
+get_sentence_embedding_dimension(). Сравнение с PyTorch - scripts/embedding_parity.py,
+скорость, время загрузки и память - scripts/embedding_benchmark.py.
+'''
+
+import json
+import logging
+import os
+import time
+from typing import List, Optional, Union
+
+import numpy as np
+
+from core.config import EmbeddingSettings
+
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_INT8_MODEL_FILE = "model_int8.onnx"
+ENCODER_CONFIG_FILE = "encoder_config.json"
+
+
+class OnnxEncoder:
+    """Трансформер в ONNX Runtime + пулинг и нормализация, как в SentenceTransformer"""
+
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_file = os.path.join(model_dir, ONNX_INT8_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not os.path.exists(model_file):
+            raise FileNotFoundError(
+                f"Нет {model_file}: выполните python -m scripts.export_onnx --output {model_dir}"
+            )
+        with open(os.path.join(model_dir, ENCODER_CONFIG_FILE), encoding="utf-8") as f:
+            config = json.load(f)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.model_file = model_file
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = config["max_seq_length"]
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.dimension = config["dimension"]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.max_seq_length, return_tensors="np",
+        )
+        feed = {name: value.astype(np.int64) for name, value in inputs.items() if name in self._input_names}
+        hidden = self.session.run(None, feed)[0]
+
+        if self.pooling == "cls":
+            vectors = hidden[:, 0]
+        else:
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        # Как в SentenceTransformer: тексты близкой длины в одной пачке - меньше паддинга
+        order = np.argsort([-len(text) for text in texts])
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            indexes = order[start:start + batch_size]
+            vectors[indexes] = self._encode_batch([texts[i] for i in indexes])
+        return vectors[0] if single else vectors
+
+
+def load_encoder(backend: Optional[str] = None, model_name: Optional[str] = None,
+                 onnx_dir: Optional[str] = None, threads: Optional[int] = None):
+    """Энкодер по настройкам (аргументы переопределяют EmbeddingSettings)"""
+    settings = EmbeddingSettings()
+    backend = backend or settings.embedding_backend
+    model_name = model_name or settings.embedding_model
+    onnx_dir = onnx_dir or settings.embedding_onnx_dir
+    threads = settings.embedding_threads if threads is None else threads
+
+    started = time.perf_counter()
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer(model_name, device="cpu")
+    elif backend in ("onnx", "onnx-int8"):
+        encoder = OnnxEncoder(onnx_dir, quantized=backend == "onnx-int8", threads=threads)
+    else:
+        raise ValueError(f"Неизвестный бэкенд эмбеддингов: {backend} (допустимы: {', '.join(BACKENDS)})")
+    logger.info(f"[Embeddings] {model_name} ({backend}) загружена за {time.perf_counter() - started:.1f} с")
+    return encoder
+
+
+def encoder_name(backend: Optional[str] = None, model_name: Optional[str] = None) -> str:
+    """
+    Имя энкодера для ключей кэша эмбеддингов: векторы квантованной модели
+    немного отличаются, их нельзя смешивать с векторами PyTorch.
+    """
+    settings = EmbeddingSettings()
+    backend = backend or settings.embedding_backend
+    model_name = model_name or settings.embedding_model
+    return model_name if backend == "torch" else f"{model_name}#{backend}"
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14) -> List[str]:
+    """
+    Экспортировать трансформер SentenceTransformer в ONNX (и int8-версию).
+
+    Returns:
+        Пути созданных файлов моделей
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    pooling = next((module for module in model if isinstance(module, Pooling)), None)
+    config = {
+        "model_name": model_name,
+        "max_seq_length": model.max_seq_length,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "pooling": "cls" if pooling is not None and pooling.pooling_mode_cls_token else "mean",
+        "normalize": any(isinstance(module, Normalize) for module in model),
+    }
+
+    sample = tokenizer(["пример текста", "example"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, ENCODER_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    paths = [model_path]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = os.path.join(output_dir, ONNX_INT8_MODEL_FILE)
+        quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+        paths.append(int8_path)
+
+    for path in paths:
+        logger.info(f"[Embeddings] {path}: {os.path.getsize(path) / 2 ** 20:.1f} МБ")
+    return paths
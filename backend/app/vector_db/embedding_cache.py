@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Двухуровневый кэш эмбеддингов запросов.
+
+    Ключ - нормализованный текст запроса + имя модели.
+    1 уровень: LRU в памяти процесса, вытеснение по суммарному размеру векторов.
+    2 уровень: SQLite-файл на диске, векторы хранятся в float16 и
+    переживают перезапуск приложения.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        disk_path: Optional[str] = "embedding_cache.sqlite3",
+    ):
+        self.model_name = model_name
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_path = disk_path
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute("PRAGMA journal_mode=WAL")
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    " key TEXT PRIMARY KEY, model TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.error(f"[EmbeddingCache] Дисковый кэш недоступен ({disk_path}): {e}")
+                self._disk = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Нормализация запроса: NFKC, нижний регистр, схлопывание пробелов"""
+        return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+    def _key(self, normalized: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Найти вектор в кэше (сначала в памяти, потом на диске)"""
+        key = self._key(self.normalize(text))
+
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return vector
+
+            if self._disk is not None:
+                row = self._disk.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float16).astype(np.float32)
+                    self._remember(key, vector)
+                    self._stats["disk_hits"] += 1
+                    return vector
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, text: str, vector: np.ndarray):
+        """Сохранить вектор в оба уровня кэша"""
+        key = self._key(self.normalize(text))
+        vector = np.asarray(vector, dtype=np.float32)
+
+        with self._lock:
+            self._remember(key, vector)
+            if self._disk is not None:
+                try:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+                        (key, self.model_name, vector.shape[-1], vector.astype(np.float16).tobytes()),
+                    )
+                    self._disk.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"[EmbeddingCache] Не удалось записать вектор на диск: {e}")
+
+    def get_or_compute(self, text: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        """
+        Вернуть вектор из кэша или посчитать его через compute.
+
+        Нормализованный текст - только ключ кэша: в compute передается
+        исходный текст запроса, чтобы эмбеддинг не отличался от поиска без кэша.
+        """
+        vector = self.get(text)
+        if vector is None:
+            vector = np.asarray(compute(text), dtype=np.float32)
+            self.put(text, vector)
+        return vector
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Положить вектор в LRU и вытеснить старые, если превышен лимит памяти"""
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.nbytes
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Счетчики попаданий/промахов по уровням кэша"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
@@ -0,0 +1,181 @@
+import asyncio
+import bisect
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Простая гистограмма с фиксированными границами корзин (потокобезопасная)"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += value
+
+    def snapshot(self) -> Dict[str, object]:
+        labels = [f"<={b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+        with self._lock:
+            counts, total, total_sum = list(self.counts), self.total, self.sum
+        return {
+            "count": total,
+            "avg": round(total_sum / total, 3) if total else 0.0,
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+class _Request:
+    __slots__ = ("text", "future", "enqueued_at")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.future: Future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class EmbeddingService:
+    """
+    Сервис эмбеддингов с динамическим микро-батчингом.
+
+    Одновременные запросы encode() из разных потоков/корутин собираются
+    в одну пачку (до max_batch_size текстов или до max_wait_ms ожидания
+    с первого запроса пачки) и кодируются одним вызовом encoder.encode
+    в отдельном рабочем потоке. Каждый вызывающий получает свой вектор
+    через Future.
+    """
+
+    def __init__(self, encoder, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue: "queue.Queue[Optional[_Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self._batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self._queue_wait_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250])
+        self._encode_ms = Histogram([1, 5, 10, 25, 50, 100, 250, 500, 1000])
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="EmbeddingService", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, text: str) -> Future:
+        """Поставить текст в очередь на кодирование"""
+        if self._thread is None:
+            self.start()
+        request = _Request(text)
+        self._queue.put(request)
+        return request.future
+
+    def encode(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        """Вектор одного текста (блокирует до готовности пачки)"""
+        return self.submit(text).result(timeout)
+
+    async def encode_async(self, text: str) -> np.ndarray:
+        """Вектор одного текста без блокировки event loop"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def encode_many(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        """
+        Закодировать готовый список текстов напрямую (массовая загрузка).
+
+        Очередь микро-батчинга не используется - список и так является пачкой.
+        """
+        started = time.perf_counter()
+        vectors = self.encoder.encode(
+            texts,
+            batch_size=batch_size or self.max_batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        with self._stats_lock:
+            self._encode_ms.observe((time.perf_counter() - started) * 1000)
+        return vectors
+
+    def stats(self) -> Dict[str, object]:
+        """Гистограммы размеров пачек, ожидания в очереди и времени кодирования"""
+        with self._stats_lock:
+            return {
+                "queue_size": self._queue.qsize(),
+                "batch_size": self._batch_sizes.snapshot(),
+                "queue_wait_ms": self._queue_wait_ms.snapshot(),
+                "encode_ms": self._encode_ms.snapshot(),
+            }
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = [first]
+            stop_after = False
+            deadline = first.enqueued_at + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop_after = True
+                    break
+                batch.append(request)
+
+            self._encode_batch(batch)
+            if stop_after:
+                break
+
+    def _encode_batch(self, batch: List[_Request]):
+        started = time.perf_counter()
+        try:
+            vectors = self.encoder.encode(
+                [request.text for request in batch],
+                batch_size=len(batch),
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        except Exception as e:
+            logger.error(f"[Embeddings] Ошибка кодирования пачки из {len(batch)} текстов: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        for request, vector in zip(batch, vectors):
+            request.future.set_result(vector)
+
+        with self._stats_lock:
+            self._batch_sizes.observe(len(batch))
+            self._encode_ms.observe((finished - started) * 1000)
+            for request in batch:
+                self._queue_wait_ms.observe((started - request.enqueued_at) * 1000)
@@ -0,0 +1,231 @@
+# fallback_index.py
+'''
+Локальный векторный индекс на случай недоступности Qdrant.
+
+После каждой переиндексации коллекция выгружается в каталог:
+    vectors.npy   - матрица нормированных векторов чанков, float16 (N x dim)
+    chunks.jsonl  - id, текст и источник каждого чанка (строка i - вектор i)
+    offsets.npy   - смещения строк chunks.jsonl, int64 (N + 1)
+    meta.json     - коллекция, число чанков, размерность, время выгрузки
+
+Оба массива и chunks.jsonl открываются через mmap, поэтому загрузка
+индекса ничего не читает заранее: страницы подтягиваются ОС при поиске.
+Поиск - скалярное произведение с нормированным запросом (= косинус)
+и top-k через argpartition.
+
+У NumPy нет BLAS для float16, и перевод матрицы во float32 на каждом
+запросе стоит больше самого умножения. Поэтому при первом поиске (то есть
+только во время сбоя Qdrant) матрица один раз переводится во float32 в
+памяти, если укладывается в max_memory_bytes; иначе перевод идет пачками
+строк на каждом запросе.
+'''
+
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "offsets.npy"
+META_FILE = "meta.json"
+
+# Поля payload, которые попадают в chunks.jsonl
+SIDECAR_FIELDS = ("text", "source", "document_id", "chunk_index", "row_id")
+
+
+class FallbackHit(NamedTuple):
+    """Результат поиска с теми же полями, что у ScoredPoint Qdrant"""
+    id: str
+    score: float
+    payload: Dict[str, Any]
+    vector: Optional[List[float]] = None
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def export_collection(client, collection_name: str, path: str, page_size: int = 1000) -> int:
+    """
+    Выгрузить векторы и тексты коллекции в каталог path.
+
+    Выгрузка пишется во временный каталог и подменяет прежнюю целиком,
+    так что читатели не видят наполовину записанный индекс.
+
+    Returns:
+        Число выгруженных чанков
+    """
+    started = time.perf_counter()
+    expected = client.count(collection_name=collection_name, exact=True).count
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    matrix = None
+    offsets = [0]
+    written = 0
+    with open(os.path.join(tmp_path, CHUNKS_FILE), "wb") as chunks_file:
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=list(SIDECAR_FIELDS),
+                with_vectors=True,
+            )
+            # Точки, добавленные во время выгрузки сверх count, попадут в следующую
+            points = [point for point in points if point.vector][:max(0, expected - written)]
+            if points:
+                vectors = _normalize(np.asarray([point.vector for point in points], dtype=np.float32))
+                if matrix is None:
+                    matrix = np.lib.format.open_memmap(
+                        os.path.join(tmp_path, VECTORS_FILE), mode="w+",
+                        dtype=np.float16, shape=(expected, vectors.shape[1]),
+                    )
+                matrix[written:written + len(points)] = vectors.astype(np.float16)
+                written += len(points)
+
+                for point in points:
+                    payload = point.payload or {}
+                    record = {key: payload[key] for key in SIDECAR_FIELDS if key in payload}
+                    record["id"] = str(point.id)
+                    chunks_file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+                    offsets.append(chunks_file.tell())
+            if offset is None:
+                break
+
+    if matrix is None:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        logger.warning(f"[Fallback] Коллекция '{collection_name}' пуста, индекс не выгружен")
+        return 0
+    matrix.flush()
+    dim = matrix.shape[1]
+    del matrix
+
+    np.save(os.path.join(tmp_path, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "collection": collection_name,
+            "count": written,
+            "dim": dim,
+            "exported_at": datetime.now().isoformat(),
+        }, f, ensure_ascii=False)
+
+    old_path = f"{path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    logger.info(f"[Fallback] Выгружено {written} чанков '{collection_name}' в {path} "
+                f"за {time.perf_counter() - started:.1f} с")
+    return written
+
+
+class FallbackIndex:
+    """Поиск по выгрузке коллекции (mmap), пока Qdrant недоступен"""
+
+    # Строк матрицы на один шаг перевода float16 -> float32
+    BLOCK_ROWS = 65536
+
+    def __init__(self, path: str, max_memory_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._vectors: Optional[np.ndarray] = None
+        self._vectors_f32: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._chunks: Optional[mmap.mmap] = None
+        self.meta: Dict[str, Any] = {}
+
+    @property
+    def available(self) -> bool:
+        self._maybe_reload()
+        return self._vectors is not None
+
+    def _maybe_reload(self):
+        """Открыть выгрузку заново, если ее переписали после прошлой загрузки"""
+        try:
+            mtime = os.stat(os.path.join(self.path, META_FILE)).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            if mtime == self._loaded_mtime:
+                return
+            try:
+                with open(os.path.join(self.path, META_FILE), encoding="utf-8") as f:
+                    meta = json.load(f)
+                count = meta["count"]
+                vectors = np.load(os.path.join(self.path, VECTORS_FILE), mmap_mode="r")[:count]
+                offsets = np.load(os.path.join(self.path, OFFSETS_FILE), mmap_mode="r")
+                with open(os.path.join(self.path, CHUNKS_FILE), "rb") as f:
+                    chunks = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"[Fallback] Не удалось открыть индекс {self.path}: {e}")
+                return
+            self._vectors, self._offsets, self._chunks, self.meta = vectors, offsets, chunks, meta
+            self._vectors_f32 = None
+            self._loaded_mtime = mtime
+            logger.info(f"[Fallback] Открыт индекс {self.path}: {count} чанков из '{meta.get('collection')}'")
+
+    def _record(self, index: int) -> Dict[str, Any]:
+        start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+        return json.loads(self._chunks[start:end])
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        vectors = self._vectors
+        if self._vectors_f32 is None and vectors.size * 4 <= self.max_memory_bytes:
+            with self._lock:
+                if self._vectors_f32 is None and vectors is self._vectors:
+                    self._vectors_f32 = vectors.astype(np.float32)
+        dense = self._vectors_f32
+        if dense is not None and len(dense) == len(vectors):
+            return dense @ query
+
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), self.BLOCK_ROWS):
+            block = vectors[start:start + self.BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+    def search(self, query_vector, top_k: int = 5, score_threshold: Optional[float] = None,
+               with_vectors: bool = False) -> List[FallbackHit]:
+        """Ближайшие чанки по косинусу"""
+        if not self.available:
+            raise ConnectionError(f"Резервный индекс {self.path} не выгружен")
+        count = len(self._vectors)
+        scores = self._scores(_normalize(np.asarray(query_vector, dtype=np.float32)))
+
+        k = min(top_k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        hits = []
+        for index in top:
+            score = float(scores[index])
+            if score_threshold is not None and score < score_threshold:
+                break
+            record = self._record(int(index))
+            vector = self._vectors[index].astype(np.float32).tolist() if with_vectors else None
+            hits.append(FallbackHit(record.pop("id"), score, record, vector))
+        return hits
+
+    def stats(self) -> Dict[str, Any]:
+        return {"available": self.available, "in_memory": self._vectors_f32 is not None, **self.meta}
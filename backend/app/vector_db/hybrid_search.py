@@ -0,0 +1,186 @@
+# hybrid_search.py
+'''
+Гибридный поиск: векторный (Qdrant) + лексический (BM25) со слиянием
+результатов через Reciprocal Rank Fusion.
+
+Оба поиска запускаются параллельно, каждый отдает до candidates кандидатов.
+Итоговая оценка чанка - сумма 1 / (rrf_k + ранг) по поискам, в которых он
+нашелся, поэтому шкалы оценок (косинус и BM25) сравнивать не нужно.
+Точные термины и коды, которые плохо ловит векторная модель, находит BM25.
+
+Индекс BM25 строится по той же версии коллекции, на которую указывает
+алиас, и перестраивается в фоне, когда алиас переключают. Загрузки внутри
+процесса (документы, /rag/reindex) обновляют его инкрементально.
+'''
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from vector_db.bm25_index import BM25Index
+from vector_db.embedding_service import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_BOUNDS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+
+class HybridRetriever:
+    """Параллельный векторный + BM25 поиск и слияние RRF"""
+
+    def __init__(self, qdrant_manager, bm25: Optional[BM25Index] = None, rrf_k: int = 60,
+                 candidates: int = 50, refresh_interval: float = 0.0):
+        """
+        Args:
+            qdrant_manager: QdrantManager (векторный поиск и имя текущей версии коллекции)
+            bm25: лексический индекс (по умолчанию новый пустой)
+            rrf_k: сглаживающая константа RRF
+            candidates: сколько кандидатов берется из каждого поиска
+            refresh_interval: период полной перестройки BM25 в секундах (0 - только
+                при переключении алиаса); нужен, если базу меняют из другого процесса
+        """
+        self.qdrant_manager = qdrant_manager
+        self.bm25 = bm25 or BM25Index()
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.refresh_interval = refresh_interval
+
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="HybridSearch")
+        self._lock = threading.Lock()
+        self._indexed_version: Optional[str] = None
+        self._indexed_at = 0.0
+        self._stale = False
+        self._building = False
+        self._latency = {name: Histogram(_LATENCY_BOUNDS_MS) for name in ("dense", "bm25", "fusion", "total")}
+        self._errors = {"dense": 0, "bm25": 0}
+
+    @property
+    def bm25_ready(self) -> bool:
+        return self._indexed_version is not None
+
+    def ensure_index(self):
+        """Запустить фоновую перестройку BM25, если версия коллекции сменилась или индекс устарел"""
+        if not self.qdrant_manager.is_connected:
+            return
+        version = self.qdrant_manager.collection_version()
+        with self._lock:
+            stale = version != self._indexed_version or self._stale or (
+                self.refresh_interval and time.monotonic() - self._indexed_at >= self.refresh_interval
+            )
+            if self._building or not stale:
+                return
+            self._building = True
+            self._stale = False
+        threading.Thread(target=self._build, args=(version,), name="BM25Build", daemon=True).start()
+
+    def invalidate(self):
+        """Перестроить BM25 при следующем поиске (базу изменил другой процесс)"""
+        with self._lock:
+            self._stale = True
+        self.ensure_index()
+
+    def _build(self, version: str):
+        try:
+            self.bm25.build_from_qdrant(self.qdrant_manager.client, version)
+            self._indexed_version = version
+            self._indexed_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"[Search] Не удалось построить BM25 по '{version}': {e}")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def search(self, query: str, top_k: int = 10, score_threshold: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Returns:
+            results - список {id, score, text, payload, dense_rank, dense_score,
+            bm25_rank, bm25_score}; latency_ms - время каждого поиска, слияния и общее;
+            errors - поиски, завершившиеся ошибкой (результат строится по остальным)
+        """
+        started = time.perf_counter()
+        self.ensure_index()
+
+        dense_future = self._pool.submit(
+            self._timed, self.qdrant_manager.search_points, query, self.candidates, score_threshold,
+        )
+        bm25_future = self._pool.submit(self._timed, self.bm25.search, query, self.candidates)
+
+        latency_ms = {}
+        errors = {}
+        hits = {}
+        for name, future in (("dense", dense_future), ("bm25", bm25_future)):
+            result, elapsed_ms, error = future.result()
+            latency_ms[name] = round(elapsed_ms, 2)
+            self._latency[name].observe(elapsed_ms)
+            if error is not None:
+                self._errors[name] += 1
+                errors[name] = str(error)
+                logger.warning(f"[Search] Поиск {name} завершился ошибкой: {error}")
+            hits[name] = result or []
+
+        fusion_started = time.perf_counter()
+        results = self._fuse(hits["dense"], hits["bm25"], top_k)
+        latency_ms["fusion"] = round((time.perf_counter() - fusion_started) * 1000, 2)
+        latency_ms["total"] = round((time.perf_counter() - started) * 1000, 2)
+        self._latency["fusion"].observe(latency_ms["fusion"])
+        self._latency["total"].observe(latency_ms["total"])
+
+        return {"results": results, "latency_ms": latency_ms, "errors": errors, "bm25_ready": self.bm25_ready}
+
+    @staticmethod
+    def _timed(func, *args):
+        started = time.perf_counter()
+        try:
+            result, error = func(*args), None
+        except Exception as e:
+            result, error = None, e
+        return result, (time.perf_counter() - started) * 1000, error
+
+    def _fuse(self, dense_hits, bm25_hits, top_k: int) -> List[Dict[str, Any]]:
+        """Reciprocal Rank Fusion двух ранжированных списков"""
+        merged: Dict[str, Dict[str, Any]] = {}
+
+        def entry(point_id):
+            return merged.setdefault(point_id, {
+                "id": point_id, "score": 0.0, "payload": None,
+                "dense_rank": None, "dense_score": None, "bm25_rank": None, "bm25_score": None,
+            })
+
+        for rank, hit in enumerate(dense_hits, start=1):
+            item = entry(str(hit.id))
+            item["score"] += 1.0 / (self.rrf_k + rank)
+            item["dense_rank"] = rank
+            item["dense_score"] = round(hit.score, 4)
+            item["payload"] = hit.payload or {}
+
+        for rank, (point_id, score) in enumerate(bm25_hits, start=1):
+            item = entry(point_id)
+            item["score"] += 1.0 / (self.rrf_k + rank)
+            item["bm25_rank"] = rank
+            item["bm25_score"] = round(score, 4)
+            if item["payload"] is None:
+                item["payload"] = self.bm25.payload(point_id)
+
+        results = sorted(merged.values(), key=lambda item: item["score"], reverse=True)[:top_k]
+        for item in results:
+            item["text"] = self.qdrant_manager._extract_text_from_payload(item["payload"]) or ""
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Гистограммы задержек по поискам, ошибки и состояние индекса BM25"""
+        return {
+            "latency_ms": {name: histogram.snapshot() for name, histogram in self._latency.items()},
+            "errors": dict(self._errors),
+            "bm25": {
+                "ready": self.bm25_ready,
+                "building": self._building,
+                "collection": self._indexed_version,
+                "chunks": len(self.bm25),
+            },
+        }
+
+    def close(self):
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,245 @@
+# ingestion.py
+'''
+Потоковое чтение базы знаний для загрузки в Qdrant.
+
+Строки читаются по одной (xlsx через openpyxl в режиме read_only, csv через
+модуль csv), поэтому в памяти одновременно находится только текущая пачка.
+Загрузку можно продолжить после падения: IngestionCheckpoint помнит,
+сколько строк файла уже записано в коллекцию.
+'''
+
+import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".xlsx", ".xlsm", ".csv")
+
+# Пространство имен для UUID точек: ID зависит только от источника и ключа строки
+POINT_ID_NAMESPACE = uuid.UUID("6f1c2b4e-2d0a-4c59-9a57-3f0d8e6b7c11")
+
+# Поле payload "origin": строки базы знаний и чанки загруженных документов
+# лежат в одной коллекции, переиндексация трогает только строки базы знаний
+ORIGIN_KB = "kb"
+ORIGIN_DOCUMENT = "document"
+
+
+def _header(values) -> List[str]:
+    return [str(value).strip() if value is not None else f"column_{i}" for i, value in enumerate(values)]
+
+
+def _cell(value: Any) -> Any:
+    """Значение ячейки в виде, пригодном для payload (JSON)"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, str) and not value.strip():
+        return None
+    return value
+
+
+def _iter_xlsx(path: str) -> Iterator[Dict[str, Any]]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = _header(next(rows, ()))
+        for values in rows:
+            if values is None or all(value is None for value in values):
+                continue
+            yield {column: _cell(value) for column, value in zip(header, values)}
+    finally:
+        workbook.close()
+
+
+def _iter_csv(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = _header(next(reader, []))
+        for values in reader:
+            if not any(value.strip() for value in values):
+                continue
+            yield {column: _cell(value) for column, value in zip(header, values)}
+
+
+def iter_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Строки файла базы знаний (xlsx или csv) как словари колонка -> значение"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        return _iter_xlsx(path)
+    if extension == ".csv":
+        return _iter_csv(path)
+    raise ValueError(f"Неподдерживаемый формат базы знаний: {path} (нужен один из {', '.join(SUPPORTED_EXTENSIONS)})")
+
+
+def count_rows(path: str) -> Optional[int]:
+    """Оценка числа строк для прогресса (None, если без чтения файла не узнать)"""
+    if os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+            return max_row - 1 if max_row else None
+        finally:
+            workbook.close()
+    return None
+
+
+def iter_row_batches(path: str, batch_size: int, skip: int = 0) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Пачки строк по batch_size.
+
+    Yields:
+        (номер первой строки пачки, строки); первые skip строк пропускаются
+    """
+    rows = iter_rows(path)
+    start = skip
+    for _ in islice(rows, skip):
+        pass
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield start, batch
+        start += len(batch)
+
+
+def row_to_text(row: Dict[str, Any]) -> str:
+    """Текст строки для эмбеддинга: все непустые значения через пробел"""
+    return " ".join(str(value) for value in row.values() if value is not None)
+
+
+def row_key(row: Dict[str, Any], key_column: Optional[str] = None) -> str:
+    """
+    Ключ строки: значение key_column, если колонка задана и заполнена,
+    иначе сам текст строки (ID тогда выводится из содержимого).
+    """
+    if key_column and row.get(key_column) is not None:
+        return str(row[key_column])
+    return row_to_text(row)
+
+
+def point_id(source: str, key: str) -> str:
+    """Стабильный ID точки Qdrant: один и тот же для одной строки между запусками"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\0{key}"))
+
+
+def content_hash(row: Dict[str, Any]) -> str:
+    """Хэш содержимого строки: по нему видно, изменилась ли строка с прошлой загрузки"""
+    data = json.dumps(row, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class IngestionCheckpoint:
+    """
+    Контрольная точка загрузки: сколько строк файла уже в коллекции.
+
+    Точка привязана к файлу (путь, размер, время изменения) и коллекции:
+    если файл поменялся, продолжать с нее нельзя и загрузка идет сначала.
+    Файл перезаписывается атомарно (os.replace).
+    """
+
+    def __init__(self, path: str, source_path: str, collection_name: str):
+        self.path = path
+        self.source_path = source_path
+        self.collection_name = collection_name
+
+    def _signature(self) -> Dict[str, Any]:
+        stat = os.stat(self.source_path)
+        return {
+            "source": os.path.abspath(self.source_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "collection": self.collection_name,
+        }
+
+    def load_state(self) -> Optional[Dict[str, Any]]:
+        """Сохраненное состояние, если оно относится к тому же файлу и коллекции"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"[Ingestion] Контрольная точка {self.path} повреждена, загрузка сначала: {e}")
+            return None
+
+        if {key: state.get(key) for key in self._signature()} != self._signature():
+            logger.info("[Ingestion] Контрольная точка от другого файла или коллекции, загрузка сначала")
+            return None
+        return state
+
+    def load(self) -> int:
+        """Сколько строк уже загружено (0 - начинать сначала)"""
+        state = self.load_state()
+        return int(state.get("rows_done", 0)) if state else 0
+
+    def save(self, rows_done: int, **extra):
+        """Сохранить позицию; extra - дополнительные поля состояния (например, целевая коллекция)"""
+        state = dict(self._signature(), **extra, rows_done=rows_done, updated_at=datetime.now().isoformat())
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        for path in (self.path, f"{self.path}.tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class DedupedRows:
+    """
+    Строки, чанки которых (часть или все) отброшены как почти-дубликаты
+    других строк: row_id -> content_hash (JSON рядом с контрольной точкой).
+
+    У строки без единой точки хэш есть только здесь - иначе каждая
+    инкрементальная переиндексация считала бы ее новой и кодировала заново.
+    Когда в базе меняются или удаляются строки, reindex() проверяет строки
+    из списка заново: их отброшенный текст мог держаться на чанках этих
+    строк. Записи привязаны к версии коллекции: у новой версии список
+    начинается с нуля.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, collection_name: str) -> Dict[str, str]:
+        """row_id -> content_hash для версии коллекции"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"[Ingestion] Список строк-дубликатов {self.path} поврежден: {e}")
+            return {}
+        if state.get("collection") != collection_name:
+            return {}
+        return dict(state.get("rows", {}))
+
+    def save(self, collection_name: str, rows: Dict[str, str]):
+        state = {"collection": collection_name, "rows": rows, "updated_at": datetime.now().isoformat()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
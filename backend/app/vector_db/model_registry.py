@@ -0,0 +1,179 @@
+# model_registry.py
+'''
+Общий на процесс реестр моделей: каждая модель (энкодер эмбеддингов,
+кросс-энкодер) загружается в процессе один раз, сколько бы QdrantManager,
+QdrantLoader и реранкеров ее ни запросило.
+
+Процессы пула обработки документов (rag/document_pipeline.py) запускаются
+через spawn и ничего не наследуют: каждый загружает свою копию энкодера
+при первом документе. На узле это WEB_CONCURRENCY x DOCUMENT_WORKERS
+копий весов сверх предзагруженной (их память видна в /rag/memory).
+
+Предзагрузка до fork: preload() в родительском процессе (gunicorn
+--preload, см. gunicorn.conf.py) загружает модели, после чего воркеры
+получают их копией-при-записи - веса лежат в памяти один раз на узел.
+Чтобы страницы весов не копировались:
+- в родителе модель только загружается, без инференса (пул потоков
+  OpenMP, созданный до fork, может повесить воркеры);
+- после загрузки вызывается gc.freeze(): сборщик мусора воркера
+  не трогает заголовки объектов родителя.
+
+memory_report() - RSS / PSS / разделяемая память процесса и размер весов
+каждой модели реестра (/rag/memory).
+'''
+
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from core.config import EmbeddingSettings
+
+
+logger = logging.getLogger(__name__)
+
+_models: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+_registry_lock = threading.Lock()
+# PID процесса, загрузившего модели до fork (None - предзагрузки не было)
+_preloaded_pid: Optional[int] = None
+
+
+def get_model(key: Tuple[str, ...], factory: Callable[[], Any]):
+    """Модель по ключу; factory вызывается один раз на процесс"""
+    entry = _models.get(key)
+    if entry is not None:
+        return entry["model"]
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        entry = _models.get(key)
+        if entry is None:
+            started = time.perf_counter()
+            model = factory()
+            entry = {
+                "model": model,
+                "load_s": round(time.perf_counter() - started, 2),
+                "pid": os.getpid(),
+                "weights_mb": round(_weights_bytes(model) / 2 ** 20, 1),
+            }
+            _models[key] = entry
+            logger.info(f"[Models] {'/'.join(key)} загружена за {entry['load_s']} с ({entry['weights_mb']} МБ весов)")
+        return entry["model"]
+
+
+def get_loaded(key: Tuple[str, ...]):
+    """Модель, если она уже загружена (без загрузки)"""
+    entry = _models.get(key)
+    return entry["model"] if entry is not None else None
+
+
+def get_encoder(backend: Optional[str] = None, model_name: Optional[str] = None,
+                onnx_dir: Optional[str] = None, threads: Optional[int] = None):
+    """Энкодер эмбеддингов (аргументы переопределяют EmbeddingSettings)"""
+    from vector_db.embedding_backends import load_encoder
+
+    settings = EmbeddingSettings()
+    backend = backend or settings.embedding_backend
+    model_name = model_name or settings.embedding_model
+    onnx_dir = onnx_dir or settings.embedding_onnx_dir
+    key = ("encoder", backend, model_name if backend == "torch" else os.path.abspath(onnx_dir))
+    return get_model(key, lambda: load_encoder(backend, model_name, onnx_dir, threads))
+
+
+def get_cross_encoder(model_name: str):
+    """Кросс-энкодер для переранжирования"""
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device="cpu")
+    return get_model(cross_encoder_key(model_name), load)
+
+
+def cross_encoder_key(model_name: str) -> Tuple[str, ...]:
+    return ("cross-encoder", model_name)
+
+
+def preload(encoder: bool = True, reranker_model: Optional[str] = None):
+    """
+    Загрузить модели в текущем (родительском) процессе до запуска воркеров.
+    reranker_model=None - кросс-энкодер, если включен RERANKER_ENABLED.
+    """
+    global _preloaded_pid
+    started = time.perf_counter()
+    if encoder:
+        get_encoder()
+    if reranker_model is None and os.getenv("RERANKER_ENABLED", "false").lower() == "true":
+        from vector_db.reranker import CrossEncoderReranker
+        reranker_model = os.getenv("RERANKER_MODEL", CrossEncoderReranker.DEFAULT_MODEL)
+    if reranker_model:
+        get_cross_encoder(reranker_model)
+
+    # Объекты, созданные до fork, больше не просматриваются сборщиком мусора,
+    # поэтому их страницы остаются общими с воркерами
+    gc.collect()
+    gc.freeze()
+    _preloaded_pid = os.getpid()
+    logger.info(f"[Models] Предзагрузка за {time.perf_counter() - started:.1f} с, {process_memory()}")
+
+
+def _weights_bytes(model) -> int:
+    """Размер весов: параметры PyTorch или файл модели ONNX"""
+    modules = [model, getattr(model, "model", None)]  # CrossEncoder хранит трансформер в .model
+    for module in modules:
+        if module is not None and hasattr(module, "parameters"):
+            try:
+                return sum(p.numel() * p.element_size() for p in module.parameters())
+            except Exception:
+                pass
+    model_path = getattr(model, "model_file", None)
+    if model_path and os.path.exists(model_path):
+        return os.path.getsize(model_path)
+    return 0
+
+
+def process_memory(pid: Optional[int] = None) -> Dict[str, float]:
+    """
+    Память процесса в МБ (по умолчанию текущего). rss - все резидентные
+    страницы, в том числе общие с родителем; pss - доля процесса (общие
+    страницы делятся на число процессов), private - страницы только этого
+    процесса. Linux: /proc/<pid>/smaps_rollup, иначе - только пиковый RSS
+    текущего процесса.
+    """
+    fields = {"Rss": "rss", "Pss": "pss", "Shared_Clean": "shared", "Shared_Dirty": "shared",
+              "Private_Clean": "private", "Private_Dirty": "private"}
+    memory: Dict[str, float] = {}
+    try:
+        with open(f"/proc/{pid or 'self'}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    key = fields[name]
+                    memory[key] = memory.get(key, 0.0) + int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    if "rss" not in memory and pid is None:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["rss"] = peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {key: round(value, 1) for key, value in memory.items()}
+
+
+def memory_report() -> Dict[str, Any]:
+    """Память процесса и модели реестра (preloaded - загружена в родителе до fork)"""
+    return {
+        "pid": os.getpid(),
+        "preloaded_pid": _preloaded_pid,
+        "memory_mb": process_memory(),
+        "models": [
+            {
+                "key": "/".join(key),
+                "load_s": entry["load_s"],
+                "weights_mb": entry["weights_mb"],
+                "preloaded": entry["pid"] != os.getpid(),
+            }
+            for key, entry in list(_models.items())
+        ],
+    }
@@ -0,0 +1,195 @@
+# qdrant_connection.py
+'''
+Подключение к Qdrant для синхронного QdrantManager - с автоматом-предохранителем
+(circuit breaker).
+
+- у каждого вызова свой таймаут (call(..., timeout=...)): вызов
+  выполняется в пуле потоков, и ожидание ответа ограничено;
+- после failure_threshold ошибок подряд (разрыв соединения или таймаут)
+  подключение считается потерянным: вызовы сразу получают ConnectionError
+  и не ждут таймаута, а QdrantManager ищет по резервному индексу;
+- пока подключения нет (в том числе если Qdrant не поднялся к старту),
+  фоновый поток проверяет Qdrant с экспоненциально растущей паузой
+  (с джиттером) и возвращает подключение, как только Qdrant ответил.
+  Запросы пользователей на этих проверках не ждут.
+
+client_factory создает клиента (например, lambda: QdrantClient(host, port=6333)),
+поэтому в тестах его можно заменить на фейковый.
+'''
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+
+logger = logging.getLogger(__name__)
+
+
+class QdrantConnection:
+    """Клиент Qdrant с таймаутом на вызов, предохранителем и фоновым переподключением"""
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        timeout: float = 5.0,
+        backoff_initial: float = 0.5,
+        backoff_max: float = 30.0,
+        failure_threshold: int = 3,
+        request_errors: Tuple[Type[BaseException], ...] = (),
+        max_concurrent_calls: int = 8,
+    ):
+        """
+        Args:
+            client_factory: создает клиента Qdrant
+            timeout: таймаут вызова по умолчанию (с)
+            backoff_initial / backoff_max: пауза между проверками Qdrant (с)
+            failure_threshold: сколько ошибок подряд разрывают подключение
+            request_errors: ошибки запроса, при которых сервер жив
+                (например, UnexpectedResponse) - они не считаются сбоем
+            max_concurrent_calls: потоков для вызовов с таймаутом
+        """
+        self.client_factory = client_factory
+        self.timeout = timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.failure_threshold = max(1, failure_threshold)
+        self.request_errors = request_errors
+
+        self.client = None
+        self.is_connected = False
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._probe_thread: Optional[threading.Thread] = None
+        self._backoff = backoff_initial
+        self._next_attempt = 0.0
+        self._failures = 0
+        self._probe_failures = 0
+        self._reconnects = 0
+        self._timeouts = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent_calls, thread_name_prefix="QdrantCall")
+
+    def connect(self) -> bool:
+        """
+        Подключиться при первом обращении. Если подключения нет и идут фоновые
+        проверки, сразу возвращает False.
+        """
+        if self.is_connected:
+            return True
+        with self._lock:
+            if self.is_connected:
+                return True
+            if self._probe_thread is not None:
+                return False
+            try:
+                self._check()
+            except Exception as e:
+                self._disconnect(e)
+                return False
+            self.is_connected = True
+            self._failures = 0
+            return True
+
+    def _check(self):
+        """Пробный запрос к Qdrant (список коллекций)"""
+        if self.client is None:
+            self.client = self.client_factory()
+        collections = self._run(lambda client: client.get_collections(), self.timeout)
+        logger.info(f"[Qdrant] Подключено, коллекций: {len(collections.collections)}")
+
+    def _disconnect(self, error: BaseException):
+        """Подключение потеряно: вызовы идут мимо Qdrant, пока фоновая проверка не вернет его (под _lock)"""
+        self.is_connected = False
+        if self._probe_thread is None and not self._closed.is_set():
+            logger.error(f"[Qdrant] Qdrant недоступен ({error}); проверка в фоне")
+            self._backoff = self.backoff_initial
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="QdrantProbe", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while True:
+            delay = min(self._backoff, self.backoff_max) * random.uniform(0.8, 1.2)
+            self._next_attempt = time.monotonic() + delay
+            if self._closed.wait(delay):
+                return
+            try:
+                self._check()
+            except Exception as e:
+                self._probe_failures += 1
+                self._backoff = min(self._backoff * 2, self.backoff_max)
+                logger.warning(f"[Qdrant] Qdrant все еще недоступен ({e}); следующая проверка через ~{self._backoff:.1f} с")
+                continue
+            with self._lock:
+                self.is_connected = True
+                self._failures = 0
+                self._reconnects += 1
+                self._probe_thread = None
+            logger.info("[Qdrant] Подключение к Qdrant восстановлено")
+            return
+
+    def _run(self, func: Callable[[Any], Any], timeout: float):
+        future = self._pool.submit(func, self.client)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            self._timeouts += 1
+            raise TimeoutError(f"Qdrant не ответил за {timeout:.1f} с")
+
+    def _record_failure(self, error: BaseException):
+        with self._lock:
+            self._failures += 1
+            if self.is_connected and self._failures >= self.failure_threshold:
+                self._disconnect(error)
+
+    def call(self, func: Callable[[Any], Any], timeout: Optional[float] = None):
+        """
+        Выполнить func(client) с таймаутом.
+
+        Raises:
+            ConnectionError: Qdrant недоступен (в том числе без обращения к нему,
+                пока подключение не восстановлено)
+            TimeoutError: вызов не уложился в таймаут
+        """
+        if not self.connect():
+            raise ConnectionError("Qdrant недоступен")
+        try:
+            result = self._run(func, self.timeout if timeout is None else timeout)
+        except TimeoutError as e:
+            self._record_failure(e)
+            raise
+        except self.request_errors:
+            # Сервер ответил ошибкой запроса - он жив
+            self._failures = 0
+            raise
+        except Exception as e:
+            self._record_failure(e)
+            raise ConnectionError(f"Qdrant недоступен: {e}") from e
+        self._failures = 0
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние подключения"""
+        return {
+            "connected": self.is_connected,
+            "consecutive_failures": self._failures,
+            "probe_failures": self._probe_failures,
+            "reconnects": self._reconnects,
+            "timeouts": self._timeouts,
+            "next_probe_in_s": round(max(0.0, self._next_attempt - time.monotonic()), 3)
+            if self._probe_thread is not None else None,
+        }
+
+    def close(self):
+        self._closed.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+        self.client = None
+        self.is_connected = False
@@ -0,0 +1,659 @@
+import logging
+import os
+import time
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+from qdrant_client.http import models
+
+from vector_db.chunking import MinHashDeduplicator, TokenChunker
+from vector_db.model_registry import get_encoder
+from vector_db.embedding_service import EmbeddingService
+from vector_db.fallback_index import export_collection
+from vector_db.quantization import quantization_config
+from vector_db.ingestion import (
+    ORIGIN_DOCUMENT, ORIGIN_KB, DedupedRows, IngestionCheckpoint, content_hash, count_rows, iter_row_batches, point_id,
+    row_key, row_to_text,
+)
+
+'''
+Нужна ещё openpyxl
+pip install openpyxl
+
+ http://localhost:6333/collections <--- проверка коллекций
+
+Файл читается построчно пачками по batch_size: пачка кодируется
+одним вызовом модели, а запись в Qdrant идет в фоне не более чем
+concurrency запросами одновременно.
+
+Текст строки режется на чанки окном в токенах энкодера (vector_db/chunking.py),
+почти-дубликаты чанков отбрасываются до кодирования (MinHash/LSH).
+
+ID строки (row_id) выводится из имени файла и ключа строки (key_column
+или сам текст строки), ID чанка - из row_id и номера чанка; в payload
+хранится content_hash строки. Поэтому reindex() кодирует и записывает
+только новые и измененные строки и удаляет точки строк, которых в файле
+больше нет.
+
+collection_name - это алиас. Поиск (QdrantManager) идет через него,
+а rebuild() собирает новую версию коллекции ({алиас}_vГГГГММДДЧЧММСС)
+рядом с рабочей, ждет окончания индексации и атомарно переключает
+алиас. Предыдущая версия остается для rollback().
+
+В той же коллекции лежат чанки загруженных документов (rag/document_pipeline.py,
+origin = "document"): reindex() их не видит и не удаляет, rebuild()
+переносит их в новую версию.
+
+После reindex() и rebuild() коллекция выгружается в резервный индекс
+(vector_db/fallback_index.py, каталог fallback_path), по которому
+QdrantManager ищет, пока Qdrant недоступен.
+
+quantization (none / int8 / binary, vector_db/quantization.py) задает
+квантование новых версий коллекции; исходные векторы квантованной
+коллекции лежат на диске и используются для переоценки кандидатов.
+
+Запуск - scripts/qdrant_loader.py.
+'''
+
+logger = logging.getLogger(__name__)
+
+
+class QdrantLoader:
+    # Размер страницы при чтении ID и хэшей существующих точек
+    SCROLL_PAGE_SIZE = 1000
+    # Порог индексации (КБ), который включается после загрузки версии
+    INDEXING_THRESHOLD = 100
+    # Сколько версий коллекции хранить (рабочая + для отката)
+    KEEP_VERSIONS = 2
+
+    def __init__(
+        self,
+        collection_name="test_db1",
+        import_data_name="KnowlengeBase.xlsx",
+        batch_size=256,
+        concurrency=4,
+        checkpoint_path=None,
+        key_column=None,
+        embedder: Optional[EmbeddingService] = None,
+        chunk_tokens=None,
+        chunk_overlap=32,
+        dedup_threshold=0.85,
+        lexical_index=None,
+        fallback_path=None,
+        quantization="none",
+    ):
+        self.collection_name = collection_name
+        self.import_data_name = import_data_name
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.key_column = key_column
+        self.source = os.path.basename(import_data_name)
+        self.client = QdrantClient(host=os.getenv("QDRANT_HOST", "localhost"), port=int(os.getenv("QDRANT_PORT", "6333")))
+        self.checkpoint = IngestionCheckpoint(
+            checkpoint_path or f"{import_data_name}.{collection_name}.checkpoint.json",
+            import_data_name,
+            collection_name,
+        )
+        # Строки, чанки которых (часть или все) отброшены как дубликаты других строк:
+        # reindex() не кодирует их каждый раз и проверяет заново при изменении базы
+        self.deduped_rows = DedupedRows(f"{import_data_name}.{collection_name}.deduped_rows.json")
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.dedup_threshold = dedup_threshold
+        self._embedder = embedder
+        self._chunker = None
+        # Индекс BM25 (vector_db/bm25_index.py), который reindex() держит в синхроне с коллекцией
+        self.lexical_index = lexical_index
+        quantization_config(quantization)  # проверка названия режима
+        self.quantization = quantization
+        # Каталог резервного индекса ("" - не выгружать)
+        self.fallback_path = os.getenv("FALLBACK_INDEX_PATH", "fallback_index") if fallback_path is None else fallback_path
+
+    @property
+    def embedder(self) -> EmbeddingService:
+        if self._embedder is None:
+            # Модель для эмбеддингов (бэкенд - из настроек) из общего реестра: если она
+            # уже загружена менеджером поиска, второй копии не будет
+            self._embedder = EmbeddingService(get_encoder(), max_batch_size=64)
+        return self._embedder
+
+    @property
+    def chunker(self) -> TokenChunker:
+        """Окно чанка в токенах той же модели, которой кодируются чанки"""
+        if self._chunker is None:
+            self._chunker = TokenChunker.for_encoder(
+                self.embedder.encoder, overlap=self.chunk_overlap, max_tokens=self.chunk_tokens,
+            )
+        return self._chunker
+
+    def resume_position(self):
+        """С какой строки продолжать полную загрузку (0 - с начала)"""
+        return self.checkpoint.load()
+
+    def load(self, start_row=0, target=None):
+        """
+        Полная загрузка файла в коллекцию target (с контрольной точкой).
+
+        При продолжении с контрольной точки уже загруженные строки только
+        режутся на чанки, чтобы отсев дубликатов видел их содержимое.
+        """
+        target = target or self.collection_name
+        total = count_rows(self.import_data_name)
+        if start_row:
+            print(f"[Qdrant] Продолжаем загрузку со строки {start_row}")
+
+        deduplicator = self._new_deduplicator()
+        deduped = self.deduped_rows.load(target) if start_row else {}
+        # Контрольная точка двигается только по непрерывному префиксу записанных пачек
+        done_rows = start_row
+        finished = {}
+        stored = 0
+        started = time.perf_counter()
+
+        def batches():
+            for start, rows in iter_row_batches(self.import_data_name, self.batch_size):
+                loaded = max(0, min(start_row - start, len(rows)))
+                for row in rows[:loaded]:
+                    for chunk in self.chunker.split(row_to_text(row)):
+                        deduplicator.seed(chunk)
+                if loaded < len(rows):
+                    points = self._make_points(rows[loaded:], deduplicator, deduped)
+                    yield start + loaded, len(rows) - loaded, points
+
+        def on_done(start, count, points_count):
+            nonlocal done_rows, stored
+            stored += points_count
+            finished[start] = count
+            while done_rows in finished:
+                done_rows += finished.pop(done_rows)
+            self.checkpoint.save(done_rows, target=target)
+            self._report_progress(done_rows, start_row, total, started)
+
+        self._run_upserts(batches(), on_done, target)
+        self.deduped_rows.save(target, deduped)
+
+        print(f"[Qdrant] Loaded {done_rows - start_row} rows as {stored} chunks with 'text' field "
+              f"за {time.perf_counter() - started:.1f} с; {deduplicator.stats()}")
+        self.checkpoint.clear()
+        return done_rows
+
+    def reindex(self) -> Dict[str, int]:
+        """
+        Инкрементальная переиндексация.
+
+        Новые и измененные строки (по content_hash) режутся на чанки,
+        кодируются и записываются, неизмененные пропускаются, точки
+        удаленных строк и лишние чанки измененных удаляются. Удаление
+        идет только после успешного прохода по файлу.
+
+        Returns:
+            Счетчики added / updated / skipped / deleted / duplicates / rechecked /
+            deduped_pruned / duplicate_chunks
+        """
+        if self.alias_target() is None and not self.client.collection_exists(self.collection_name):
+            # Базы еще нет - заводим пустую версию за алиасом
+            target = self._version_name()
+            self.create_collection(target)
+            self._enable_indexing(target)
+            self.switch_alias(target)
+
+        started = time.perf_counter()
+        version = self.alias_target() or self.collection_name
+        existing = self._existing_rows()
+        deduped = self.deduped_rows.load(version)
+        for rid, row_hash in deduped.items():
+            existing.setdefault(rid, (row_hash, []))
+        deduplicator = self._new_deduplicator()
+        stats = {"added": 0, "updated": 0, "skipped": 0, "deleted": 0, "duplicates": 0, "rechecked": 0}
+        seen = set()
+        changed_ids = set()
+        stale_points = []
+        # row_id -> ID чанков строки в коллекции после прохода по файлу
+        stored = {}
+
+        def batches():
+            for start, rows in iter_row_batches(self.import_data_name, self.batch_size):
+                changed = []
+                for row in rows:
+                    rid = point_id(self.source, row_key(row, self.key_column))
+                    if rid in seen:
+                        stats["duplicates"] += 1
+                        continue
+                    seen.add(rid)
+
+                    old_hash, old_points = existing.get(rid, (None, []))
+                    if old_hash is not None and old_hash == content_hash(row):
+                        stats["skipped"] += 1
+                        # Чанки неизмененной строки уже в коллекции - учитываем их при отсеве дубликатов
+                        stored[rid] = set(old_points)
+                        self._seed_stored(deduplicator, row, rid, stored[rid])
+                        continue
+                    stats["updated" if rid in existing else "added"] += 1
+                    changed.append(row)
+                    changed_ids.add(rid)
+
+                if changed:
+                    points = self._make_points(changed, deduplicator, deduped)
+                    # Чанки прежней версии строк, которые не перезаписаны новыми
+                    new_ids = {point.id for point in points}
+                    for row in changed:
+                        rid = point_id(self.source, row_key(row, self.key_column))
+                        stored[rid] = set()
+                        stale_points.extend(pid for pid in existing.get(rid, (None, []))[1] if pid not in new_ids)
+                    for point in points:
+                        stored[point.payload["row_id"]].add(point.id)
+                    yield start, len(changed), points
+
+        def on_done(start, count, points_count):
+            print(f"[Qdrant] Reindex: записано {count} строк ({points_count} чанков), пачка со строки {start}")
+
+        self._run_upserts(batches(), on_done, self.collection_name)
+
+        removed_rows = [rid for rid in existing if rid not in seen]
+        for rid in removed_rows:
+            stale_points.extend(existing[rid][1])
+            deduped.pop(rid, None)
+        # Строки, которые были только в списке дубликатов (без точек), удаленными не считаются
+        stats["deleted"] = sum(1 for rid in removed_rows if existing[rid][1])
+        stats["deduped_pruned"] = len(removed_rows) - stats["deleted"]
+        if stats["updated"] or stats["deleted"]:
+            # Чанки неизмененных строк, отброшенные как дубликаты измененных или
+            # удаленных строк, иначе пропали бы из поиска - проверяем эти строки заново
+            recheck = {rid for rid in deduped if rid not in changed_ids}
+            if recheck:
+                stats["rechecked"] = len(recheck)
+                self._run_upserts(self._recheck_batches(recheck, existing, stored, deduped, stale_points),
+                                  on_done, self.collection_name)
+        self.deduped_rows.save(version, deduped)
+        for i in range(0, len(stale_points), self.SCROLL_PAGE_SIZE):
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=stale_points[i:i + self.SCROLL_PAGE_SIZE]),
+                wait=True,
+            )
+        if self.lexical_index is not None:
+            self.lexical_index.remove_points(stale_points)
+        stats["duplicate_chunks"] = deduplicator.duplicates
+
+        changed = stats["added"] or stats["updated"] or stats["deleted"]
+        if self.fallback_path and (changed or not os.path.exists(self.fallback_path)):
+            self.export_fallback()
+
+        stats["duration_ms"] = int((time.perf_counter() - started) * 1000)
+        logger.info(f"[Qdrant] Reindex '{self.collection_name}' из {self.source}: {stats}")
+        return stats
+
+    def export_fallback(self):
+        """Выгрузить коллекцию в резервный индекс; ошибка выгрузки не ломает загрузку"""
+        if not self.fallback_path:
+            return
+        try:
+            export_collection(self.client, self.collection_name, self.fallback_path, self.SCROLL_PAGE_SIZE)
+        except Exception as e:
+            logger.error(f"[Qdrant] Не удалось выгрузить резервный индекс в {self.fallback_path}: {e}")
+
+    def _existing_rows(self) -> Dict[str, Tuple[Optional[str], List[str]]]:
+        """
+        Строки, уже записанные в коллекцию: row_id -> (content_hash, ID их чанков).
+
+        У точек старого формата (без row_id) строкой считается сама точка,
+        а хэша нет - такие строки будут перезаписаны.
+        """
+        rows = {}
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=self._kb_filter(),
+                limit=self.SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_payload=["content_hash", "row_id"],
+                with_vectors=False,
+            )
+            for point in points:
+                payload = point.payload or {}
+                rid = payload.get("row_id") or str(point.id)
+                _, point_ids = rows.setdefault(rid, (payload.get("content_hash"), []))
+                point_ids.append(str(point.id))
+            if offset is None:
+                return rows
+
+    @staticmethod
+    def _kb_filter() -> models.Filter:
+        """
+        Точки базы знаний. Чанки документов, записанные до появления поля
+        origin, узнаются по document_id.
+        """
+        return models.Filter(
+            must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="document_id"))],
+            must_not=[models.FieldCondition(key="origin", match=models.MatchValue(value=ORIGIN_DOCUMENT))],
+        )
+
+    @staticmethod
+    def _documents_filter() -> models.Filter:
+        """Чанки загруженных документов"""
+        return models.Filter(should=[
+            models.FieldCondition(key="origin", match=models.MatchValue(value=ORIGIN_DOCUMENT)),
+            models.Filter(must_not=[models.IsEmptyCondition(is_empty=models.PayloadField(key="document_id"))]),
+        ])
+
+    def copy_documents(self, source, target) -> int:
+        """
+        Скопировать чанки загруженных документов (с векторами) из source в target.
+        ID точек те же, поэтому повторное копирование ничего не дублирует.
+        """
+        copied = 0
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=source,
+                scroll_filter=self._documents_filter(),
+                limit=self.SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                self.client.upsert(target, points=[
+                    PointStruct(id=point.id, vector=point.vector, payload=point.payload) for point in points
+                ], wait=True)
+                copied += len(points)
+            if offset is None:
+                return copied
+
+    def _make_points(self, rows, deduplicator: MinHashDeduplicator, deduped: Dict[str, str]) -> List[PointStruct]:
+        """
+        Разбить строки на чанки, отбросить почти-дубликаты, закодировать
+        оставшиеся чанки одной пачкой и собрать точки со стабильными ID.
+        """
+        return self._encode_points(self._select_chunks(rows, deduplicator, deduped))
+
+    def _select_chunks(self, rows, deduplicator: MinHashDeduplicator, deduped: Dict[str, str]) -> List[tuple]:
+        """
+        Чанки строк, оставшиеся после отсева почти-дубликатов.
+
+        Строки, потерявшие хотя бы один чанк, запоминаются в deduped
+        (row_id -> content_hash): их отброшенный текст держится на чанках
+        других строк, и при изменении тех строк их нужно проверить заново.
+        """
+        items = []
+        for row in rows:
+            rid = point_id(self.source, row_key(row, self.key_column))
+            row_hash = content_hash(row)
+            chunks = self.chunker.split(row_to_text(row))
+            kept = deduplicator.filter(chunks)
+            if len(kept) < len(chunks):
+                deduped[rid] = row_hash
+            else:
+                deduped.pop(rid, None)
+            for index in kept:
+                items.append((row, rid, row_hash, index, chunks[index]))
+        return items
+
+    def _encode_points(self, items: List[tuple]) -> List[PointStruct]:
+        if not items:
+            return []
+
+        # Кодируем чанки пачкой, пока предыдущие пачки пишутся в Qdrant
+        vectors = self.embedder.encode_many([item[4] for item in items])
+
+        points = []
+        for (row, rid, row_hash, index, text), vector in zip(items, vectors):
+            # Создаем payload с ОБЯЗАТЕЛЬНЫМ полем "text"
+            payload = dict(row)
+            payload["text"] = text
+            payload["source"] = self.source
+            payload["row_id"] = rid
+            payload["chunk_index"] = index
+            payload["content_hash"] = row_hash
+            payload["origin"] = ORIGIN_KB
+            points.append(PointStruct(
+                id=point_id(self.source, f"{rid}#{index}"),
+                vector=vector.tolist(),
+                payload=payload,
+            ))
+        return points
+
+    def _seed_stored(self, deduplicator: MinHashDeduplicator, row, rid: str, point_ids):
+        """Учесть при отсеве дубликатов только чанки строки, которые есть в коллекции"""
+        for index, chunk in enumerate(self.chunker.split(row_to_text(row))):
+            if point_id(self.source, f"{rid}#{index}") in point_ids:
+                deduplicator.seed(chunk)
+
+    def _recheck_batches(self, recheck, existing, stored, deduped: Dict[str, str], stale_points: List[str]):
+        """
+        Второй проход reindex(): заново отсеять и закодировать чанки строк recheck.
+
+        Отсев идет в порядке файла с чистым дедупликатором, в который
+        остальные строки вносят только свои чанки из коллекции, - как при
+        полной загрузке. Пачки - в формате _run_upserts.
+        """
+        deduplicator = self._new_deduplicator()
+        seen = set()
+        for start, rows in iter_row_batches(self.import_data_name, self.batch_size):
+            items = []
+            count = 0
+            for row in rows:
+                rid = point_id(self.source, row_key(row, self.key_column))
+                if rid in seen:
+                    continue
+                seen.add(rid)
+                if rid in recheck:
+                    items.extend(self._select_chunks([row], deduplicator, deduped))
+                    count += 1
+                else:
+                    self._seed_stored(deduplicator, row, rid, stored.get(rid, ()))
+            if count:
+                points = self._encode_points(items)
+                new_ids = {point.id for point in points}
+                for rid in {point_id(self.source, row_key(row, self.key_column)) for row in rows} & recheck:
+                    stale_points.extend(pid for pid in existing[rid][1] if pid not in new_ids)
+                yield start, count, points
+
+    def _new_deduplicator(self) -> MinHashDeduplicator:
+        return MinHashDeduplicator(threshold=self.dedup_threshold)
+
+    def _run_upserts(self, batches: Iterable[Tuple[int, int, List[PointStruct]]], on_done, collection_name):
+        """
+        Записать пачки точек, не больше concurrency запросов одновременно.
+
+        batches - (первая строка, число строк, точки); on_done вызывается
+        с (первая строка, число строк, число точек) после записи пачки.
+        """
+        # Новая версия коллекции попадает в BM25 целиком при переключении алиаса
+        sync_index = self.lexical_index is not None and collection_name == self.collection_name
+
+        def upsert(start, count, points):
+            if points:
+                self.client.upsert(collection_name, points=points, wait=True)
+                if sync_index:
+                    self.lexical_index.add_points(points)
+            return start, count, len(points)
+
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="QdrantUpsert") as pool:
+            for start, count, points in batches:
+                # Незавершенных записей не больше concurrency: память ограничена
+                while len(in_flight) >= self.concurrency:
+                    completed, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        on_done(*future.result())
+
+                in_flight.add(pool.submit(upsert, start, count, points))
+
+            for future in in_flight:
+                on_done(*future.result())
+
+    @staticmethod
+    def _report_progress(done_rows, start_row, total, started):
+        elapsed = time.perf_counter() - started
+        rate = (done_rows - start_row) / elapsed if elapsed else 0.0
+        if total:
+            eta = (total - done_rows) / rate if rate else 0.0
+            print(f"[Qdrant] {done_rows}/{total} строк ({done_rows / total:.0%}), {rate:.0f} строк/с, осталось ~{eta:.0f} с")
+        else:
+            print(f"[Qdrant] {done_rows} строк, {rate:.0f} строк/с")
+
+    def rebuild(self, restart=False) -> str:
+        """
+        Полная пересборка без простоя поиска.
+
+        Файл загружается в новую версию коллекции; рабочая версия за
+        алиасом в это время продолжает отвечать. Когда индексация новой
+        версии закончена, алиас переключается одной операцией.
+        Прерванная пересборка продолжается с контрольной точки в ту же версию.
+
+        Returns:
+            Имя новой версии коллекции
+        """
+        state = None if restart else self.checkpoint.load_state()
+        target = state.get("target") if state else None
+        start_row = int(state.get("rows_done", 0)) if state else 0
+        if not target or not self.client.collection_exists(target):
+            target, start_row = self._version_name(), 0
+            self.create_collection(target)
+
+        self.load(start_row, target)
+        current = self.alias_target()
+        if current is None and self.client.collection_exists(self.collection_name):
+            current = self.collection_name  # старая схема: обычная коллекция вместо алиаса
+        if current is not None:
+            # Загруженные документы не из файла базы знаний - переносим их в новую версию
+            copied = self.copy_documents(current, target)
+            print(f"[Qdrant] Перенесено {copied} чанков загруженных документов из {current}")
+        self._enable_indexing(target)
+        info = self.wait_until_ready(target)
+        if not info.points_count:
+            raise RuntimeError(f"Версия {target} пуста, алиас не переключен")
+
+        previous = self.switch_alias(target)
+        print(f"[Qdrant] Алиас '{self.collection_name}': {previous} -> {target} ({info.points_count} точек)")
+        if previous is not None:
+            # Документы, загруженные в прежнюю версию, пока шла индексация
+            self.copy_documents(previous, target)
+        self._drop_old_versions()
+        self.export_fallback()
+        return target
+
+    def rollback(self) -> str:
+        """Вернуть алиас на предыдущую версию коллекции"""
+        current = self.alias_target()
+        older = [name for name in self.versions() if current is None or name < current]
+        if not older:
+            raise RuntimeError(f"Нет предыдущей версии коллекции '{self.collection_name}' для отката")
+        self.switch_alias(older[-1])
+        print(f"[Qdrant] Откат алиаса '{self.collection_name}': {current} -> {older[-1]}")
+        self.export_fallback()
+        return older[-1]
+
+    def versions(self) -> List[str]:
+        """Версии коллекции за алиасом, от старых к новым"""
+        prefix = f"{self.collection_name}_v"
+        return sorted(c.name for c in self.client.get_collections().collections if c.name.startswith(prefix))
+
+    def alias_target(self) -> Optional[str]:
+        """Коллекция, на которую сейчас указывает алиас"""
+        for alias in self.client.get_aliases().aliases:
+            if alias.alias_name == self.collection_name:
+                return alias.collection_name
+        return None
+
+    def switch_alias(self, target) -> Optional[str]:
+        """Атомарно направить алиас на target; возвращает прежнюю коллекцию"""
+        previous = self.alias_target()
+        operations = []
+        if previous is not None:
+            operations.append(models.DeleteAliasOperation(
+                delete_alias=models.DeleteAlias(alias_name=self.collection_name)
+            ))
+        elif self.client.collection_exists(self.collection_name):
+            # Разовый переход со старой схемы: на месте алиаса - обычная коллекция
+            logger.warning(f"[Qdrant] Коллекция '{self.collection_name}' заменяется алиасом на {target}")
+            self.client.delete_collection(self.collection_name)
+        operations.append(models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=target, alias_name=self.collection_name)
+        ))
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+        return previous
+
+    def wait_until_ready(self, collection_name, timeout=1800.0, poll_interval=1.0, grey_retrigger=30.0):
+        """
+        Дождаться окончания индексации вместо фиксированной паузы.
+
+        Сразу после включения индексации коллекция еще может быть GREEN,
+        поэтому готовой она считается, только когда вдобавок проиндексированы
+        все векторы, кроме сегментов меньше порога индексации (их Qdrant не
+        индексирует). GREY (оптимизация не запущена) - не ошибка: оптимизация
+        запускается пустым обновлением конфигурации, и ожидание продолжается.
+        """
+        deadline = time.monotonic() + timeout
+        last_trigger = None
+        while True:
+            info = self.client.get_collection(collection_name)
+            if info.status == models.CollectionStatus.GREEN and self._fully_indexed(info):
+                return info
+            if info.status == models.CollectionStatus.RED:
+                raise RuntimeError(f"Ошибка оптимизации коллекции {collection_name}: {info.optimizer_status}")
+            if info.status == models.CollectionStatus.GREY and (
+                    last_trigger is None or time.monotonic() - last_trigger >= grey_retrigger):
+                print(f"[Qdrant] {collection_name}: статус grey, запускаем оптимизацию")
+                self.client.update_collection(collection_name, optimizer_config=models.OptimizersConfigDiff())
+                last_trigger = time.monotonic()
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Коллекция {collection_name} не проиндексирована за {timeout:.0f} с")
+            print(f"[Qdrant] {collection_name}: статус {info.status}, "
+                  f"проиндексировано {info.indexed_vectors_count or 0}/{info.points_count or 0}")
+            time.sleep(poll_interval)
+
+    def _fully_indexed(self, info) -> bool:
+        """Проиндексированы ли все векторы, которые Qdrant вообще будет индексировать"""
+        points = info.points_count or 0
+        indexed = info.indexed_vectors_count or 0
+        if indexed >= points:
+            return True
+        # Сегмент меньше порога (КБ исходных векторов) остается без индекса
+        vector_bytes = info.config.params.vectors.size * 4
+        below_threshold = self.INDEXING_THRESHOLD * 1024 // vector_bytes
+        return points - indexed <= (info.segments_count or 1) * below_threshold
+
+    def _version_name(self) -> str:
+        return f"{self.collection_name}_v{datetime.now():%Y%m%d%H%M%S}"
+
+    def _drop_old_versions(self):
+        """Удалить версии старше KEEP_VERSIONS последних (рабочую не трогаем)"""
+        current = self.alias_target()
+        for name in self.versions()[:-self.KEEP_VERSIONS]:
+            if name != current:
+                self.client.delete_collection(name)
+                print(f"[Qdrant] Старая версия '{name}' удалена")
+
+    def create_collection(self, collection_name, vector_size=None):
+        """
+        Создать версию коллекции; индексация выключена до конца загрузки.
+        Размерность векторов по умолчанию - размерность энкодера из настроек.
+        """
+        if vector_size is None:
+            vector_size = self.embedder.encoder.get_sentence_embedding_dimension()
+        quantized = self.quantization != "none"
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(
+                size=vector_size,  # Размерность векторов
+                distance=models.Distance.COSINE,  # Метрика расстояния
+                on_disk=quantized,  # при квантовании в RAM остаются только квантованные векторы
+            ),
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0),
+            quantization_config=quantization_config(self.quantization),
+        )
+        print(f"[Qdrant] New collection '{collection_name}' created (quantization: {self.quantization})")
+
+    def _enable_indexing(self, collection_name):
+        """Включить построение индекса после массовой загрузки"""
+        self.client.update_collection(
+            collection_name=collection_name,
+            optimizer_config=models.OptimizersConfigDiff(
+                indexing_threshold=self.INDEXING_THRESHOLD  # Понижаем порог индексации
+            )
+        )
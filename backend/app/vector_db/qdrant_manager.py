@@ -1,93 +1,255 @@
 import logging
+import os
+import time
 import pandas as pd
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from sentence_transformers import SentenceTransformer
+from qdrant_client.http.exceptions import UnexpectedResponse
 import numpy as np
 
+from vector_db.embedding_backends import encoder_name
+from vector_db.model_registry import get_encoder
+from vector_db.embedding_cache import EmbeddingCache
+from vector_db.embedding_service import EmbeddingService
+from vector_db.fallback_index import FallbackIndex
+from vector_db.qdrant_connection import QdrantConnection
+from vector_db.quantization import search_params
+from vector_db.reranker import CrossEncoderReranker
+from rag.context_packer import ContextPacker
+
+# Ответы search_relevant_info вместо контекста из базы знаний
+SEARCH_UNAVAILABLE = "Сервис поиска временно недоступен. Пожалуйста, проверьте подключение к базе данных."
+SEARCH_ERROR = "Произошла ошибка при поиске информации в базе данных."
+NOTHING_FOUND = "Информация по вашему вопросу не найдена в базе знаний."
+NO_CONTEXT_MESSAGES = (SEARCH_UNAVAILABLE, SEARCH_ERROR, NOTHING_FOUND)
+
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class QdrantManager:
+    # Как часто перечитывать, на какую версию коллекции указывает алиас
+    VERSION_REFRESH_INTERVAL = 30.0
+
     def __init__(self, host, collection_name="test_db1"):
-        """Инициализация менеджера Qdrant с обработкой ошибок подключения"""
+        """
+        Инициализация менеджера Qdrant с обработкой ошибок подключения.
+
+        collection_name - алиас: пересборка базы знаний переключает его
+        на новую версию коллекции, и поиск продолжает работать без простоя.
+        """
         self.collection_name = collection_name
-        self.is_connected = False
+        self._collection_version = collection_name
+        self._version_checked_at = 0.0
+
+        # Если коллекция квантована (int8 / binary): запас кандидатов и переоценка по исходным векторам
+        oversampling = os.getenv("QDRANT_QUANTIZATION_OVERSAMPLING")
+        self.search_params = search_params(
+            oversampling=float(oversampling) if oversampling else None,
+            rescore=os.getenv("QDRANT_QUANTIZATION_RESCORE", "true").lower() != "false",
+        )
+
+        # Переранжирование кандидатов кросс-энкодером (RERANKER_ENABLED=true)
+        self.reranker = None
+        self.rerank_candidates = int(os.getenv("RERANKER_CANDIDATES", "20"))
+        if os.getenv("RERANKER_ENABLED", "false").lower() == "true":
+            self.reranker = CrossEncoderReranker(
+                model_name=os.getenv("RERANKER_MODEL", CrossEncoderReranker.DEFAULT_MODEL),
+                budget_ms=float(os.getenv("RERANKER_BUDGET_MS", "150")),
+                text_getter=lambda hit: self._extract_text_from_payload(hit.payload) or "",
+            )
+
+        # Контекст в пределах бюджета токенов с MMR-отбором (CONTEXT_MAX_TOKENS=0 - склейка всех чанков)
+        self.context_packer = None
+        self.context_candidates = int(os.getenv("CONTEXT_CANDIDATES", "10"))
+        context_max_tokens = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+        if context_max_tokens > 0:
+            self.context_packer = ContextPacker(
+                max_tokens=context_max_tokens,
+                mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+                text_getter=lambda hit: self._extract_text_from_payload(hit.payload) or "",
+            )
+
+        # Локальная копия коллекции (mmap), по которой ищем, пока Qdrant недоступен
+        self.fallback_index = FallbackIndex(
+            os.getenv("FALLBACK_INDEX_PATH", "fallback_index"),
+            max_memory_bytes=int(os.getenv("FALLBACK_INDEX_MAX_MB", "256")) * 1024 * 1024,
+        )
+
+        # Кэш эмбеддингов запросов: одинаковые вопросы не кодируются повторно
+        self.embedding_cache = EmbeddingCache(
+            model_name=encoder_name(),
+            max_memory_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_MB", "64")) * 1024 * 1024,
+            disk_path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3"),
+        )
         
-        try:
-            # Инициализируем энкодер
-            self.encoder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-            
-            # Пытаемся подключиться к Qdrant
-            logger.info(f"[Qdrant] Попытка подключения к {host}:6333")
-            self.client = QdrantClient(host, port=6333, timeout=10)
-            
-            # Проверяем подключение, запрашивая список коллекций
-            collections = self.client.get_collections()
-            self.is_connected = True
-            logger.info(f"[Qdrant] Успешное подключение к Qdrant. Доступно коллекций: {len(collections.collections)}")
-            
-        except Exception as e:
-            self.is_connected = False
+        # Энкодер (бэкенд - из настроек) общий на процесс, см. vector_db/model_registry.py;
+        # одновременные запросы кодируются пачками.
+        # Без энкодера менеджер бесполезен, поэтому ошибка загрузки не глушится
+        self.encoder = get_encoder()
+        self.embedder = EmbeddingService(
+            self.encoder,
+            max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32")),
+            max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")),
+        )
+
+        # Подключение с предохранителем: после QDRANT_FAILURE_THRESHOLD ошибок подряд
+        # поиск сразу идет по резервному индексу, а Qdrant проверяется в фоне
+        # (vector_db/qdrant_connection.py) - и при старте без Qdrant тоже
+        self.search_timeout = float(os.getenv("QDRANT_SEARCH_TIMEOUT", "2"))
+        self.connection = QdrantConnection(
+            lambda: QdrantClient(host, port=6333, timeout=10),
+            timeout=float(os.getenv("QDRANT_TIMEOUT", "5")),
+            backoff_max=float(os.getenv("QDRANT_RECONNECT_MAX_S", "30")),
+            failure_threshold=int(os.getenv("QDRANT_FAILURE_THRESHOLD", "3")),
+            request_errors=(UnexpectedResponse,),
+        )
+        logger.info(f"[Qdrant] Попытка подключения к {host}:6333")
+        if not self.connection.connect():
             logger.error(f"[Qdrant] ОШИБКА: Не удалось подключиться к Qdrant на {host}:6333")
-            logger.error(f"[Qdrant] Убедитесь, что Qdrant запущен и доступен по указанному адресу")
-            logger.error(f"[Qdrant] Детали ошибки: {str(e)}")
-            # Создаем заглушку для клиента чтобы избежать ошибок при вызовах методов
-            self.client = None
+            logger.error(f"[Qdrant] Убедитесь, что Qdrant запущен и доступен по указанному адресу; "
+                         f"подключение проверяется в фоне")
+
+    @property
+    def is_connected(self) -> bool:
+        return self.connection.is_connected
+
+    @property
+    def client(self):
+        return self.connection.client
 
     def search_relevant_info(self, query, top_k=5):
         """Поиск релевантной информации в Qdrant с обработкой ошибок"""
-        if not self.is_connected or self.client is None:
+        if not self.connection.connect() and not self.fallback_index.available:
             error_msg = "[Qdrant] ОШИБКА: Qdrant не доступен. Поиск невозможен."
             logger.error(error_msg)
-            return "Сервис поиска временно недоступен. Пожалуйста, проверьте подключение к базе данных."
+            return SEARCH_UNAVAILABLE
         
         logger.info(f"[Qdrant] Поиск: '{query}'")
         
         try:
-            # Векторизация запроса
-            query_vector = self.encoder.encode(query).tolist()
-            
-            # Поиск в Qdrant
-            search_result = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_vector,
-                limit=top_k,
-                score_threshold=0.3
-            )
+            # При сборке по бюджету токенов кандидатов берется больше, объем ограничивает бюджет
+            pool = max(top_k, self.context_candidates) if self.context_packer is not None else top_k
+            with_vectors = self.context_packer is not None
+            if self.reranker is not None:
+                # Кандидаты с запасом, дальше - лучшие по оценке кросс-энкодера
+                candidates = self.search_points(query, max(pool, self.rerank_candidates), 0.3, with_vectors)
+                search_result = self.reranker.rerank(query, candidates, pool)
+            else:
+                search_result = self.search_points(query, pool, 0.3, with_vectors)
             
             logger.info(f"[Qdrant] Найдено результатов: {len(search_result)}")
+
+            if self.context_packer is not None and search_result:
+                packed = self.context_packer.pack(self.embed_query(query), search_result)
+                logger.info(f"[Qdrant] Контекст: {len(packed.chunk_ids)} из {len(search_result)} чанков, "
+                            f"{packed.tokens} токенов, сэкономлено {packed.tokens_saved} (обрезано {packed.truncated})")
+                if packed.text:
+                    return packed.text
             
-            # Сбор релевантных текстов
-            context_parts = []
-            for i, hit in enumerate(search_result):
-                logger.info(f"[Qdrant] Результат {i}: score={hit.score:.3f}")
-                logger.debug(f"[Qdrant] Ключи payload: {list(hit.payload.keys())}")
-                
-                # Пытаемся найти текстовое содержимое
-                text_content = self._extract_text_from_payload(hit.payload)
-                
-                if text_content:
-                    context_parts.append(text_content)
-                    logger.debug(f"  Текст: {text_content[:80]}...")
-                else:
-                    logger.debug(f"  Подходящий текст не найден в payload")
-            
-            context = "\n".join(context_parts)
-            if not context:
-                context = "Информация по вашему вопросу не найдена в базе знаний."
-            
-            logger.info(f"[Qdrant] Итоговый контекст: {len(context)} символов")
-            return context
+            return self.build_context(search_result)
             
         except Exception as e:
             error_msg = f"[Qdrant] ОШИБКА при выполнении поиска: {str(e)}"
             logger.error(error_msg)
-            return "Произошла ошибка при поиске информации в базе данных."
+            return SEARCH_ERROR
+
+    def search_points(self, query, top_k=5, score_threshold=None, with_vectors=False):
+        """
+        Точки Qdrant, ближайшие к запросу (без сборки контекста).
+
+        Если Qdrant недоступен, поиск идет по локальной выгрузке коллекции
+        (FallbackIndex); без выгрузки - ConnectionError. Когда подключение
+        уже признано потерянным, Qdrant не вызывается вовсе - задержка
+        поиска остается задержкой резервного индекса.
+        """
+        # Векторизация запроса (через кэш)
+        query_vector = self.embed_query(query)
+
+        try:
+            # Поиск в Qdrant (с переподключением, если соединение было потеряно)
+            return self.connection.call(lambda client: client.search(
+                collection_name=self.collection_name,
+                query_vector=query_vector.tolist(),
+                limit=top_k,
+                score_threshold=score_threshold,
+                search_params=self.search_params,
+                with_vectors=with_vectors,
+            ), timeout=self.search_timeout)
+        except Exception as e:
+            if not self.fallback_index.available:
+                raise
+            logger.warning(f"[Qdrant] Ошибка поиска ({e}), ищем по резервному индексу")
+
+        if not self.fallback_index.available:
+            raise ConnectionError("Qdrant недоступен, резервный индекс не выгружен")
+        return self.fallback_index.search(query_vector, top_k, score_threshold, with_vectors)
+
+    def collection_version(self) -> str:
+        """
+        Версия базы знаний - коллекция, на которую сейчас указывает алиас.
+
+        Значение кэшируется на VERSION_REFRESH_INTERVAL секунд, чтобы не
+        ходить в Qdrant на каждый запрос.
+        """
+        now = time.monotonic()
+        if self.is_connected and now - self._version_checked_at >= self.VERSION_REFRESH_INTERVAL:
+            self._version_checked_at = now
+            try:
+                for alias in self.connection.call(lambda client: client.get_aliases()).aliases:
+                    if alias.alias_name == self.collection_name:
+                        self._collection_version = alias.collection_name
+                        break
+                else:
+                    self._collection_version = self.collection_name
+            except Exception as e:
+                logger.warning(f"[Qdrant] Не удалось прочитать алиасы: {e}")
+        return self._collection_version
 
-    def _extract_text_from_payload(self, payload):
+    def embed_query(self, query: str) -> np.ndarray:
+        """Эмбеддинг запроса с кэшированием по нормализованному тексту"""
+        return self.embedding_cache.get_or_compute(query, self.embedder.encode)
+
+    def embedding_cache_stats(self):
+        """Попадания и промахи кэша эмбеддингов"""
+        return self.embedding_cache.stats()
+
+    def embedding_service_stats(self):
+        """Гистограммы размеров пачек и ожидания в очереди сервиса эмбеддингов"""
+        return self.embedder.stats()
+
+    @staticmethod
+    def has_context(context: str) -> bool:
+        """Найден ли контекст в базе знаний (а не сообщение об ошибке или пустом результате)"""
+        return bool(context) and context not in NO_CONTEXT_MESSAGES
+
+    @classmethod
+    def build_context(cls, search_result):
+        """Собрать контекст для LLM из найденных точек"""
+        context_parts = []
+        for i, hit in enumerate(search_result):
+            logger.info(f"[Qdrant] Результат {i}: score={hit.score:.3f}")
+            logger.debug(f"[Qdrant] Ключи payload: {list(hit.payload.keys())}")
+            
+            # Пытаемся найти текстовое содержимое
+            text_content = cls._extract_text_from_payload(hit.payload)
+            
+            if text_content:
+                context_parts.append(text_content)
+                logger.debug(f"  Текст: {text_content[:80]}...")
+            else:
+                logger.debug(f"  Подходящий текст не найден в payload")
+        
+        context = "\n".join(context_parts)
+        if not context:
+            context = NOTHING_FOUND
+        
+        logger.info(f"[Qdrant] Итоговый контекст: {len(context)} символов")
+        return context
+
+    @staticmethod
+    def _extract_text_from_payload(payload):
         """Извлекает текст из payload разными способами"""
         # Способ 1: Если есть поле "text"
         if "text" in payload:
@@ -107,13 +269,16 @@ class QdrantManager:
         return None
 
     def check_connection(self):
-        """Проверка подключения к Qdrant"""
-        if self.is_connected:
-            try:
-                self.client.get_collections()
-                return True
-            except Exception:
-                self.is_connected = False
-                logger.error("[Qdrant] Соединение с Qdrant разорвано")
-                return False
-        return False
\ No newline at end of file
+        """Проверка подключения к Qdrant (с попыткой переподключиться)"""
+        if not self.connection.connect():
+            return False
+        try:
+            self.connection.call(lambda client: client.get_collections())
+            return True
+        except Exception:
+            logger.error("[Qdrant] Соединение с Qdrant разорвано")
+            return False
+
+    def connection_stats(self):
+        """Подключение к Qdrant: разрывы, переподключения, таймауты"""
+        return self.connection.stats()
@@ -0,0 +1,71 @@
+# quantization.py
+'''
+Квантование векторов коллекции Qdrant.
+
+Режимы:
+    none   - только float32 (4 байта на измерение в RAM)
+    int8   - скалярное квантование: 1 байт на измерение, потеря точности небольшая
+    binary - 1 бит на измерение; для маленьких моделей (384 измерения)
+             без oversampling заметно теряет полноту
+
+В режимах int8 / binary исходные float32 векторы хранятся на диске
+(on_disk), а в RAM - только квантованные. Поиск идет по квантованным
+векторам с запасом кандидатов (oversampling), после чего кандидаты
+переоцениваются по исходным векторам (rescore).
+'''
+
+from typing import Optional
+
+from qdrant_client.http import models
+
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# Запас кандидатов по умолчанию: бинарному квантованию нужно больше
+DEFAULT_OVERSAMPLING = {"none": 1.0, "int8": 2.0, "binary": 3.0}
+
+
+def quantization_config(mode: str):
+    """Параметр quantization_config для create_collection / update_collection"""
+    if mode == "none":
+        return None
+    if mode == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,  # отсечь выбросы при выборе диапазона
+                always_ram=True,
+            )
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Неизвестный режим квантования: {mode} (допустимы: {', '.join(QUANTIZATION_MODES)})")
+
+
+def search_params(oversampling: Optional[float] = None, rescore: bool = True,
+                  hnsw_ef: Optional[int] = None, exact: bool = False) -> models.SearchParams:
+    """
+    Параметры поиска. Для коллекции без квантования параметры
+    quantization Qdrant игнорирует, поэтому их можно передавать всегда.
+    """
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef,
+        exact=exact,
+        quantization=models.QuantizationSearchParams(
+            ignore=False,
+            rescore=rescore,
+            oversampling=oversampling,
+        ),
+    )
+
+
+def vector_memory_bytes(mode: str, count: int, dim: int) -> int:
+    """Оценка памяти под векторы в RAM (без графа HNSW и payload)"""
+    if mode == "none":
+        return count * dim * 4
+    if mode == "int8":
+        # + float32 поправка на вектор
+        return count * (dim + 4)
+    if mode == "binary":
+        return count * ((dim + 7) // 8)
+    raise ValueError(f"Неизвестный режим квантования: {mode}")
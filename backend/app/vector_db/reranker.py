@@ -0,0 +1,192 @@
+# reranker.py
+'''
+Переранжирование кандидатов поиска кросс-энкодером.
+
+Поиск берет с запасом candidates кандидатов, кросс-энкодер оценивает все
+пары (запрос, чанк) одним пакетным вызовом на CPU, и в контекст идут
+top_k лучших по его оценке. Оценки кэшируются по (запрос, ID чанка).
+
+Бюджет задержки (budget_ms) на запрос:
+- модель одна на процесс, поэтому вызовы идут по очереди; если очередь
+  не освободилась в пределах бюджета, этап пропускается;
+- по скользящему среднему времени на пару число кандидатов урезается
+  так, чтобы оценка уложилась в оставшийся бюджет;
+- если уложиться можно меньше чем в min_candidates пар, этап пропускается.
+При пропуске остается порядок векторного поиска. Пока модель не
+загружена (загрузка идет в фоне с первого запроса), этап тоже пропускается.
+'''
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from vector_db.embedding_service import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+def _payload_text(hit) -> str:
+    return str((hit.payload or {}).get("text", ""))
+
+
+class CrossEncoderReranker:
+    """Пакетный кросс-энкодер с кэшем оценок и бюджетом задержки"""
+
+    # Многоязычная модель (в том числе русский), обученная на mMARCO
+    DEFAULT_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        batch_size: int = 32,
+        budget_ms: float = 150.0,
+        min_candidates: int = 5,
+        cache_size: int = 10000,
+        text_getter: Callable[[Any], str] = _payload_text,
+        model=None,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.min_candidates = min_candidates
+        self.cache_size = cache_size
+        self.text_getter = text_getter
+        self._model = model
+
+        self._model_lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Скользящее среднее времени оценки одной пары (мс); до первого вызова - консервативно
+        self._pair_ms = 5.0
+
+        self._latency = Histogram([5, 10, 25, 50, 100, 150, 250, 500, 1000])
+        self._counters = {
+            "requests": 0, "reranked": 0, "shrunk": 0, "skipped_queue": 0, "skipped_budget": 0,
+            "pairs_scored": 0, "cache_hits": 0, "skipped_loading": 0,
+        }
+        self._loading: Optional[threading.Thread] = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            # Одна копия модели на процесс (и общая с родителем при предзагрузке)
+            from vector_db.model_registry import get_cross_encoder
+            self._model = get_cross_encoder(self.model_name)
+        return self._model
+
+    def _load_in_background(self):
+        with self._cache_lock:
+            if self._loading is None:
+                self._loading = threading.Thread(target=self.warm_up, name="RerankerLoad", daemon=True)
+                self._loading.start()
+
+    def warm_up(self):
+        """Загрузить модель и замерить время пары до первого запроса"""
+        with self._model_lock:
+            self._score("проверка", [("warmup", "проверка")])
+
+    def clear(self):
+        """Сбросить кэш оценок (после изменения текстов чанков)"""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def rerank(self, query: str, hits: List[Any], top_k: int, budget_ms: Optional[float] = None) -> List[Any]:
+        """
+        Переупорядочить hits (объекты с id и payload) и вернуть top_k.
+
+        Кандидаты, не попавшие в урезанный набор, идут после оцененных
+        в исходном порядке.
+        """
+        started = time.perf_counter()
+        budget_ms = self.budget_ms if budget_ms is None else budget_ms
+        self._count("requests")
+        if len(hits) <= 1:
+            return hits[:top_k]
+
+        key = " ".join(query.lower().split())
+        scores: Dict[str, float] = {}
+        with self._cache_lock:
+            for hit in hits:
+                cached = self._cache.get((key, str(hit.id)))
+                if cached is not None:
+                    self._cache.move_to_end((key, str(hit.id)))
+                    scores[str(hit.id)] = cached
+        self._count("cache_hits", len(scores))
+        missing = [hit for hit in hits if str(hit.id) not in scores]
+
+        if missing and self._model is None:
+            # Модель могла быть предзагружена в реестр (model_registry.preload)
+            from vector_db.model_registry import cross_encoder_key, get_loaded
+            self._model = get_loaded(cross_encoder_key(self.model_name))
+        if missing and self._model is None:
+            self._load_in_background()
+            self._count("skipped_loading")
+            return hits[:top_k]
+
+        if missing:
+            # Модель занята другим запросом дольше, чем позволяет бюджет
+            if not self._model_lock.acquire(timeout=max(budget_ms, 0) / 1000):
+                self._count("skipped_queue")
+                return hits[:top_k]
+            try:
+                remaining_ms = budget_ms - (time.perf_counter() - started) * 1000
+                with self._cache_lock:
+                    pair_ms = self._pair_ms
+                affordable = int(remaining_ms / pair_ms)
+                if affordable < min(self.min_candidates, len(missing)):
+                    self._count("skipped_budget")
+                    return hits[:top_k]
+                if affordable < len(missing):
+                    self._count("shrunk")
+                    missing = missing[:affordable]
+
+                pairs = [(str(hit.id), self.text_getter(hit)) for hit in missing]
+                scores.update(self._score(query, pairs, key))
+            finally:
+                self._model_lock.release()
+
+        scored = sorted((hit for hit in hits if str(hit.id) in scores), key=lambda hit: scores[str(hit.id)], reverse=True)
+        rest = [hit for hit in hits if str(hit.id) not in scores]
+        self._count("reranked")
+        self._latency.observe((time.perf_counter() - started) * 1000)
+        return (scored + rest)[:top_k]
+
+    def _score(self, query: str, pairs, cache_key: Optional[str] = None) -> Dict[str, float]:
+        """Оценить пары (ID, текст) одним пакетным вызовом (под _model_lock)"""
+        model = self.model
+        started = time.perf_counter()
+        values = model.predict(
+            [(query, text) for _, text in pairs], batch_size=self.batch_size, show_progress_bar=False,
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        scores = {pid: float(value) for (pid, _), value in zip(pairs, values)}
+        with self._cache_lock:
+            self._pair_ms = 0.8 * self._pair_ms + 0.2 * (elapsed_ms / len(pairs))
+            self._counters["pairs_scored"] += len(pairs)
+            if cache_key is not None:
+                for pid, value in scores.items():
+                    self._cache[(cache_key, pid)] = value
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def _count(self, name: str, value: int = 1):
+        """Счетчики обновляются из потоков запросов - под _cache_lock"""
+        with self._cache_lock:
+            self._counters[name] += value
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cache_lock:
+            counters = dict(self._counters)
+            pair_ms = self._pair_ms
+            cache_entries = len(self._cache)
+        return {
+            **counters,
+            "pair_ms_avg": round(pair_ms, 3),
+            "cache_entries": cache_entries,
+            "latency_ms": self._latency.snapshot(),
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули приложения импортируются от папки app (как при запуске из нее)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("pydantic_settings")
+
+from core.config import EmbeddingSettings
+from scripts.embedding_parity import SAMPLE_TEXTS, neighbours
+from vector_db.embedding_backends import export_onnx, load_encoder
+
+
+MODEL_NAME = EmbeddingSettings().embedding_model
+
+
+@pytest.fixture(scope="module")
+def onnx_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("onnx"))
+    export_onnx(MODEL_NAME, path, quantize=True)
+    return path
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return np.asarray(load_encoder("torch", MODEL_NAME).encode(SAMPLE_TEXTS), dtype=np.float32)
+
+
+@pytest.mark.parametrize("backend, min_cosine", [("onnx", 0.999), ("onnx-int8", 0.98)])
+def test_onnx_matches_torch(onnx_dir, reference, backend, min_cosine):
+    encoder = load_encoder(backend, MODEL_NAME, onnx_dir=onnx_dir)
+    assert encoder.get_sentence_embedding_dimension() == reference.shape[1]
+
+    vectors = np.asarray(encoder.encode(SAMPLE_TEXTS), dtype=np.float32)
+    cosine = np.sum(vectors * reference, axis=1) / (
+        np.linalg.norm(vectors, axis=1) * np.linalg.norm(reference, axis=1)
+    )
+    assert cosine.min() >= min_cosine
+
+    overlap = np.mean([len(set(a) & set(b)) / 3 for a, b in zip(neighbours(vectors, 3), neighbours(reference, 3))])
+    assert overlap >= 0.9
+
+
+def test_single_text_matches_batch(onnx_dir):
+    encoder = load_encoder("onnx", MODEL_NAME, onnx_dir=onnx_dir)
+    batch = encoder.encode(SAMPLE_TEXTS)
+    single = encoder.encode(SAMPLE_TEXTS[3])
+    assert single.shape == batch[3].shape
+    assert np.allclose(single, batch[3], atol=1e-4)
@@ -0,0 +1,23 @@
+import threading
+
+from vector_db.embedding_service import Histogram
+
+
+def test_concurrent_observations_are_not_lost():
+    histogram = Histogram([1, 10, 100])
+    threads_count, per_thread = 8, 5000
+
+    def observe():
+        for i in range(per_thread):
+            histogram.observe(i % 200)
+
+    threads = [threading.Thread(target=observe) for _ in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == threads_count * per_thread
+    assert sum(snapshot["buckets"].values()) == threads_count * per_thread
+    assert snapshot["avg"] == round(sum(i % 200 for i in range(per_thread)) / per_thread, 3)
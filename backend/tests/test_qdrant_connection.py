@@ -0,0 +1,160 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from vector_db.qdrant_connection import QdrantConnection
+
+
+class FakeQdrant:
+    """Клиент Qdrant в памяти: можно "выключить" сервер и замедлить ответы"""
+
+    def __init__(self):
+        self.down = False
+        self.delay = 0.0
+        self.calls = 0
+
+    def _request(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionRefusedError("connection refused")
+        time.sleep(self.delay)
+
+    def get_collections(self):
+        self._request()
+        return SimpleNamespace(collections=[SimpleNamespace(name="test_db1")])
+
+    def search(self, **kwargs):
+        self._request()
+        return ["hit"]
+
+
+class RequestError(Exception):
+    pass
+
+
+def make_connection(server, **kwargs):
+    kwargs.setdefault("timeout", 0.5)
+    kwargs.setdefault("backoff_initial", 0.05)
+    kwargs.setdefault("backoff_max", 0.2)
+    kwargs.setdefault("failure_threshold", 2)
+    return QdrantConnection(lambda: server, **kwargs)
+
+
+def wait_connected(connection, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not connection.is_connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return connection.is_connected
+
+
+def search(connection, **kwargs):
+    return connection.call(lambda client: client.search(), **kwargs)
+
+
+def test_connects_in_background_after_qdrant_starts_late():
+    server = FakeQdrant()
+    server.down = True
+    connection = make_connection(server)
+
+    assert not connection.connect()
+    with pytest.raises(ConnectionError):
+        search(connection)
+
+    server.down = False
+    assert wait_connected(connection)
+    assert search(connection) == ["hit"]
+    connection.close()
+
+
+def test_breaker_opens_after_threshold_and_recovers():
+    server = FakeQdrant()
+    connection = make_connection(server)
+    assert connection.connect()
+
+    server.down = True
+    with pytest.raises(ConnectionError):
+        search(connection)
+    assert connection.is_connected  # одна ошибка - еще не обрыв
+    with pytest.raises(ConnectionError):
+        search(connection)
+    assert not connection.is_connected
+
+    # Пока подключения нет, вызовы не доходят до сервера
+    calls = server.calls
+    started = time.perf_counter()
+    with pytest.raises(ConnectionError):
+        search(connection)
+    assert time.perf_counter() - started < 0.01
+    assert server.calls - calls <= 1  # разве что фоновая проверка
+
+    server.down = False
+    assert wait_connected(connection)
+    assert search(connection) == ["hit"]
+    assert connection.stats()["reconnects"] == 1
+    connection.close()
+
+
+def test_timeouts_open_breaker():
+    server = FakeQdrant()
+    connection = make_connection(server, timeout=1.0)
+    assert connection.connect()
+
+    server.delay = 0.3
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        search(connection, timeout=0.05)
+    assert time.perf_counter() - started < 0.2
+    assert connection.is_connected
+    with pytest.raises(TimeoutError):
+        search(connection, timeout=0.05)
+    assert not connection.is_connected
+
+    started = time.perf_counter()
+    with pytest.raises(ConnectionError):
+        search(connection, timeout=0.05)
+    assert time.perf_counter() - started < 0.01
+    assert connection.stats()["timeouts"] >= 2
+
+    server.delay = 0.0
+    assert wait_connected(connection)
+    connection.close()
+
+
+def test_success_resets_failure_count():
+    server = FakeQdrant()
+    connection = make_connection(server)
+    assert connection.connect()
+
+    for _ in range(3):
+        server.down = True
+        with pytest.raises(ConnectionError):
+            search(connection)
+        server.down = False
+        assert search(connection) == ["hit"]
+    assert connection.is_connected
+
+
+def test_probe_backoff_grows_up_to_max():
+    server = FakeQdrant()
+    server.down = True
+    connection = make_connection(server, backoff_initial=0.01, backoff_max=0.04)
+    assert not connection.connect()
+    time.sleep(0.3)
+    assert connection._backoff == pytest.approx(0.04)
+    assert connection.stats()["probe_failures"] >= 3
+    connection.close()
+
+
+def test_request_errors_keep_connection():
+    server = FakeQdrant()
+    connection = make_connection(server, request_errors=(RequestError,))
+    assert connection.connect()
+
+    def bad_request(client):
+        raise RequestError("400 Bad Request")
+
+    for _ in range(3):
+        with pytest.raises(RequestError):
+            connection.call(bad_request)
+    assert connection.is_connected
@@ -0,0 +1,108 @@
+import csv
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("qdrant_client")
+pytest.importorskip("pandas")
+pytest.importorskip("pydantic_settings")
+
+from qdrant_client import QdrantClient
+
+from vector_db.qdrant_loader import QdrantLoader
+
+
+# Текст строки - ее значения через пробел, чанк - абзац. Второй абзац строки 2 -
+# почти дубликат строки 1: отличается только ключом "1 " в начале
+TEXT_X = ("как подать заявление на социальную стипендию в деканат факультета "
+          "через личный кабинет студента до конца текущего месяца")
+TEXT_X_NEAR = TEXT_X
+TEXT_R = "расписание зимней экзаменационной сессии публикуется на сайте университета за месяц до начала"
+TEXT_X_EDITED = "общежитие предоставляется иногородним студентам очной формы обучения по заявлению"
+
+
+class FakeEmbedder:
+    """Детерминированные векторы по хэшу текста вместо модели"""
+
+    DIM = 16
+
+    def __init__(self):
+        self.encoded = []
+        self.encoder = SimpleNamespace(get_sentence_embedding_dimension=lambda: self.DIM)
+
+    def encode_many(self, texts):
+        self.encoded.extend(texts)
+        vectors = [
+            np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:self.DIM], dtype=np.uint8)
+            for text in texts
+        ]
+        return np.asarray(vectors, dtype=np.float32) + 1.0
+
+
+def write_rows(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "text"])
+        writer.writerows(rows)
+
+
+def row_texts(loader, key):
+    """Тексты чанков строки в коллекции"""
+    points, _ = loader.client.scroll(loader.collection_name, limit=100, with_payload=True)
+    return sorted(p.payload["text"] for p in points if p.payload["id"] == key)
+
+
+@pytest.fixture
+def loader(tmp_path):
+    path = str(tmp_path / "kb.csv")
+    write_rows(path, [["1", TEXT_X], ["2", f"{TEXT_R}\n\n{TEXT_X_NEAR}"]])
+    loader = QdrantLoader("kb", path, key_column="id", embedder=FakeEmbedder(), fallback_path="")
+    loader.client = QdrantClient(location=":memory:")
+    # Чанк - абзац строки
+    loader._chunker = SimpleNamespace(split=lambda text: [part for part in text.split("\n\n") if part])
+    return loader
+
+
+def test_unchanged_row_keeps_deduplicated_text_after_duplicate_is_edited(loader):
+    stats = loader.reindex()
+    assert stats["added"] == 2 and stats["duplicate_chunks"] == 1
+    assert row_texts(loader, "2") == [f"2 {TEXT_R}"]
+
+    # Без изменений строка 2 не кодируется заново
+    stats = loader.reindex()
+    assert stats["skipped"] == 2 and stats["rechecked"] == 0
+
+    # Строку 1 изменили - отброшенный абзац строки 2 больше ничем не покрыт
+    write_rows(loader.import_data_name, [["1", TEXT_X_EDITED], ["2", f"{TEXT_R}\n\n{TEXT_X_NEAR}"]])
+    stats = loader.reindex()
+    assert stats["updated"] == 1 and stats["rechecked"] == 1
+    assert row_texts(loader, "1") == [f"1 {TEXT_X_EDITED}"]
+    assert row_texts(loader, "2") == sorted([f"2 {TEXT_R}", TEXT_X_NEAR])
+
+    # Строка 2 больше ничего не теряет - следующий запуск ее не трогает
+    stats = loader.reindex()
+    assert stats["skipped"] == 2 and stats["rechecked"] == 0
+
+
+def test_unchanged_row_keeps_deduplicated_text_after_duplicate_is_deleted(loader):
+    loader.reindex()
+
+    write_rows(loader.import_data_name, [["2", f"{TEXT_R}\n\n{TEXT_X_NEAR}"]])
+    stats = loader.reindex()
+    assert stats["deleted"] == 1 and stats["rechecked"] == 1
+    assert row_texts(loader, "1") == []
+    assert row_texts(loader, "2") == sorted([f"2 {TEXT_R}", TEXT_X_NEAR])
+
+
+def test_removed_fully_deduplicated_row_is_not_counted_as_deleted(loader):
+    # Строка 3 целиком дубликат строки 1 - точек у нее нет
+    write_rows(loader.import_data_name, [["1", TEXT_X], ["3", TEXT_X]])
+    stats = loader.reindex()
+    assert stats["added"] == 2 and row_texts(loader, "3") == []
+
+    write_rows(loader.import_data_name, [["1", TEXT_X]])
+    stats = loader.reindex()
+    assert stats["deleted"] == 0 and stats["deduped_pruned"] == 1 and stats["rechecked"] == 0
+    assert row_texts(loader, "1") == [f"1 {TEXT_X}"]